@@ -0,0 +1,223 @@
+# Name:         batch.py
+# Purpose:      Parallel processing of many files with Nansat
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Reprojection of many files onto one Domain in a pool of worker processes
+
+GDAL datasets and files in /vsimem cannot be passed between processes. Therefore the
+destination Domain is serialized once into a dict with plain Python/NumPy values and
+re-created in each worker when the worker starts. Each worker opens, reprojects, exports and
+closes one file at a time, so at most <workers> files are in memory at once. Workers are
+started with 'spawn' (if available) to avoid sharing GDAL state with the parent after fork.
+
+Examples
+--------
+    >>> from nansat.batch import reproject_many
+    >>> def report(result):
+    ...     print(result['filename'], result['error'] or 'OK')
+    >>> results = reproject_many(files, arctic_domain, ['sigma0_HH', 'sigma0_HV'],
+    ...                          workers=8, out_dir='/data/arctic', callback=report)
+
+"""
+from __future__ import absolute_import, print_function
+
+import multiprocessing
+import os
+import time
+import traceback
+
+from nansat.domain import Domain
+from nansat.nansat import Nansat
+from nansat.tools import gdal
+from nansat.vrt import VRT
+
+FORMATS = {
+    'netCDF': '.nc',
+    'GTiff': '.tif',
+}
+
+# destination Domain and parameters of processing in a worker process
+_worker_params = {}
+
+
+def serialize_domain(domain):
+    """Convert Domain into dict with values which can be pickled
+
+    Parameters
+    ----------
+    domain : Domain
+        Domain with geotransform, GCPs or geolocation arrays
+
+    Returns
+    -------
+    data : dict
+        'x_size', 'y_size', 'geo_transform', 'projection', 'gcps', 'gcp_projection' and
+        'lon', 'lat' (geolocation grids, only if the domain has geolocation arrays)
+
+    """
+    dataset = domain.vrt.dataset
+    data = {
+        'x_size': dataset.RasterXSize,
+        'y_size': dataset.RasterYSize,
+        'geo_transform': dataset.GetGeoTransform(),
+        'projection': dataset.GetProjection(),
+        'gcps': [(gcp.GCPPixel, gcp.GCPLine, gcp.GCPX, gcp.GCPY, gcp.GCPZ)
+                 for gcp in dataset.GetGCPs()],
+        'gcp_projection': dataset.GetGCPProjection(),
+    }
+    if domain.vrt.geolocation is not None and len(domain.vrt.geolocation.data) > 0:
+        data['lon'], data['lat'] = domain.get_geolocation_grids()
+    return data
+
+
+def deserialize_domain(data):
+    """Create Domain from dict created by serialize_domain"""
+    if 'lon' in data:
+        return Domain.from_lonlat(data['lon'], data['lat'], add_gcps=len(data['gcps']) > 0)
+    gcps = [gdal.GCP(x, y, z, pixel, line) for pixel, line, x, y, z in data['gcps']]
+    vrt = VRT.from_dataset_params(data['x_size'], data['y_size'], data['geo_transform'],
+                                  data['projection'], gcps, data['gcp_projection'])
+    return Domain(ds=vrt.dataset)
+
+
+def get_output_filename(filename, out_dir, format='netCDF'):
+    """Return name of output file in <out_dir> with extension of <format>"""
+    basename = os.path.splitext(os.path.basename(filename.rstrip('/')))[0]
+    return os.path.join(out_dir, basename + FORMATS.get(format, '.' + format.lower()))
+
+
+def _init_worker(domain_data, params):
+    """Create destination Domain in the worker process (once per worker)"""
+    _worker_params.clear()
+    _worker_params.update(params)
+    _worker_params['domain'] = deserialize_domain(domain_data)
+
+
+def _reproject_file(task):
+    """Open, reproject and export one file in worker process and return result dict
+
+    Parameters
+    ----------
+    task : tuple
+        name of input file and name of output file
+
+    """
+    filename, output = task
+    params = _worker_params
+    result = {'filename': filename, 'output': None, 'error': None, 'time': None,
+              'pid': os.getpid()}
+    t0 = time.time()
+    try:
+        with Nansat(filename, **params['open_kwargs']) as n:
+            n.reproject(params['domain'], **params['reproject_kwargs'])
+            n.export(output, bands=params['bands'], driver=params['format'],
+                     **params['export_kwargs'])
+        result['output'] = output
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['time'] = time.time() - t0
+    return result
+
+
+def _get_pool(workers, max_tasks_per_worker, initargs):
+    """Create pool of worker processes started with 'spawn' (if available)"""
+    kwargs = dict(processes=workers, initializer=_init_worker, initargs=initargs,
+                  maxtasksperchild=max_tasks_per_worker)
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('spawn').Pool(**kwargs)
+    return multiprocessing.Pool(**kwargs)
+
+
+def reproject_many(files, dst_domain, bands=None, workers=None, out_dir='.', format='netCDF',
+                   callback=None, max_tasks_per_worker=20, open_kwargs=None,
+                   reproject_kwargs=None, export_kwargs=None):
+    """Reproject many files onto one Domain and export them in parallel
+
+    Parameters
+    ----------
+    files : list of str
+        names of input files
+    dst_domain : Domain
+        destination Domain (serialized once and sent to each worker)
+    bands : list of int or str
+        numbers or names of bands to export. If None, all bands are exported.
+    workers : int
+        number of worker processes (default: number of CPUs). If 1, files are processed
+        in the current process.
+    out_dir : str
+        directory for output files (name of input file with extension of <format>). Input
+        files must have different names (without extension).
+    format : str
+        GDAL driver used for export ('netCDF' or 'GTiff')
+    callback : callable
+        function called in the main process with result dict of each file as soon as the
+        file is processed (e.g. for reporting progress)
+    max_tasks_per_worker : int
+        number of files processed by a worker before it is replaced by a new process
+        (releases memory kept by GDAL)
+    open_kwargs, reproject_kwargs, export_kwargs : dict
+        keyword arguments for Nansat(), Nansat.reproject() and Nansat.export()
+
+    Returns
+    -------
+    results : list of dict
+        results in the order of <files>. Each dict has keys 'filename', 'output' (name of
+        output file or None), 'error' (traceback or None), 'time' (seconds), 'pid'
+
+    Raises
+    ------
+    ValueError
+        if <files> has duplicates or if several files have the same output filename
+
+    """
+    outputs = [get_output_filename(filename, out_dir, format) for filename in files]
+    if len(set(files)) < len(files):
+        raise ValueError('Input files are not unique')
+    if len(set(outputs)) < len(outputs):
+        raise ValueError('Several input files have the same output filename in %s' % out_dir)
+    tasks = list(zip(files, outputs))
+
+    params = {
+        'bands': bands,
+        'out_dir': out_dir,
+        'format': format,
+        'open_kwargs': open_kwargs or {},
+        'reproject_kwargs': reproject_kwargs or {},
+        'export_kwargs': export_kwargs or {},
+    }
+    domain_data = serialize_domain(dst_domain)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    results = {}
+    if workers == 1:
+        _init_worker(domain_data, params)
+        result_iterator = (_reproject_file(task) for task in tasks)
+        pool = None
+    else:
+        pool = _get_pool(workers, max_tasks_per_worker, (domain_data, params))
+        result_iterator = pool.imap_unordered(_reproject_file, tasks)
+
+    try:
+        for result in result_iterator:
+            results[result['filename']] = result
+            if callback is not None:
+                callback(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        else:
+            _worker_params.clear()
+
+    return [results[filename] for filename in files]
@@ -0,0 +1,238 @@
+# Name:         config.py
+# Purpose:      Scoped GDAL performance settings
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Performance settings of GDAL applied to a block of code
+
+Settings are applied when a block is entered and the previous values are restored when it is
+left. GDAL configuration options are set for the current thread only (if GDAL supports
+thread-local options), so settings do not leak between tasks running in the same worker.
+Settings of nested blocks are combined (inner block has priority).
+
+Settings
+--------
+cache_mb : int
+    size of GDAL block cache in MB (gdal.SetCacheMax, the cache is shared by all threads)
+threads : int or str
+    number of threads for GDAL (GDAL_NUM_THREADS and warping), e.g. 4 or 'ALL_CPUS'
+warp_memory_mb : int
+    memory limit for warping in MB (WarpMemoryLimit of warped VRTs)
+grid_cache_mb : int
+    size of the cache of geolocation grids in MB (see Domain.get_geolocation_grids)
+vsi_cache : bool
+    cache reads of files in VSI (VSI_CACHE)
+vsi_cache_mb : int
+    size of the VSI cache in MB per file (VSI_CACHE_SIZE)
+disable_readdir : bool
+    do not list directory of opened files (GDAL_DISABLE_READDIR_ON_OPEN)
+
+Examples
+--------
+    >>> from nansat import Nansat, performance
+    >>> with performance('throughput', cache_mb=2048):
+    ...     n = Nansat(filename)
+    ...     n.reproject(domain)
+    ...     n.export(netcdf_filename)
+
+    >>> n.export(netcdf_filename, performance='low-memory')
+
+"""
+from __future__ import absolute_import
+
+import threading
+
+from nansat.tools import gdal
+
+PROFILES = {
+    'default': {},
+    'low-memory': {
+        'cache_mb': 64,
+        'threads': 1,
+        'warp_memory_mb': 64,
+        'grid_cache_mb': 16,
+        'vsi_cache': False,
+    },
+    'throughput': {
+        'cache_mb': 1024,
+        'threads': 'ALL_CPUS',
+        'warp_memory_mb': 512,
+        'vsi_cache': True,
+        'vsi_cache_mb': 25,
+        'disable_readdir': True,
+    },
+}
+
+# names of GDAL configuration options and functions converting values of settings
+CONFIG_OPTIONS = {
+    'threads': ('GDAL_NUM_THREADS', str),
+    'vsi_cache': ('VSI_CACHE', lambda value: 'TRUE' if value else 'FALSE'),
+    'vsi_cache_mb': ('VSI_CACHE_SIZE', lambda value: str(int(value * 1024**2))),
+    'disable_readdir': ('GDAL_DISABLE_READDIR_ON_OPEN',
+                        lambda value: 'EMPTY_DIR' if value else 'FALSE'),
+}
+SETTINGS = ['cache_mb', 'warp_memory_mb', 'grid_cache_mb'] + sorted(CONFIG_OPTIONS)
+# settings written into warped VRTs (warping is done later, when data is read)
+WARP_SETTINGS = ['threads', 'warp_memory_mb']
+
+_local = threading.local()
+
+
+def _get_stack():
+    """Return stack of settings of the current thread"""
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _get_config_option(name):
+    """Get GDAL configuration option of the current thread (or None)"""
+    if hasattr(gdal, 'GetThreadLocalConfigOption'):
+        return gdal.GetThreadLocalConfigOption(str(name), None)
+    return gdal.GetConfigOption(str(name), None)
+
+
+def _set_config_option(name, value):
+    """Set GDAL configuration option for the current thread (unset if value is None)"""
+    if hasattr(gdal, 'SetThreadLocalConfigOption'):
+        gdal.SetThreadLocalConfigOption(str(name), value if value is None else str(value))
+    else:
+        gdal.SetConfigOption(str(name), value if value is None else str(value))
+
+
+def get_setting(name, default=None):
+    """Return value of a setting in the current thread (or <default> if it is not set)
+
+    Parameters
+    ----------
+    name : str
+        name of the setting (e.g. 'threads', 'warp_memory_mb')
+    default
+        value returned if the setting is not given in any active block
+
+    """
+    for settings in reversed(_get_stack()):
+        if name in settings:
+            return settings[name]
+    return default
+
+
+def get_settings():
+    """Return dict with all settings active in the current thread"""
+    settings = {}
+    for block_settings in _get_stack():
+        settings.update(block_settings)
+    return settings
+
+
+def get_warp_settings(arg):
+    """Return settings written into warped VRTs from value of argument <performance>
+
+    Warping is done when data is read from a warped VRT, after the method creating it has
+    returned. Therefore only WARP_SETTINGS can be applied per call. Other settings must be
+    active when data is read (e.g. with performance(...) around reading or export).
+
+    Parameters
+    ----------
+    arg : None, str, dict or performance
+        no settings, name of profile (only WARP_SETTINGS of the profile are used), dict
+        with settings or performance object (only WARP_SETTINGS are accepted)
+
+    Returns
+    -------
+    settings : dict
+        values of WARP_SETTINGS given in <arg>
+
+    """
+    settings = performance.from_arg(arg).settings
+    if not isinstance(arg, str):
+        other_settings = sorted(set(settings) - set(WARP_SETTINGS))
+        if other_settings:
+            raise ValueError('Settings %s have no effect on warping done when data is read. '
+                             'Use only %s or apply other settings with '
+                             'nansat.config.performance when reading data' %
+                             (other_settings, WARP_SETTINGS))
+    return dict([(name, settings[name]) for name in WARP_SETTINGS if name in settings])
+
+
+class performance(object):
+    """Context manager which applies GDAL performance settings to a block of code
+
+    Parameters
+    ----------
+    profile : str
+        name of the profile in PROFILES ('default', 'low-memory', 'throughput')
+    **settings : dict
+        individual settings (see module docstring). Override settings of the profile.
+
+    Examples
+    --------
+        >>> with performance('low-memory', threads=2):
+        ...     n = Nansat(filename)
+        ...     n.reproject(domain)
+
+    """
+    def __init__(self, profile=None, **settings):
+        if profile is not None and profile not in PROFILES:
+            raise ValueError('Unknown performance profile %s. Use one of %s' %
+                             (profile, sorted(PROFILES)))
+        unknown_settings = sorted(set(settings) - set(SETTINGS))
+        if unknown_settings:
+            raise ValueError('Unknown performance settings %s. Use %s' %
+                             (unknown_settings, SETTINGS))
+        self.settings = dict(PROFILES.get(profile, {}))
+        self.settings.update(settings)
+        self._saved = []
+
+    @classmethod
+    def from_arg(cls, arg):
+        """Create performance object from value of argument <performance> of Nansat methods
+
+        Parameters
+        ----------
+        arg : None, str, dict or performance
+            no settings, name of profile, dict with settings or performance object
+
+        """
+        if isinstance(arg, cls):
+            return arg
+        if arg is None:
+            return cls()
+        if isinstance(arg, dict):
+            return cls(**arg)
+        return cls(arg)
+
+    def __enter__(self):
+        saved = {'cache_max': None, 'options': {}}
+        if 'cache_mb' in self.settings:
+            saved['cache_max'] = gdal.GetCacheMax()
+            gdal.SetCacheMax(int(self.settings['cache_mb'] * 1024**2))
+        for name in self.settings:
+            if name in CONFIG_OPTIONS:
+                option, convert = CONFIG_OPTIONS[name]
+                saved['options'][option] = _get_config_option(option)
+                _set_config_option(option, convert(self.settings[name]))
+        self._saved.append(saved)
+        _get_stack().append(self.settings)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _get_stack().pop()
+        saved = self._saved.pop()
+        for option, value in saved['options'].items():
+            _set_config_option(option, value)
+        if saved['cache_max'] is not None:
+            gdal.SetCacheMax(saved['cache_max'])
+
+    def __repr__(self):
+        return 'performance(%s)' % ', '.join(['%s=%r' % (key, self.settings[key])
+                                               for key in sorted(self.settings)])
@@ -17,17 +17,68 @@
 from __future__ import division, absolute_import
 
 import re
+import threading
 import warnings
+from collections import OrderedDict
 from xml.etree.ElementTree import ElementTree
 
 import numpy as np
 
+from nansat import config
 from nansat.tools import add_logger, initial_bearing, haversine, gdal, osr, ogr
 from nansat.nsr import NSR
 from nansat.vrt import VRT
+from nansat.resampling import ResamplingIndex
 from nansat.exceptions import NansatProjectionError
 from nansat.warnings import NansatFutureWarning
 
+
+class _GridCache(object):
+    """LRU cache of geolocation grids limited by total size in bytes
+
+    Size limit is given by setting 'grid_cache_mb' of nansat.config.performance (or by
+    <max_mb>). Grids are stored and returned as copies, so modifying the returned arrays does
+    not modify the cache.
+
+    """
+    def __init__(self, max_mb=256):
+        self.max_mb = max_mb
+        self._grids = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return copies of cached grids (or None) and mark them as recently used"""
+        with self._lock:
+            grids = self._grids.pop(key, None)
+            if grids is None:
+                return None
+            self._grids[key] = grids
+        return tuple(grid.copy() for grid in grids)
+
+    def put(self, key, grids):
+        """Add copies of grids and remove least recently used grids exceeding the size limit"""
+        max_bytes = config.get_setting('grid_cache_mb', self.max_mb) * 1024**2
+        n_bytes = sum(grid.nbytes for grid in grids)
+        if n_bytes > max_bytes:
+            return
+        grids = tuple(grid.copy() for grid in grids)
+        with self._lock:
+            if key in self._grids:
+                self._n_bytes -= sum(grid.nbytes for grid in self._grids.pop(key))
+            self._grids[key] = grids
+            self._n_bytes += n_bytes
+            while self._n_bytes > max_bytes:
+                _, old_grids = self._grids.popitem(last=False)
+                self._n_bytes -= sum(grid.nbytes for grid in old_grids)
+
+    def clear(self):
+        """Remove all grids from the cache"""
+        with self._lock:
+            self._grids.clear()
+            self._n_bytes = 0
+
+
 class Domain(object):
     """Container for geographical reference of a raster
 
@@ -118,6 +169,8 @@ class Domain(object):
     xmlns:atom="http://www.w3.org/2005/Atom">
     {content}
     </kml>'''
+    # LRU cache of geolocation grids shared by all Domains
+    GRID_CACHE = _GridCache()
 
     # instance attributes
     vrt = None
@@ -204,6 +257,66 @@ class Domain(object):
         d.vrt = VRT.from_lonlat(lon, lat, add_gcps)
         return d
 
+    @classmethod
+    def from_tie_points(cls, lon, lat, pixel, line, x_size, y_size, add_gcps=True):
+        """Create Domain object from tie-point grids of longitude and latitude
+
+        Only the tie points are stored, full resolution geolocation grids are interpolated on
+        the sphere on demand (see VRT.from_tie_points).
+
+        Parameters
+        ----------
+        lon, lat : numpy.ndarray
+            2D grids with longitudes and latitudes of tie points
+        pixel, line : numpy.ndarray
+            1D vectors with pixel and line coordinates of columns and rows of tie points
+        x_size, y_size : int
+            size of the Domain
+        add_gcps : bool
+            Add GCPs from tie points.
+
+        Returns
+        -------
+            d : Domain
+
+        Examples
+        --------
+            >>> d = Domain.from_tie_points(lon, lat, [0, 500, 999], [0, 1000, 1999], 1000, 2000)
+            >>> lon_full, lat_full = d.get_geolocation_grids()
+
+        """
+        d = cls.__new__(cls)
+        d.vrt = VRT.from_tie_points(lon, lat, pixel, line, x_size, y_size, add_gcps)
+        return d
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Release all GDAL datasets and delete all VRT/RAW files of the object
+
+        Datasets of all VRT objects in the history (self.vrt, self.vrt.vrt, ...), VRTs with
+        band data and VRTs with geolocation are closed and their files in VSI memory (or
+        on disk) are deleted immediately. VRTs shared with other objects (e.g. geolocation
+        of the Domain used in Nansat.from_domain) are kept until all users are closed.
+        The object cannot be used after closing.
+
+        Examples
+        --------
+            >>> n = Nansat(filename)
+            >>> n.close()
+
+            >>> with Nansat(filename) as n:
+            ...     n.export(netcdf_filename)
+
+        """
+        if self.vrt is not None:
+            self.vrt.close()
+        self.vrt = None
+
     def __repr__(self):
         """Creates string with basic info about the Domain object
 
@@ -368,6 +481,9 @@ class Domain(object):
         If GEOLOCATION is present in the self.vrt.dataset then grids are read
         from the geolocation bands.
 
+        Grids are cached (see GRID_CACHE) for the current georeference of the Domain, step
+        size and destination SRS.
+
         Parameters
         -----------
         stepSize : int
@@ -380,26 +496,61 @@ class Domain(object):
         latitude : numpy array
             grid with latitudes
         """
+        key = (self.vrt._get_georeference_signature(), bool(self.vrt.tps), stepSize,
+               dstSRS.wkt)
+        grids = self.GRID_CACHE.get(key)
+        if grids is None:
+            grids = self._compute_geolocation_grids(stepSize, dstSRS)
+            # the cache keeps copies, so the computed grids can be returned
+            self.GRID_CACHE.put(key, grids)
+        return grids
+
+    def _compute_geolocation_grids(self, stepSize=1, dstSRS=NSR()):
+        """Get longitude and latitude grids (see get_geolocation_grids) without cache"""
         step_size = stepSize
         dst_srs = dstSRS
-        x_vec = list(range(0, self.vrt.dataset.RasterXSize, step_size))
-        y_vec = list(range(0, self.vrt.dataset.RasterYSize, step_size))
-        x_grid, y_grid = np.meshgrid(x_vec, y_vec)
+        x_vec = np.arange(0, self.vrt.dataset.RasterXSize, step_size)
+        y_vec = np.arange(0, self.vrt.dataset.RasterYSize, step_size)
 
         if self.vrt.geolocation is not None and len(self.vrt.geolocation.data) > 0:
             # if the vrt dataset has geolocationArray
-            # read lon,lat grids from geolocationArray
-            lon_grid, lat_grid = self.vrt.geolocation.get_geolocation_grids()
-            lon_arr, lat_arr = lon_grid[y_grid, x_grid], lat_grid[y_grid, x_grid]
+            # read every step_size-th line and pixel from geolocationArray
+            lon_arr, lat_arr = self.vrt.geolocation.get_geolocation_grids(
+                0, 0, self.vrt.dataset.RasterXSize, self.vrt.dataset.RasterYSize, step_size)
         else:
-            # generate lon,lat grids using GDAL Transformer
-            lon_vec, lat_vec = self.transform_points(x_grid.flatten(), y_grid.flatten(),
-                                                     dstSRS=dst_srs)
-            lon_arr = lon_vec.reshape(x_grid.shape)
-            lat_arr = lat_vec.reshape(x_grid.shape)
+            # generate lon,lat grids using geotransform or GDAL Transformer
+            x_grid, y_grid = np.meshgrid(x_vec, y_vec)
+            lon_vec, lat_vec = self.transform_points(x_grid, y_grid, dstSRS=dst_srs)
+            lon_arr = np.reshape(lon_vec, x_grid.shape)
+            lat_arr = np.reshape(lat_vec, x_grid.shape)
 
         return lon_arr, lat_arr
 
+    def _get_window_geolocation_grids(self, x_offset, y_offset, x_size, y_size):
+        """Get longitude and latitude grids for a window of the data grid
+
+        Parameters
+        -----------
+        x_offset, y_offset : int
+            pixel and line offset of the window
+        x_size, y_size : int
+            width and height of the window
+
+        Returns
+        --------
+        longitude : numpy array
+            grid with longitudes
+        latitude : numpy array
+            grid with latitudes
+
+        """
+        if self.vrt.geolocation is not None and len(self.vrt.geolocation.data) > 0:
+            return self.vrt.geolocation.get_geolocation_grids(x_offset, y_offset, x_size, y_size)
+
+        x_grid, y_grid = np.meshgrid(np.arange(x_offset, x_offset + x_size),
+                                     np.arange(y_offset, y_offset + y_size))
+        return self.transform_points(x_grid, y_grid)
+
     def _convert_extentDic(self, dstSRS, extentDic):
         """Convert -lle option (lat/lon) to -te (proper coordinate system)
 
@@ -590,13 +741,136 @@ class Domain(object):
     def get_border_geometry(self, *args, **kwargs):
         """ Get OGR Geometry of the border Polygon
 
+        The geometry is computed once for the current georeference of the Domain and a copy
+        of the cached geometry is returned by subsequent calls.
+
         Returns
         -------
         OGR Geometry, type Polygon
 
         """
+        key = ('geometry', args, tuple(sorted(kwargs.items())))
+        geometry = self._get_cached_footprint(
+            key, lambda: ogr.CreateGeometryFromWkt(self.get_border_wkt(*args, **kwargs)))
+        return geometry.Clone()
+
+    def _get_cached_footprint(self, key, function):
+        """Return value of <function> cached on self.vrt for the current georeference"""
+        signature = self.vrt._get_georeference_signature()
+        if self.vrt._footprints is None or self.vrt._footprints[0] != signature:
+            self.vrt._footprints = (signature, {})
+        cache = self.vrt._footprints[1]
+        if key not in cache:
+            cache[key] = function()
+        return cache[key]
+
+    def _get_footprint(self):
+        """Return cached footprint of the Domain: envelope and border polygon in lon/lat
+
+        Returns
+        -------
+        footprint : dict or None
+            'envelope' : (min_lon, max_lon, min_lat, max_lat)
+            'lon', 'lat' : border vectors (longitudes may exceed 180 if Domain crosses dateline)
+            'geometry' : OGR Polygon of the border or None if the Domain covers a pole
+                (or if the polygon is invalid)
+            None if the border cannot be computed
+
+        """
+        return self._get_cached_footprint(('footprint',), self._compute_footprint)
+
+    def _compute_footprint(self):
+        """Compute footprint of the Domain (see _get_footprint)"""
+        lon, lat = self.get_border()
+        return Domain._footprint_from_border(lon, lat)
+
+    @staticmethod
+    def _footprint_from_border(lon, lat):
+        """Create footprint dict ('lon', 'lat', 'envelope', 'geometry') from border vectors"""
+        lon, lat = np.array(lon, dtype=np.float64), np.array(lat, dtype=np.float64)
+        if not (np.all(np.isfinite(lon)) and np.all(np.isfinite(lat))):
+            return None
+        footprint = {'lon': lon, 'lat': lat}
+        footprint['envelope'], around_pole = Domain._envelope_from_border(lon, lat)
+        footprint['geometry'] = None
+        if not around_pole:
+            footprint['geometry'] = Domain._get_polygon(lon, lat)
+            if not footprint['geometry'].IsValid():
+                # self-intersecting border: compare envelopes only
+                footprint['geometry'] = None
+        return footprint
 
-        return ogr.CreateGeometryFromWkt(self.get_border_wkt(*args, **kwargs))
+    @staticmethod
+    def _envelope_from_border(lon, lat):
+        """Return envelope (min_lon, max_lon, min_lat, max_lat) of border vectors and
+        whether the border goes around a pole"""
+        # border around a pole makes full circle in longitude
+        lon_steps = (np.diff(np.append(lon, lon[0])) + 180) % 360 - 180
+        if abs(lon_steps.sum()) > 180:
+            if lat.mean() > 0:
+                return (-np.inf, np.inf, lat.min(), 90.), True
+            return (-np.inf, np.inf, -90., lat.max()), True
+        return (lon.min(), lon.max(), lat.min(), lat.max()), False
+
+    @staticmethod
+    def _get_envelope_shifts(envelope0, envelope1):
+        """Return longitude shifts of <envelope1> (0, -360, 360) at which envelopes intersect"""
+        lon_min0, lon_max0, lat_min0, lat_max0 = envelope0
+        lon_min1, lon_max1, lat_min1, lat_max1 = envelope1
+        if lat_min0 > lat_max1 or lat_min1 > lat_max0:
+            return []
+        return [shift for shift in [0, -360, 360]
+                if not (lon_min0 > lon_max1 + shift or lon_min1 + shift > lon_max0)]
+
+    @staticmethod
+    def _footprints_are_disjoint(footprint0, footprint1):
+        """Check if footprints (see _get_footprint) certainly do not intersect
+
+        Polygons are intersected only at shifts where envelopes intersect.
+
+        """
+        for shift in Domain._get_envelope_shifts(footprint0['envelope'],
+                                                 footprint1['envelope']):
+            if footprint0['geometry'] is None or footprint1['geometry'] is None:
+                return False
+            geometry1 = footprint1['geometry']
+            if shift != 0:
+                geometry1 = Domain._get_polygon(footprint1['lon'] + shift, footprint1['lat'])
+            if footprint0['geometry'].Intersects(geometry1):
+                return False
+        return True
+
+    @staticmethod
+    def _get_polygon(lon, lat):
+        """Create OGR Polygon from vectors of longitude and latitude"""
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in zip(lon, lat):
+            ring.AddPoint_2D(float(x), float(y))
+        ring.CloseRings()
+        polygon = ogr.Geometry(ogr.wkbPolygon)
+        polygon.AddGeometry(ring)
+        return polygon
+
+    def is_disjoint(self, anotherDomain):
+        """ Fast check if this Domain certainly does not intersect another Domain
+
+        Footprints (envelope and border polygon in lon/lat) are computed once per georeference
+        of each Domain and cached. Envelopes are compared first (also shifted by 360 degrees
+        to account for the dateline) and border polygons are intersected only if the envelopes
+        intersect. Domains covering a pole are compared by envelopes only.
+
+        Returns
+        -------
+        is_disjoint : bool
+            True if Domains do not intersect, False if they intersect (or if footprint of
+            any Domain cannot be computed)
+
+        """
+        footprint0 = self._get_footprint()
+        footprint1 = anotherDomain._get_footprint()
+        if footprint0 is None or footprint1 is None:
+            return False
+        return Domain._footprints_are_disjoint(footprint0, footprint1)
 
     def get_border_geojson(self, *args, **kwargs):
         """Create border of the Polygon in GeoJson format
@@ -707,12 +981,11 @@ class Domain(object):
         # Estimate pixel size in center of domain using haversine formula
         center_col = round(self.vrt.dataset.RasterXSize/2)
         center_row = round(self.vrt.dataset.RasterYSize/2)
-        lon00, lat00 = self.transform_points([center_col], [center_row])
-        lon01, lat01 = self.transform_points([center_col], [center_row + 1])
-        lon10, lat10 = self.transform_points([center_col + 1], [center_row])
+        lon, lat = self.transform_points([center_col, center_col, center_col + 1],
+                                         [center_row, center_row + 1, center_row])
 
-        delta_x = haversine(lon00, lat00, lon01, lat01)
-        delta_y = haversine(lon00, lat00, lon10, lat10)
+        delta_x = haversine(lon[:1], lat[:1], lon[1:2], lat[1:2])
+        delta_y = haversine(lon[:1], lat[:1], lon[2:], lat[2:])
         return delta_x[0], delta_y[0]
 
     @staticmethod
@@ -789,18 +1062,20 @@ class Domain(object):
 
         return resolution_x, resolution_y, raster_x_size, raster_y_size
 
-    def transform_points(self, colVector, rowVector, DstToSrc=0, dstSRS=NSR()):
+    def transform_points(self, colVector, rowVector, DstToSrc=0, dstSRS=NSR(), workers=1):
         """Transform given lists of X,Y coordinates into lon/lat or inverse
 
         Parameters
         -----------
-        colVector : lists
+        colVector : lists or numpy arrays
             X and Y coordinates in pixel/line or lon/lat  coordinate system
         DstToSrc : 0 or 1
             0 - forward transform (pix/line => lon/lat)
             1 - inverse transformation
         dstSRS : NSR
             destination spatial reference
+        workers : int
+            number of threads transforming large inputs (see VRT.transform_points)
 
         Returns
         --------
@@ -808,7 +1083,36 @@ class Domain(object):
             X and Y coordinates in lon/lat or pixel/line coordinate system
 
         """
-        return self.vrt.transform_points(colVector, rowVector, dst2src=DstToSrc, dst_srs=dstSRS)
+        return self.vrt.transform_points(colVector, rowVector, dst2src=DstToSrc, dst_srs=dstSRS,
+                                         workers=workers)
+
+    def build_resampling_index(self, src_domain, method='nearest'):
+        """Compute mapping of pixels of self to pixels of <src_domain> for repeated resampling
+
+        The GDAL transformer (GCPs, TPS, geolocation arrays or geotransform of <src_domain>)
+        is applied only once. The index can be saved into .npz file and applied to any
+        number of bands of objects with the same geometry as <src_domain>
+        (see Nansat.apply_resampling_index).
+
+        Parameters
+        ----------
+        src_domain : Domain or Nansat
+            source object (e.g. swath)
+        method : str
+            'nearest' or 'bilinear'
+
+        Returns
+        -------
+        index : ResamplingIndex
+
+        Examples
+        --------
+            >>> index = dst_domain.build_resampling_index(n, method='bilinear')
+            >>> index.save('index.npz')
+            >>> n_dst = n.apply_resampling_index(index)
+
+        """
+        return ResamplingIndex.build(src_domain.vrt, self.vrt, method)
 
     def azimuth_y(self, reductionFactor=1):
         """Calculate the angle of each pixel position vector with respect to
@@ -846,7 +1150,8 @@ class Domain(object):
             Numpy-like shape of Domain object (ySize, xSize)
 
         """
-        return self.vrt.dataset.RasterYSize, self.vrt.dataset.RasterXSize
+        dataset = self.vrt._dataset_readonly
+        return dataset.RasterYSize, dataset.RasterXSize
 
     def reproject_gcps(self, srs_string=''):
         """Reproject all GCPs to a new spatial reference system
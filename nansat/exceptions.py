@@ -24,6 +24,10 @@ class NansatGeolocationError(Exception):
     """ Exception if geolocation is wrong (e.g., all lat/lon values are 0) """
     pass
 
+class NansatDisjointError(ValueError):
+    """ Exception if source and destination domains do not overlap """
+    pass
+
 class NansatMissingProjectionError(Exception):
     """ Exception raised if no (sub-) dataset has projection """
 
@@ -24,6 +24,7 @@ import numpy as np
 
 from netCDF4 import Dataset
 
+from nansat import config
 from nansat.vrt import VRT
 from nansat.node import Node
 
@@ -39,7 +40,7 @@ class Exporter(object):
                                 'time', '_FillValue', 'type', 'scale', 'offset']
 
     def export(self, filename='', bands=None, rm_metadata=None, add_geolocation=True,
-               driver='netCDF', options=None, hardcopy=False):
+               driver='netCDF', options=None, hardcopy=False, performance=None):
         """Export Nansat object into netCDF or GTiff file
 
         Parameters
@@ -62,6 +63,9 @@ class Exporter(object):
             See also http://www.gdal.org/frmt_netcdf.html
         hardcopy : bool
             Evaluate all bands just before export?
+        performance : str or dict
+            name of profile or dict with GDAL performance settings applied while data is
+            written (see nansat.config.performance)
 
         Modifies
         ---------
@@ -88,6 +92,9 @@ class Exporter(object):
         # export all bands into a GeoTiff
         >>> n.export(driver='GTiff')
 
+        # export with a large GDAL cache and all CPUs
+        >>> n.export(netcdfile, performance='throughput')
+
         """
         if options is None:
             options = []
@@ -103,18 +110,20 @@ class Exporter(object):
         export_vrt.fix_band_metadata(rm_metadata)
         export_vrt.fix_global_metadata(rm_metadata)
 
-        # if output filename is the same as input one
-        if self.filename == filename or hardcopy:
-            export_vrt.hardcopy_bands()
+        with config.performance.from_arg(performance):
+            # if output filename is the same as input one
+            if self.filename == filename or hardcopy:
+                export_vrt.hardcopy_bands()
 
-        if driver == 'GTiff':
-            add_gcps = export_vrt.prepare_export_gtiff()
-        else:
-            add_gcps = export_vrt.prepare_export_netcdf()
+            if driver == 'GTiff':
+                add_gcps = export_vrt.prepare_export_gtiff()
+            else:
+                add_gcps = export_vrt.prepare_export_netcdf()
 
-        # Create output file using GDAL
-        dataset = gdal.GetDriverByName(driver).CreateCopy(filename, export_vrt.dataset, options=options)
-        del dataset
+            # Create output file using GDAL
+            dataset = gdal.GetDriverByName(driver).CreateCopy(filename, export_vrt.dataset,
+                                                              options=options)
+            del dataset
         # add GCPs into netCDF file as separate float variables
         if add_gcps:
             Exporter._add_gcps(filename, export_vrt.dataset.GetGCPs())
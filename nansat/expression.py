@@ -0,0 +1,394 @@
+# Name:         expression.py
+# Purpose:      Evaluation of band expressions
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+from __future__ import absolute_import, division
+
+import ast
+import operator
+
+import numpy as np
+
+
+class Expression(object):
+    """Compiled band expression
+
+    Bands in Nansat may have metadata 'expression', e.g.
+    'np.power(10., self["chlor_a_log"])', which is evaluated after reading
+    the band. The expression is parsed once, validated (only arithmetic,
+    comparisons, numpy functions from NUMPY_ALLOWED, constants, the band
+    itself ('band_data') and other bands ('self["name"]') are allowed) and
+    compiled into a tree of Python functions. Use Expression.get() to get a
+    cached instance.
+
+    During evaluation arrays which are created by the expression itself
+    (results of arithmetic operations) are reused for output of the next
+    operation. Therefore no full size temporary arrays are created for each
+    sub-expression. Input arrays (band_data and arrays returned by
+    self["name"]) are never modified.
+
+    Parameters
+    ----------
+    source : str
+        Python expression
+
+    Examples
+    --------
+        >>> expression = Expression.get('np.power(10., self["chlor_a_log"])')
+        >>> chlor_a = expression.evaluate(n)
+
+    """
+    NAMES = ['np', 'self', 'band_data']
+
+    # numpy functions, types and constants which are allowed in expressions (np.<name>)
+    NUMPY_ALLOWED = [
+        # constants and data types
+        'pi', 'e', 'nan', 'inf', 'newaxis',
+        'bool_', 'int8', 'int16', 'int32', 'int64', 'uint8', 'uint16', 'uint32', 'uint64',
+        'float16', 'float32', 'float64', 'complex64', 'complex128',
+        # element-wise functions
+        'abs', 'absolute', 'add', 'subtract', 'multiply', 'divide', 'true_divide',
+        'floor_divide', 'power', 'float_power', 'mod', 'fmod', 'remainder', 'negative',
+        'reciprocal', 'sqrt', 'cbrt', 'square', 'exp', 'exp2', 'expm1', 'log', 'log2', 'log10',
+        'log1p', 'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2', 'hypot', 'sinh',
+        'cosh', 'tanh', 'arcsinh', 'arccosh', 'arctanh', 'deg2rad', 'rad2deg', 'degrees',
+        'radians', 'floor', 'ceil', 'trunc', 'rint', 'round', 'around', 'sign', 'maximum',
+        'minimum', 'fmax', 'fmin', 'isnan', 'isinf', 'isfinite', 'logical_and', 'logical_or',
+        'logical_not', 'logical_xor', 'bitwise_and', 'bitwise_or', 'bitwise_xor', 'invert',
+        'left_shift', 'right_shift', 'greater', 'greater_equal', 'less', 'less_equal', 'equal',
+        'not_equal', 'real', 'imag', 'conj', 'conjugate', 'angle',
+        # array functions
+        'where', 'clip', 'nan_to_num', 'select', 'interp', 'polyval', 'array', 'asarray',
+        'zeros_like', 'ones_like', 'full_like', 'zeros', 'ones', 'full', 'arange', 'linspace',
+        'stack', 'dstack', 'hstack', 'vstack', 'concatenate', 'reshape', 'squeeze',
+        'expand_dims', 'transpose', 'flipud', 'fliplr', 'isclose', 'any', 'all', 'sum', 'mean',
+        'median', 'std', 'var', 'min', 'max', 'amin', 'amax', 'nanmin', 'nanmax', 'nanmean',
+        'nanmedian', 'nanstd', 'nansum', 'percentile', 'nanpercentile', 'digitize',
+        # masked arrays (see NUMPY_MA_ALLOWED)
+        'ma',
+    ]
+    # functions of numpy.ma which are allowed in expressions (np.ma.<name>)
+    NUMPY_MA_ALLOWED = ['masked_invalid', 'masked_where', 'masked_equal', 'masked_greater',
+                        'masked_less', 'masked_outside', 'masked_inside', 'masked_values',
+                        'array', 'filled', 'getmask', 'getdata', 'masked', 'nomask']
+
+    # attributes and methods of arrays which are allowed in expressions
+    ARRAY_ATTRIBUTES = ['T', 'real', 'imag', 'shape', 'dtype', 'size', 'ndim',
+                        'astype', 'clip', 'conj', 'copy', 'filled', 'max', 'mean', 'min',
+                        'reshape', 'round', 'squeeze', 'std', 'sum']
+
+    BINARY_OPERATORS = {
+        'Add': (np.add, operator.add),
+        'Sub': (np.subtract, operator.sub),
+        'Mult': (np.multiply, operator.mul),
+        'Div': (np.true_divide, operator.truediv),
+        'FloorDiv': (np.floor_divide, operator.floordiv),
+        'Mod': (np.mod, operator.mod),
+        'Pow': (np.power, operator.pow),
+        'BitAnd': (np.bitwise_and, operator.and_),
+        'BitOr': (np.bitwise_or, operator.or_),
+        'BitXor': (np.bitwise_xor, operator.xor),
+    }
+
+    UNARY_OPERATORS = {
+        'USub': (np.negative, operator.neg),
+        'UAdd': (None, operator.pos),
+        'Invert': (np.invert, operator.invert),
+        'Not': (None, operator.not_),
+    }
+
+    COMPARE_OPERATORS = {
+        'Eq': operator.eq,
+        'NotEq': operator.ne,
+        'Lt': operator.lt,
+        'LtE': operator.le,
+        'Gt': operator.gt,
+        'GtE': operator.ge,
+    }
+
+    # cache of compiled expressions
+    _cache = {}
+    CACHE_SIZE = 1000
+
+    @classmethod
+    def get(cls, source):
+        """Get compiled expression from cache or compile a new one
+
+        Parameters
+        ----------
+        source : str
+            Python expression
+
+        Returns
+        -------
+        expression : Expression
+
+        """
+        if source not in cls._cache:
+            if len(cls._cache) >= cls.CACHE_SIZE:
+                cls._cache.clear()
+            cls._cache[source] = cls(source)
+        return cls._cache[source]
+
+    def __init__(self, source):
+        self.source = source
+        self.bands = []
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError('Cannot parse expression %s: %s' % (source, e))
+        self._function = self._compile(tree.body)
+
+    def __repr__(self):
+        return 'Expression(%r)' % self.source
+
+    def evaluate(self, reader, band_data=None):
+        """Evaluate the expression
+
+        Parameters
+        ----------
+        reader : Nansat
+            object which returns arrays of other bands by reader[band_id] (they are not modified)
+        band_data : numpy.ndarray
+            data read from the band with the expression
+
+        Returns
+        -------
+        result : numpy.ndarray or scalar
+
+        """
+        return self._function({'np': np, 'self': reader, 'band_data': band_data})[0]
+
+    def _compile(self, node):
+        """Convert AST node into a function which takes namespace and returns
+        result and a flag showing if the result is a temporary array owned by
+        the expression (and can be overwritten)
+        """
+        node_type = type(node).__name__
+        compiler = getattr(self, '_compile_%s' % node_type, None)
+        if compiler is None:
+            raise ValueError('%s is not allowed in expression %s' % (node_type, self.source))
+        return compiler(node)
+
+    def _compile_Constant(self, node):
+        value = node.value
+        return lambda namespace: (value, False)
+
+    def _compile_Num(self, node):
+        value = node.n
+        return lambda namespace: (value, False)
+
+    def _compile_Str(self, node):
+        value = node.s
+        return lambda namespace: (value, False)
+
+    def _compile_NameConstant(self, node):
+        value = node.value
+        return lambda namespace: (value, False)
+
+    def _compile_Name(self, node):
+        name = node.id
+        if name in ['True', 'False', 'None']:
+            value = {'True': True, 'False': False, 'None': None}[name]
+            return lambda namespace: (value, False)
+        if name not in self.NAMES:
+            raise ValueError('Name %s is not allowed in expression %s' % (name, self.source))
+        return lambda namespace: (namespace[name], False)
+
+    def _compile_Attribute(self, node):
+        # attributes of numpy are resolved at compile time
+        value = self._get_numpy_attribute(node)
+        if value is not None:
+            return lambda namespace: (value, False)
+        if node.attr not in self.ARRAY_ATTRIBUTES:
+            raise ValueError('Attribute %s is not allowed in expression %s' %
+                             (node.attr, self.source))
+        get_value = self._compile(node.value)
+        attr = node.attr
+        return lambda namespace: (getattr(get_value(namespace)[0], attr), False)
+
+    def _get_numpy_attribute(self, node):
+        """Get numpy object for AST node like np.power or np.ma.masked_invalid (or None)"""
+        node_type = type(node).__name__
+        if node_type == 'Name':
+            return np if node.id == 'np' else None
+        if node_type != 'Attribute':
+            return None
+        parent = self._get_numpy_attribute(node.value)
+        if parent is None or type(parent) is not type(np):
+            return None
+        allowed = {np: self.NUMPY_ALLOWED, np.ma: self.NUMPY_MA_ALLOWED}.get(parent, [])
+        if node.attr not in allowed:
+            raise ValueError('Attribute %s is not allowed in expression %s' %
+                             (node.attr, self.source))
+        if not hasattr(parent, node.attr):
+            raise ValueError('%s has no attribute %s' % (parent.__name__, node.attr))
+        return getattr(parent, node.attr)
+
+    def _compile_Subscript(self, node):
+        get_value = self._compile(node.value)
+        get_index = self._compile(node.slice)
+        # other bands (self["band_name"]) may be cached or shared by the reader:
+        # they are not temporary and are not overwritten
+        if type(node.value).__name__ == 'Name' and node.value.id == 'self':
+            self.bands.append(get_index({})[0] if self._is_constant(node.slice) else None)
+
+        def subscript(namespace):
+            return get_value(namespace)[0][get_index(namespace)[0]], False
+        return subscript
+
+    def _compile_Index(self, node):
+        # Python < 3.9
+        return self._compile(node.value)
+
+    def _compile_Slice(self, node):
+        get_parts = [self._compile(part) if part is not None else (lambda namespace: (None, False))
+                     for part in [node.lower, node.upper, node.step]]
+        return lambda namespace: (slice(*[get(namespace)[0] for get in get_parts]), False)
+
+    def _compile_ExtSlice(self, node):
+        # Python < 3.9
+        get_dims = [self._compile(dim) for dim in node.dims]
+        return lambda namespace: (tuple([get(namespace)[0] for get in get_dims]), False)
+
+    def _compile_Tuple(self, node):
+        get_elts = [self._compile(elt) for elt in node.elts]
+        return lambda namespace: (tuple([get(namespace)[0] for get in get_elts]), False)
+
+    def _compile_List(self, node):
+        get_elts = [self._compile(elt) for elt in node.elts]
+        return lambda namespace: ([get(namespace)[0] for get in get_elts], False)
+
+    def _compile_BinOp(self, node):
+        op_name = type(node.op).__name__
+        if op_name not in self.BINARY_OPERATORS:
+            raise ValueError('Operator %s is not allowed in expression %s' % (op_name, self.source))
+        ufunc, py_operator = self.BINARY_OPERATORS[op_name]
+        get_left = self._compile(node.left)
+        get_right = self._compile(node.right)
+
+        def binop(namespace):
+            left, left_tmp = get_left(namespace)
+            right, right_tmp = get_right(namespace)
+            if not isinstance(left, np.ndarray) and not isinstance(right, np.ndarray):
+                return py_operator(left, right), False
+            return self._call_ufunc(ufunc, [left, right], [left_tmp, right_tmp])
+        return binop
+
+    def _compile_UnaryOp(self, node):
+        op_name = type(node.op).__name__
+        ufunc, py_operator = self.UNARY_OPERATORS[op_name]
+        get_operand = self._compile(node.operand)
+
+        def unaryop(namespace):
+            operand, operand_tmp = get_operand(namespace)
+            if ufunc is None or not isinstance(operand, np.ndarray):
+                return py_operator(operand), False
+            return self._call_ufunc(ufunc, [operand], [operand_tmp])
+        return unaryop
+
+    def _compile_Compare(self, node):
+        op_names = [type(op).__name__ for op in node.ops]
+        for op_name in op_names:
+            if op_name not in self.COMPARE_OPERATORS:
+                raise ValueError('Comparison %s is not allowed in expression %s' %
+                                 (op_name, self.source))
+        py_operators = [self.COMPARE_OPERATORS[op_name] for op_name in op_names]
+        get_operands = [self._compile(operand) for operand in [node.left] + node.comparators]
+
+        def compare(namespace):
+            operands = [get(namespace)[0] for get in get_operands]
+            result = py_operators[0](operands[0], operands[1])
+            for i, py_operator in enumerate(py_operators[1:]):
+                result = result & py_operator(operands[i + 1], operands[i + 2])
+            return result, isinstance(result, np.ndarray)
+        return compare
+
+    def _compile_BoolOp(self, node):
+        is_and = type(node.op).__name__ == 'And'
+        get_values = [self._compile(value) for value in node.values]
+
+        def boolop(namespace):
+            for get in get_values:
+                value = get(namespace)[0]
+                if bool(value) != is_and:
+                    return value, False
+            return value, False
+        return boolop
+
+    def _compile_IfExp(self, node):
+        get_test, get_body, get_orelse = [self._compile(part) for part in
+                                          [node.test, node.body, node.orelse]]
+
+        def ifexp(namespace):
+            if get_test(namespace)[0]:
+                return get_body(namespace)
+            return get_orelse(namespace)
+        return ifexp
+
+    def _compile_Call(self, node):
+        for arg_node in ['starargs', 'kwargs']:
+            # Python 2
+            if getattr(node, arg_node, None) is not None:
+                raise ValueError('*args and **kwargs are not allowed in expression %s' %
+                                 self.source)
+        get_func = self._compile(node.func)
+        get_args = [self._compile(arg) for arg in node.args]
+        keywords = []
+        for keyword in node.keywords:
+            if keyword.arg is None:
+                raise ValueError('**kwargs are not allowed in expression %s' % self.source)
+            keywords.append((keyword.arg, self._compile(keyword.value)))
+
+        def call(namespace):
+            func = get_func(namespace)[0]
+            args, args_tmp = [], []
+            for get in get_args:
+                arg, arg_tmp = get(namespace)
+                args.append(arg)
+                args_tmp.append(arg_tmp)
+            kwargs = dict([(key, get(namespace)[0]) for key, get in keywords])
+            if isinstance(func, np.ufunc) and len(kwargs) == 0 and len(args) == func.nin:
+                return self._call_ufunc(func, args, args_tmp)
+            return func(*args, **kwargs), False
+        return call
+
+    def _compile_Starred(self, node):
+        raise ValueError('*args are not allowed in expression %s' % self.source)
+
+    @staticmethod
+    def _is_constant(node):
+        """Check if AST node is a constant"""
+        node_type = type(node).__name__
+        if node_type == 'Index':
+            return Expression._is_constant(node.value)
+        return node_type in ['Constant', 'Num', 'Str', 'NameConstant']
+
+    @staticmethod
+    def _call_ufunc(ufunc, args, args_tmp):
+        """Call numpy ufunc and write result into one of temporary input arrays if possible
+
+        Only arrays created by the expression itself are temporary. Otherwise a new output
+        array is created.
+
+        """
+        if ufunc.nout == 1:
+            for arg, arg_tmp in zip(args, args_tmp):
+                if (arg_tmp and isinstance(arg, np.ndarray) and
+                        arg.dtype.char in np.typecodes['AllFloat'] and
+                        arg.dtype.char * ufunc.nin + '->' + arg.dtype.char in ufunc.types and
+                        np.result_type(*args) == arg.dtype and
+                        (len(args) == 1 or np.broadcast(*args).shape == arg.shape)):
+                    return ufunc(*args, out=arg), True
+        result = ufunc(*args)
+        return result, isinstance(result, np.ndarray)
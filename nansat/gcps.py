@@ -0,0 +1,176 @@
+# Name:         gcps.py
+# Purpose:      Error-driven selection of Ground Control Points
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Selection of the smallest subset of GCPs reproducing all GCPs within a pixel tolerance
+
+GDAL warps images with GCPs by a thin plate spline (TPS) or a polynomial fitted to the GCPs
+and maps destination coordinates to source pixel/line. Time of solving TPS grows with the cube
+of the number of GCPs. select_gcps() starts from a few GCPs spread over the image and greedily
+adds GCPs with the largest error of the fit until all GCPs are reproduced within the tolerance.
+
+Examples
+--------
+    >>> indices = select_gcps(pixel, line, lon, lat, tolerance=0.5, tps=True)
+
+"""
+from __future__ import absolute_import, division
+
+import numpy as np
+
+
+def _normalize(x, y):
+    """Center and scale coordinates (to improve conditioning of the fit)"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    scale = max(x.std(), y.std()) or 1.
+    return (x - x.mean()) / scale, (y - y.mean()) / scale
+
+
+def _tps_kernel(x0, y0, x1, y1):
+    """Radial basis of thin plate spline r^2 * log(r^2) between two sets of points"""
+    r2 = (x0[:, None] - x1[None, :]) ** 2 + (y0[:, None] - y1[None, :]) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kernel = r2 * np.log(r2)
+    kernel[r2 == 0] = 0
+    return kernel
+
+
+def _solve(matrix, values):
+    """Solve linear system (least squares if the matrix is singular)"""
+    try:
+        return np.linalg.solve(matrix, values)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(matrix, values, rcond=None)[0]
+
+
+def fit_tps(x, y, values, x_eval, y_eval):
+    """Fit thin plate spline to <values> at points <x>, <y> and evaluate at <x_eval>, <y_eval>
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        coordinates of control points (N)
+    values : numpy.ndarray
+        values at control points (N, M)
+    x_eval, y_eval : numpy.ndarray
+        coordinates of points for evaluation (K)
+
+    Returns
+    -------
+    values_eval : numpy.ndarray
+        (K, M)
+
+    """
+    n = len(x)
+    matrix = np.zeros((n + 3, n + 3))
+    matrix[:n, :n] = _tps_kernel(x, y, x, y)
+    matrix[:n, n:] = np.column_stack([np.ones(n), x, y])
+    matrix[n:, :n] = matrix[:n, n:].T
+    rhs = np.zeros((n + 3, values.shape[1]))
+    rhs[:n] = values
+    coefs = _solve(matrix, rhs)
+    basis = np.column_stack([np.ones(len(x_eval)), x_eval, y_eval])
+    return _tps_kernel(x_eval, y_eval, x, y).dot(coefs[:n]) + basis.dot(coefs[n:])
+
+
+def get_polynomial_order(n_gcps):
+    """Return order of polynomial used by GDAL for <n_gcps> GCPs"""
+    if n_gcps < 6:
+        return 1
+    if n_gcps < 10:
+        return 2
+    return 3
+
+
+def _polynomial_basis(x, y, order):
+    """Return matrix with terms of 2D polynomial of <order>"""
+    return np.column_stack([x ** (i - j) * y ** j
+                            for i in range(order + 1) for j in range(i + 1)])
+
+
+def fit_polynomial(x, y, values, x_eval, y_eval):
+    """Fit polynomial (of order selected as in GDAL) to <values> and evaluate at other points
+
+    Parameters and returns are the same as in fit_tps.
+
+    """
+    order = get_polynomial_order(len(x))
+    coefs = np.linalg.lstsq(_polynomial_basis(x, y, order), values, rcond=None)[0]
+    return _polynomial_basis(x_eval, y_eval, order).dot(coefs)
+
+
+def _get_initial_indices(pixel, line, n_init):
+    """Select <n_init> GCPs spread over the image: corners and farthest points"""
+    indices = []
+    for values in [pixel + line, pixel - line]:
+        for index in [np.argmin(values), np.argmax(values)]:
+            if index not in indices:
+                indices.append(int(index))
+    # add farthest points
+    distance = np.min([np.hypot(pixel - pixel[i], line - line[i]) for i in indices], axis=0)
+    while len(indices) < n_init:
+        index = int(np.argmax(distance))
+        if distance[index] == 0:
+            break
+        indices.append(index)
+        distance = np.minimum(distance, np.hypot(pixel - pixel[index], line - line[index]))
+    return indices
+
+
+def select_gcps(pixel, line, x, y, tolerance=0.5, tps=True):
+    """Select the smallest subset of GCPs which reproduces all GCPs within <tolerance>
+
+    The fit (TPS or polynomial) of GCP pixel/line as function of GCP X/Y (the transformation
+    used by GDAL for warping) is computed from the subset and evaluated at all GCPs. GCPs with
+    the largest error are added to the subset until the error at all GCPs is below the tolerance.
+
+    Parameters
+    ----------
+    pixel, line : numpy.ndarray
+        pixel/line coordinates of GCPs
+    x, y : numpy.ndarray
+        X/Y (e.g. longitude/latitude) coordinates of GCPs
+    tolerance : float
+        maximum error in pixels
+    tps : bool
+        use thin plate spline (True) or polynomial (False)
+
+    Returns
+    -------
+    indices : numpy.ndarray
+        sorted indices of selected GCPs (all GCPs if the tolerance cannot be reached)
+
+    """
+    pixel = np.asarray(pixel, dtype=np.float64)
+    line = np.asarray(line, dtype=np.float64)
+    x, y = _normalize(x, y)
+    n_gcps = len(pixel)
+    values = np.column_stack([pixel, line])
+    fit = fit_tps if tps else fit_polynomial
+
+    indices = _get_initial_indices(pixel, line, min(n_gcps, 4 if tps else 10))
+    while len(indices) < n_gcps:
+        values_fit = fit(x[indices], y[indices], values[indices], x, y)
+        errors = np.hypot(*(values_fit - values).T)
+        if errors.max() <= tolerance:
+            return np.array(sorted(indices), dtype=int)
+        # add several worst GCPs at once to reduce number of fits
+        errors[indices] = -1
+        n_add = max(1, len(indices) // 4)
+        worst = [int(i) for i in np.argsort(errors)[::-1][:n_add] if errors[i] > tolerance]
+        if len(worst) == 0:
+            # error of the selected GCPs is above tolerance (polynomial cannot fit them)
+            break
+        indices.extend(worst)
+    return np.arange(n_gcps)
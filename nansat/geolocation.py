@@ -12,9 +12,12 @@
 # This program is distributed in the hope that it will be useful,
 # but WITHOUT ANY WARRANTY without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
-from __future__ import absolute_import
+from __future__ import absolute_import, division
+
+import weakref
 
 import gdal, osr
+import numpy as np
 
 from nansat.nsr import NSR
 
@@ -32,6 +35,8 @@ class Geolocation(object):
     data = None
     x_vrt = None
     y_vrt = None
+    _users = None
+    _tie_points = None
 
     def __init__(self, x_vrt, y_vrt, **kwargs):
         """Create Geolocation object from input VRT objects
@@ -131,10 +136,258 @@ class Geolocation(object):
         self._init_data(x_filename, y_filename, **kwargs)
         return self
 
-    def get_geolocation_grids(self):
-        """Read values of geolocation grids"""
-        lon_dataset = gdal.Open(self.data['X_DATASET'])
-        lon_grid = lon_dataset.GetRasterBand(int(self.data['X_BAND'])).ReadAsArray()
-        lat_dataset = gdal.Open(self.data['Y_DATASET'])
-        lat_grid = lat_dataset.GetRasterBand(int(self.data['Y_BAND'])).ReadAsArray()
-        return lon_grid, lat_grid
+    def _add_user(self, vrt):
+        """Register VRT object which uses this geolocation"""
+        if self._users is None:
+            self._users = weakref.WeakSet()
+        self._users.add(vrt)
+
+    def _remove_user(self, vrt):
+        """Unregister VRT object which used this geolocation"""
+        if self._users is not None:
+            self._users.discard(vrt)
+
+    def _release(self, vrt):
+        """Unregister VRT object and close self if it is not used by other open VRT objects"""
+        self._remove_user(vrt)
+        if self._users is None or not [user for user in self._users if not user._closed]:
+            self.close()
+
+    def close(self):
+        """Close datasets and delete files with X and Y coordinates"""
+        for geo_vrt in [self.x_vrt, self.y_vrt]:
+            if geo_vrt is not None:
+                geo_vrt.close()
+        self.x_vrt = None
+        self.y_vrt = None
+        self._tie_points = None
+
+    def get_geolocation_grids(self, x_offset=0, y_offset=0, x_size=None, y_size=None, step=1,
+                              method='spherical'):
+        """Read values of geolocation grids
+
+        If geolocation arrays are given at every pixel and line, the values are read from the
+        datasets. If geolocation arrays are tie-point grids (PIXEL_STEP or LINE_STEP is not 1),
+        the small grids are read once and values are interpolated for the requested window
+        only (see interpolate_tie_points).
+
+        Parameters
+        ----------
+        x_offset, y_offset : int
+            offset of the window to read from geolocation grids
+        x_size, y_size : int
+            size of the window to read. If None, the grids are read till the end
+        step : int
+            read only every <step>-th pixel and line (only these pixels are read from
+            the datasets)
+        method : str
+            interpolation of tie-point grids: 'spherical' or 'bilinear'
+
+        """
+        if self.is_tie_point_grid():
+            return self._interpolate_window(x_offset, y_offset, x_size, y_size, step, method)
+
+        lon_band = gdal.Open(self.data['X_DATASET']).GetRasterBand(int(self.data['X_BAND']))
+        lat_band = gdal.Open(self.data['Y_DATASET']).GetRasterBand(int(self.data['Y_BAND']))
+        if x_size is None:
+            x_size = lon_band.XSize - x_offset
+        if y_size is None:
+            y_size = lon_band.YSize - y_offset
+        if step == 1:
+            return (lon_band.ReadAsArray(x_offset, y_offset, x_size, y_size),
+                    lat_band.ReadAsArray(x_offset, y_offset, x_size, y_size))
+
+        return (_read_decimated(lon_band, x_offset, y_offset, x_size, y_size, step),
+                _read_decimated(lat_band, x_offset, y_offset, x_size, y_size, step))
+
+    def _get_offsets_steps(self):
+        """Return pixel_offset, pixel_step, line_offset, line_step as floats"""
+        return tuple(float(self.data.get(key, default)) for key, default in
+                     [('PIXEL_OFFSET', 0), ('PIXEL_STEP', 1), ('LINE_OFFSET', 0), ('LINE_STEP', 1)])
+
+    def is_tie_point_grid(self):
+        """Are geolocation arrays given at tie points (not at every pixel and line)?"""
+        return self._get_offsets_steps() != (0., 1., 0., 1.)
+
+    def get_tie_points(self):
+        """Return arrays with longitudes and latitudes of tie points (read only once)"""
+        if self._tie_points is None:
+            self._tie_points = (
+                gdal.Open(self.data['X_DATASET']).GetRasterBand(
+                    int(self.data['X_BAND'])).ReadAsArray().astype(np.float64),
+                gdal.Open(self.data['Y_DATASET']).GetRasterBand(
+                    int(self.data['Y_BAND'])).ReadAsArray().astype(np.float64))
+        return self._tie_points
+
+    def _interpolate_window(self, x_offset, y_offset, x_size, y_size, step, method):
+        """Interpolate tie-point grids onto every <step>-th pixel and line of the window"""
+        pixel_offset, pixel_step, line_offset, line_step = self._get_offsets_steps()
+        lon, lat = self.get_tie_points()
+        if x_size is None:
+            x_size = int(pixel_offset + (lon.shape[1] - 1) * pixel_step) + 1 - x_offset
+        if y_size is None:
+            y_size = int(line_offset + (lon.shape[0] - 1) * line_step) + 1 - y_offset
+        pixels = np.arange(x_offset, x_offset + x_size, step)
+        lines = np.arange(y_offset, y_offset + y_size, step)
+        return interpolate_tie_points(lon, lat, (pixels - pixel_offset) / pixel_step,
+                                      (lines - line_offset) / line_step, method)
+
+
+def _get_decimated_parts(offset, size, step, raster_size):
+    """Split every <step>-th index of a window into parts read by GDAL RasterIO
+
+    Nearest neighbour RasterIO of a window with size m * step into m pixels samples the source
+    at window_offset + (i + 0.5) * step for the i-th output pixel. The window is shifted by
+    (step - 1) / 2 (fractional windows are supported by GDAL >= 2.0), so that the samples fall
+    on the centres of every <step>-th pixel from <offset>. The first and the last index are
+    read separately if the shifted window does not fit into the raster.
+
+    Returns
+    -------
+    n : int
+        number of output indices
+    parts : list of tuples
+        (window offset, window size, buffer size, first output index)
+
+    """
+    n = len(range(offset, offset + size, step))
+    shift = (step - 1) / 2.
+    first = 0 if offset >= shift else 1
+    last = n
+    while last > first and offset + last * step - shift > raster_size:
+        last -= 1
+    parts = [(offset + i * step, 1, 1, i) for i in range(min(first, n))]
+    if last > first:
+        parts.append((offset + first * step - shift, (last - first) * step, last - first,
+                      first))
+    parts += [(offset + i * step, 1, 1, i) for i in range(max(last, first), n)]
+    return n, parts
+
+
+def _read_decimated(band, x_offset, y_offset, x_size, y_size, step):
+    """Read every <step>-th pixel and line of a window from a GDAL band
+
+    Only the decimated pixels are read (see _get_decimated_parts), in at most 9 RasterIO calls.
+
+    """
+    nx, x_parts = _get_decimated_parts(x_offset, x_size, step, band.XSize)
+    ny, y_parts = _get_decimated_parts(y_offset, y_size, step, band.YSize)
+    out = None
+    for y_win_off, y_win_size, y_buf_size, y_start in y_parts:
+        for x_win_off, x_win_size, x_buf_size, x_start in x_parts:
+            data = band.ReadAsArray(x_win_off, y_win_off, x_win_size, y_win_size,
+                                    x_buf_size, y_buf_size)
+            if out is None:
+                out = np.empty((ny, nx), dtype=data.dtype)
+            out[y_start:y_start + y_buf_size, x_start:x_start + x_buf_size] = data
+    return out
+
+
+def _lonlat_to_xyz(lon, lat):
+    """Convert longitude and latitude (degrees) into unit vectors (3, ...)"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.array([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def _xyz_to_lonlat(xyz):
+    """Convert vectors (3, ...) into longitude and latitude (degrees)"""
+    return (np.degrees(np.arctan2(xyz[1], xyz[0])),
+            np.degrees(np.arctan2(xyz[2], np.hypot(xyz[0], xyz[1]))))
+
+
+def _get_cells(index, size):
+    """Return indices of the first node of the cells and weights of the second node
+
+    Points outside of the grid are extrapolated from the edge cells.
+
+    """
+    first = np.clip(np.floor(index).astype(int), 0, max(size - 2, 0))
+    second = np.minimum(first + 1, size - 1)
+    return first, second, index - first
+
+
+def interpolate_tie_points(lon, lat, x_index, y_index, method='spherical', rows_per_chunk=256):
+    """Interpolate tie-point grids of longitude and latitude onto regular grid
+
+    Parameters
+    ----------
+    lon, lat : numpy.ndarray
+        2D grids with longitudes and latitudes of tie points
+    x_index, y_index : numpy.ndarray
+        fractional column and row indices of output pixels and lines in the tie-point grids
+        (e.g. (pixel - PIXEL_OFFSET) / PIXEL_STEP)
+    method : str
+        'spherical' - bilinear interpolation of unit vectors on the sphere (correct across
+        the dateline and near the poles), 'bilinear' - bilinear interpolation of longitude
+        and latitude
+    rows_per_chunk : int
+        number of output rows interpolated at once (limits memory of intermediate arrays)
+
+    Returns
+    -------
+    lon, lat : numpy.ndarray
+        2D grids with shape (len(y_index), len(x_index))
+
+    """
+    if method not in ['spherical', 'bilinear']:
+        raise ValueError('Unknown interpolation method %s. Use spherical or bilinear' % method)
+    x0, x1, x_weight = _get_cells(np.asarray(x_index, dtype=np.float64), lon.shape[1])
+    y0, y1, y_weight = _get_cells(np.asarray(y_index, dtype=np.float64), lon.shape[0])
+    if method == 'spherical':
+        values = _lonlat_to_xyz(lon, lat)
+    else:
+        values = np.array([lon, lat], dtype=np.float64)
+
+    lon_out = np.empty((len(y0), len(x0)))
+    lat_out = np.empty((len(y0), len(x0)))
+    for i in range(0, len(y0), rows_per_chunk):
+        rows = slice(i, i + rows_per_chunk)
+        w = y_weight[rows][:, None]
+        # interpolate along lines, then along pixels
+        chunk = values[:, y0[rows]] * (1 - w) + values[:, y1[rows]] * w
+        chunk = chunk[:, :, x0] * (1 - x_weight) + chunk[:, :, x1] * x_weight
+        if method == 'spherical':
+            lon_out[rows], lat_out[rows] = _xyz_to_lonlat(chunk)
+        else:
+            lon_out[rows], lat_out[rows] = chunk
+
+    if method == 'spherical' and lon.max() > 180:
+        # keep longitudes in 0 - 360 if tie points are given in 0 - 360
+        lon_out %= 360
+    return lon_out, lat_out
+
+
+def regularize_tie_points(lon, lat, pixel, line, method='spherical'):
+    """Interpolate tie points at irregular pixels/lines onto regularly spaced pixels/lines
+
+    GDAL geolocation arrays require regular steps (PIXEL_STEP, LINE_STEP). The number of tie
+    points and the first and last pixel/line are kept.
+
+    Parameters
+    ----------
+    lon, lat : numpy.ndarray
+        2D grids with longitudes and latitudes of tie points
+    pixel, line : numpy.ndarray
+        1D increasing vectors with pixel and line coordinates of columns and rows of tie points
+    method : str
+        interpolation method (see interpolate_tie_points)
+
+    Returns
+    -------
+    lon, lat : numpy.ndarray
+        2D grids with longitudes and latitudes at regular pixels/lines
+    pixel_offset, pixel_step, line_offset, line_step : float
+
+    """
+    pixel = np.asarray(pixel, dtype=np.float64)
+    line = np.asarray(line, dtype=np.float64)
+    pixel_step = (pixel[-1] - pixel[0]) / max(len(pixel) - 1, 1) or 1.
+    line_step = (line[-1] - line[0]) / max(len(line) - 1, 1) or 1.
+    regular_pixel = pixel[0] + np.arange(len(pixel)) * pixel_step
+    regular_line = line[0] + np.arange(len(line)) * line_step
+    if not (np.allclose(regular_pixel, pixel) and np.allclose(regular_line, line)):
+        lon, lat = interpolate_tie_points(
+            lon, lat, np.interp(regular_pixel, pixel, np.arange(len(pixel))),
+            np.interp(regular_line, line, np.arange(len(line))), method)
+    return lon, lat, pixel[0], pixel_step, line[0], line_step
@@ -0,0 +1,358 @@
+# Name:         index.py
+# Purpose:      Spatial index of footprints of many Domains
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Spatial index of footprints of many Domains for fast overlap queries
+
+Footprints (border polygons in lon/lat, as returned by Domain.get_border(fix_lon=True)) are
+stored in an SQLite database together with the time coverage. Envelopes of footprints are kept
+in an SQLite R*Tree table, so that a query selects candidates without scanning all footprints.
+Only the candidates are intersected with the query polygon. The database can be kept in memory
+or in a file and reopened later without recomputing the footprints.
+
+Longitudes of footprints crossing the dateline may exceed 180. Therefore envelopes are also
+queried shifted by 360 degrees. Footprints around a pole are matched by latitude only.
+
+Examples
+--------
+    >>> index = FootprintIndex('footprints.sqlite')
+    >>> index.add_many((filename, Nansat(filename)) for filename in files)
+    >>> names = index.query_bbox(-10, 60, 30, 80, start_time='2026-01-01', end_time='2026-02-01')
+    >>> names = index.query_domain(arctic_domain)
+
+"""
+from __future__ import absolute_import
+
+import datetime
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from shapely import wkb as shapely_wkb
+    from shapely.prepared import prep
+except ImportError:
+    SHAPELY_IS_INSTALLED = False
+else:
+    SHAPELY_IS_INSTALLED = True
+
+from nansat.domain import Domain
+from nansat.tools import ogr, parse_time
+
+# limit of longitude in envelopes of footprints around a pole (covers the 360 degrees shifts)
+POLE_LON_LIMIT = 540.
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _format_time(value):
+    """Convert datetime or string into ISO string which can be compared in SQL (or None)"""
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        if isinstance(value, datetime.date):
+            value = datetime.datetime(value.year, value.month, value.day)
+        else:
+            value = parse_time(value)
+    if value.tzinfo is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    return value.strftime(TIME_FORMAT)
+
+
+def _get_time_coverage(domain):
+    """Return time_coverage_start/end from metadata of Nansat object (or None, None)"""
+    times = []
+    for key in ['time_coverage_start', 'time_coverage_end']:
+        try:
+            times.append(domain.get_metadata(key))
+        except (AttributeError, KeyError, ValueError):
+            times.append(None)
+    return times
+
+
+def _load_geometry(blob):
+    """Create geometry (Shapely if installed, otherwise OGR) from WKB"""
+    if SHAPELY_IS_INSTALLED:
+        return shapely_wkb.loads(bytes(blob))
+    return ogr.CreateGeometryFromWkb(bytes(blob))
+
+
+def _prepare_geometry(polygon):
+    """Prepare OGR polygon for many intersection tests (with Shapely if installed)"""
+    if SHAPELY_IS_INSTALLED:
+        return prep(shapely_wkb.loads(bytes(polygon.ExportToWkb())))
+    return polygon
+
+
+def _intersects(prepared, geometry):
+    """Check if prepared geometry intersects geometry created by _load_geometry"""
+    if SHAPELY_IS_INSTALLED:
+        return prepared.intersects(geometry)
+    return prepared.Intersects(geometry)
+
+
+class FootprintIndex(object):
+    """Spatial index of footprints of Domains stored in SQLite database
+
+    Parameters
+    ----------
+    filename : str
+        name of database file. If the file exists, the index is loaded from it.
+        By default the index is kept in memory (and can be written to file with save()).
+
+    """
+    # maximum number of footprint geometries kept in memory
+    GEOMETRY_CACHE_SIZE = 10000
+
+    def __init__(self, filename=':memory:'):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self._geometries = OrderedDict()
+        self._has_rtree = self._create_tables()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM footprints').fetchone()[0]
+
+    def __contains__(self, name):
+        return self.connection.execute('SELECT 1 FROM footprints WHERE name = ?',
+                                       (name,)).fetchone() is not None
+
+    def _create_tables(self):
+        """Create tables (if they do not exist) and return True if R*Tree is available"""
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS footprints ('
+                'id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, '
+                'start_time TEXT, end_time TEXT, '
+                'min_lon REAL, max_lon REAL, min_lat REAL, max_lat REAL, geometry BLOB)')
+            try:
+                self.connection.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS footprints_rtree '
+                    'USING rtree(id, min_lon, max_lon, min_lat, max_lat)')
+            except sqlite3.OperationalError:
+                # SQLite is compiled without R*Tree: envelopes are queried from footprints
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS footprints_lat ON footprints (min_lat, max_lat)')
+                return False
+        return True
+
+    def close(self):
+        """Close the database"""
+        self._geometries.clear()
+        self.connection.close()
+
+    def save(self, filename):
+        """Write the index into database file <filename> (e.g. index created in memory)"""
+        target = sqlite3.connect(filename)
+        try:
+            if hasattr(self.connection, 'backup'):
+                self.connection.backup(target)
+            else:
+                target.executescript('\n'.join(self.connection.iterdump()))
+        finally:
+            target.close()
+
+    def add(self, name, domain, start_time=None, end_time=None):
+        """Add footprint of Domain (or Nansat) into the index
+
+        Parameters
+        ----------
+        name : str
+            unique name of the footprint (e.g. filename). Footprint with the same name
+            is replaced.
+        domain : Domain or Nansat
+            object with georeference. The footprint is computed from get_border().
+        start_time, end_time : datetime or str
+            time coverage. By default it is taken from metadata time_coverage_start and
+            time_coverage_end of Nansat objects (if available).
+
+        """
+        self.add_many([(name, domain, start_time, end_time)])
+
+    def add_border(self, name, lon, lat, start_time=None, end_time=None):
+        """Add footprint given by vectors of border longitude and latitude into the index
+
+        The border is given as returned by Domain.get_border(fix_lon=True). Other parameters
+        are the same as in add().
+
+        """
+        self.add_many([(name, (lon, lat), start_time, end_time)])
+
+    def add_many(self, items):
+        """Add many footprints into the index in one transaction (bulk loading)
+
+        Parameters
+        ----------
+        items : iterable
+            tuples (name, domain) or (name, domain, start_time, end_time), where domain is
+            Domain, Nansat or tuple with vectors of border longitude and latitude
+
+        """
+        rows = OrderedDict()
+        for item in items:
+            name, domain = item[:2]
+            start_time, end_time = (list(item[2:]) + [None, None])[:2]
+            if isinstance(domain, tuple):
+                footprint = Domain._footprint_from_border(*domain)
+            else:
+                footprint = domain._get_footprint()
+                if start_time is None and end_time is None:
+                    start_time, end_time = _get_time_coverage(domain)
+            rows[name] = self._get_row(name, footprint, start_time, end_time)
+
+        with self.connection:
+            self._delete(list(rows))
+            next_id = self.connection.execute(
+                'SELECT COALESCE(MAX(id), 0) + 1 FROM footprints').fetchone()[0]
+            rows = [(next_id + i,) + row for i, row in enumerate(rows.values())]
+            self.connection.executemany(
+                'INSERT INTO footprints (id, name, start_time, end_time, '
+                'min_lon, max_lon, min_lat, max_lat, geometry) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            if self._has_rtree:
+                self.connection.executemany(
+                    'INSERT INTO footprints_rtree VALUES (?, ?, ?, ?, ?)',
+                    [row[:1] + row[4:8] for row in rows])
+
+    def _get_row(self, name, footprint, start_time, end_time):
+        """Convert footprint into values of a row of the footprints table (without id)"""
+        if footprint is None:
+            raise ValueError('Footprint of %s cannot be computed' % name)
+        min_lon, max_lon, min_lat, max_lat = footprint['envelope']
+        min_lon, max_lon = max(min_lon, -POLE_LON_LIMIT), min(max_lon, POLE_LON_LIMIT)
+        start_time = _format_time(start_time)
+        end_time = _format_time(end_time) or start_time
+        geometry = footprint['geometry']
+        if geometry is not None:
+            geometry = sqlite3.Binary(geometry.ExportToWkb())
+        return (name, start_time or end_time, end_time,
+                float(min_lon), float(max_lon), float(min_lat), float(max_lat), geometry)
+
+    def remove(self, name):
+        """Remove footprint with <name> from the index"""
+        with self.connection:
+            self._delete([name])
+
+    def _delete(self, names):
+        """Delete footprints with <names> (within transaction)"""
+        ids = []
+        for name in names:
+            row = self.connection.execute('SELECT id FROM footprints WHERE name = ?',
+                                          (name,)).fetchone()
+            if row is not None:
+                ids.append(row)
+                self._geometries.pop(row[0], None)
+        self.connection.executemany('DELETE FROM footprints WHERE id = ?', ids)
+        if self._has_rtree:
+            self.connection.executemany('DELETE FROM footprints_rtree WHERE id = ?', ids)
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat, start_time=None, end_time=None):
+        """Find footprints intersecting a box in lon/lat
+
+        Parameters
+        ----------
+        min_lon, min_lat, max_lon, max_lat : float
+            limits of the box (max_lon may exceed 180 for boxes crossing the dateline)
+        start_time, end_time : datetime or str
+            find only footprints with time coverage overlapping this time window
+
+        Returns
+        -------
+        names : list of str
+            names of footprints in the order of adding
+
+        """
+        lon = [min_lon, max_lon, max_lon, min_lon]
+        lat = [min_lat, min_lat, max_lat, max_lat]
+        return self.query_polygon(lon, lat, start_time, end_time)
+
+    def query_polygon(self, lon, lat, start_time=None, end_time=None):
+        """Find footprints intersecting polygon given by vectors of longitude and latitude
+
+        Parameters and returns are the same as in query_bbox().
+
+        """
+        return self._query(Domain._footprint_from_border(lon, lat), start_time, end_time)
+
+    def query_domain(self, domain, start_time=None, end_time=None):
+        """Find footprints intersecting footprint of Domain (or Nansat)
+
+        Parameters and returns are the same as in query_bbox().
+
+        """
+        return self._query(domain._get_footprint(), start_time, end_time)
+
+    def _query(self, footprint, start_time, end_time):
+        """Find names of footprints intersecting query footprint within time window"""
+        if footprint is None:
+            raise ValueError('Footprint of query cannot be computed')
+        min_lon, max_lon, min_lat, max_lat = footprint['envelope']
+        if np.isfinite(min_lon) and np.isfinite(max_lon):
+            shifts = [0, -360, 360]
+        else:
+            shifts = [0]
+            min_lon, max_lon = -POLE_LON_LIMIT, POLE_LON_LIMIT
+
+        matches = {}
+        for shift in shifts:
+            prepared = None
+            for fid, name, blob in self._query_envelope(min_lon + shift, max_lon + shift,
+                                                        min_lat, max_lat,
+                                                        start_time, end_time):
+                if fid in matches:
+                    continue
+                if blob is None or footprint['geometry'] is None:
+                    # footprint around a pole or invalid polygon: envelopes intersect
+                    matches[fid] = name
+                    continue
+                if prepared is None:
+                    prepared = _prepare_geometry(
+                        Domain._get_polygon(footprint['lon'] + shift, footprint['lat']))
+                if _intersects(prepared, self._get_geometry(fid, blob)):
+                    matches[fid] = name
+        return [matches[fid] for fid in sorted(matches)]
+
+    def _query_envelope(self, min_lon, max_lon, min_lat, max_lat, start_time, end_time):
+        """Return id, name and geometry of footprints with envelope intersecting the query"""
+        if self._has_rtree:
+            sql = ('SELECT f.id, f.name, f.geometry FROM footprints_rtree AS r '
+                   'JOIN footprints AS f ON f.id = r.id '
+                   'WHERE r.min_lon <= ? AND r.max_lon >= ? AND r.min_lat <= ? AND r.max_lat >= ?')
+        else:
+            sql = ('SELECT f.id, f.name, f.geometry FROM footprints AS f '
+                   'WHERE f.min_lon <= ? AND f.max_lon >= ? AND f.min_lat <= ? AND f.max_lat >= ?')
+        params = [float(max_lon), float(min_lon), float(max_lat), float(min_lat)]
+        if end_time is not None:
+            sql += ' AND f.start_time <= ?'
+            params.append(_format_time(end_time))
+        if start_time is not None:
+            sql += ' AND f.end_time >= ?'
+            params.append(_format_time(start_time))
+        return self.connection.execute(sql, params).fetchall()
+
+    def _get_geometry(self, fid, blob):
+        """Return geometry of footprint from cache (or load it from WKB)"""
+        if fid in self._geometries:
+            self._geometries[fid] = self._geometries.pop(fid)
+        else:
+            self._geometries[fid] = _load_geometry(blob)
+            if len(self._geometries) > self.GEOMETRY_CACHE_SIZE:
+                self._geometries.popitem(last=False)
+        return self._geometries[fid]
@@ -0,0 +1,103 @@
+# Name:         lazy.py
+# Purpose:      Python pixel functions for lazy bands
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Registry of Python functions used as GDAL pixel functions of lazy bands
+
+GDAL VRT derived bands can call Python pixel functions referred to as
+'module.function'. Any Python callable (including lambdas and closures) is
+registered here as an attribute of this module, so GDAL can find it by name.
+The function is called by GDAL for each block of the band only when the
+data is read (e.g. by Nansat.__getitem__, export or reproject).
+
+register() returns a LazyFunction handle. The VRT objects with the lazy band
+keep the handle, and the function is removed from this module when the last
+of them is closed or deleted.
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import threading
+
+from nansat.tools import gdal
+
+TRUSTED_MODULES_OPTION = 'GDAL_VRT_PYTHON_TRUSTED_MODULES'
+
+_counter = itertools.count()
+_lock = threading.Lock()
+
+
+class LazyFunction(object):
+    """Handle of a registered pixel function which unregisters the function when deleted
+
+    Parameters
+    ----------
+    name : str
+        full name of the pixel function ('nansat.lazy._lazy_band_N')
+
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __del__(self):
+        """Remove the pixel function from this module"""
+        # module globals can already be cleared at interpreter shutdown
+        if unregister is not None:
+            unregister(self.name)
+
+
+def register(func, kwargs=None):
+    """Register Python function for lazy band and return handle with its name
+
+    Parameters
+    ----------
+    func : callable
+        function which accepts input arrays (one per source band) and keyword
+        arguments and returns array with the shape of the input arrays
+    kwargs : dict
+        keyword arguments for <func>
+
+    Returns
+    -------
+    handle : LazyFunction
+        handle with full name of the pixel function for PixelFunctionType. The function is
+        unregistered when the handle is deleted.
+
+    """
+    if kwargs is None:
+        kwargs = {}
+
+    def pixel_function(in_ar, out_ar, xoff, yoff, xsize, ysize,
+                       raster_xsize, raster_ysize, buf_radius, gt, **gdal_kwargs):
+        out_ar[:] = func(*in_ar, **kwargs)
+
+    with _lock:
+        name = '_lazy_band_%d' % next(_counter)
+        globals()[name] = pixel_function
+        _trust_this_module()
+    return LazyFunction('%s.%s' % (__name__, name))
+
+
+def unregister(name):
+    """Remove pixel function with full name <name> from this module (if registered)"""
+    with _lock:
+        globals().pop(name.split('.')[-1], None)
+
+
+def _trust_this_module():
+    """Allow GDAL to run Python pixel functions from this module"""
+    trusted_modules = gdal.GetConfigOption(TRUSTED_MODULES_OPTION, '')
+    if __name__ not in trusted_modules.split(','):
+        trusted_modules = ','.join([m for m in [trusted_modules, __name__] if m])
+        gdal.SetConfigOption(TRUSTED_MODULES_OPTION, trusted_modules)
@@ -19,9 +19,11 @@ import os
 import glob
 import sys
 import tempfile
+import threading
 import datetime
 import pkgutil
 import warnings
+from multiprocessing.pool import ThreadPool
 from xml.sax import saxutils
 
 import numpy as np
@@ -33,12 +35,17 @@ from nansat.domain import Domain
 from nansat.exporter import Exporter
 from nansat.figure import Figure
 from nansat.vrt import VRT
-from nansat.tools import add_logger, gdal
-from nansat.tools import parse_time
+from nansat.tools import add_logger, gdal, gdal_type_to_numpy, numpy_to_gdal_type
+from nansat.tools import parse_time, remove_keys
 from nansat.node import Node
+from nansat.expression import Expression
+from nansat import config
+from nansat import lazy
 from nansat.pointbrowser import PointBrowser
+from nansat.resampling import KDTreeResampler
 
 from nansat.exceptions import NansatGDALError, WrongMapperError, NansatReadError
+from nansat.exceptions import NansatDisjointError
 
 import collections
 if hasattr(collections, 'OrderedDict'):
@@ -97,6 +104,13 @@ class Nansat(Domain, Exporter):
 
     FILL_VALUE = 9.96921e+36
     ALT_FILL_VALUE = -10000.
+    # number of operations (crop, resize, etc) after which the VRT is compacted automatically
+    AUTO_COMPACT_DEPTH = None
+    # creation options of files written tile by tile (see reproject_to_file)
+    TILED_FILE_OPTIONS = {
+        'GTiff': ['TILED=YES', 'SPARSE_OK=TRUE', 'BIGTIFF=IF_SAFER', 'COMPRESS=LZW'],
+        'netCDF': ['FORMAT=NC4', 'COMPRESS=DEFLATE'],
+    }
 
     # instance attributes
     logger = None
@@ -151,52 +165,393 @@ class Nansat(Domain, Exporter):
         self._init_empty(filename, log_level)
         # Create VRT object with mapping of variables
         self.vrt = self._get_mapper(mapper, **kwargs)
+        # mappers can change band metadata directly in the dataset
+        self.vrt.invalidate_band_index()
 
     def __getitem__(self, band_id):
         """Returns the band as a NumPy array, by overloading []
 
         Parameters
         -----------
-        band_id : int or str
+        band_id : int or str or tuple
             If int, array from band with number <band_id> is returned
             If string, array from band with metadata 'name' equal to
             <band_id> is returned
+            If tuple (band_id, rows, cols), only the window given by <rows>
+            and <cols> (slices or ints) is read from the band
+
+        Returns
+        --------
+        a : NumPy array
+
+        Examples
+        --------
+            >>> array = n['sigma0_HV']
+            >>> patch = n['sigma0_HV', 1000:1512, 2000:2512]
+
+        """
+        if isinstance(band_id, tuple):
+            band_id, window, squeeze_axes = self._get_window_from_key(band_id)
+            band_data = self.read_window(band_id, *window)
+            for axis in squeeze_axes:
+                band_data = band_data.take(0, axis=axis)
+            return band_data
+
+        return self._read_band(band_id)
+
+    def _get_window_from_key(self, key):
+        """Convert key (band_id, rows, cols) into band_id and RasterIO window
+
+        Parameters
+        ----------
+        key : tuple
+            band_id, slice or int for rows and (optionally) slice or int for cols
+
+        Returns
+        -------
+        band_id : int or str
+            band to read
+        window : tuple
+            x_offset, y_offset, x_size, y_size
+        squeeze_axes : list
+            axes to remove from result (where key contained integers)
+
+        """
+        if len(key) not in [2, 3]:
+            raise IndexError('Use n[band_id, rows, cols] for reading a window')
+        band_id = key[0]
+        indices = list(key[1:]) + [slice(None)] * (3 - len(key))
+        offsets, sizes, squeeze_axes = [], [], []
+        for axis, (index, raster_size) in enumerate(zip(indices, self.shape())):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(raster_size)
+                if step != 1:
+                    raise IndexError('Only step 1 is supported for reading a window')
+                offsets.append(start)
+                sizes.append(stop - start)
+            else:
+                index = int(index)
+                if index < 0:
+                    index += raster_size
+                offsets.append(index)
+                sizes.append(1)
+                squeeze_axes.insert(0, axis)
+        return band_id, (offsets[1], offsets[0], sizes[1], sizes[0]), squeeze_axes
+
+    def read_window(self, band_id, xoff, yoff, xsize, ysize, buf_shape=None, performance=None):
+        """Read a window from the band as a NumPy array
+
+        Only the window is read from disk by GDAL. Expression, fill values, inf
+        replacement and swath mask are applied to the window only.
+
+        Parameters
+        -----------
+        band_id : int or str
+            number or name of the band
+        xoff, yoff : int
+            pixel and line offset of the window
+        xsize, ysize : int
+            width and height of the window
+        buf_shape : tuple
+            (rows, cols) of the output array. If given, the window is resampled
+            by GDAL to this shape.
+        performance : str or dict
+            name of profile or dict with GDAL performance settings applied while data is
+            read (see nansat.config.performance)
 
         Returns
         --------
         a : NumPy array
 
+        Examples
+        --------
+            >>> patch = n.read_window('sigma0_HV', 2000, 1000, 512, 512)
+            >>> preview = n.read_window(1, 0, 0, n.shape()[1], n.shape()[0], buf_shape=(100, 100))
+            >>> band = n.read_window(1, 0, 0, n.shape()[1], n.shape()[0], performance='throughput')
+
+        """
+        raster_y_size, raster_x_size = self.shape()
+        if (xoff < 0 or yoff < 0 or xsize < 1 or ysize < 1 or
+                xoff + xsize > raster_x_size or yoff + ysize > raster_y_size):
+            raise IndexError('Window (%d, %d, %d, %d) is out of raster with shape (%d, %d)' %
+                             (xoff, yoff, xsize, ysize, raster_y_size, raster_x_size))
+        with config.performance.from_arg(performance):
+            return self._read_band(band_id, (xoff, yoff, xsize, ysize), buf_shape)
+
+    def iter_blocks(self, bands, block_shape=None, overlap=0, lonlat=False):
+        """Iterate over the raster in tiles aligned to the native GDAL block size
+
+        Memory consumption depends on the size of the tiles and not on the size
+        of the raster. Each tile is a dictionary with the following keys:
+
+        * 'x_offset', 'y_offset', 'x_size', 'y_size' : position of the tile
+        * 'window' : (x_offset, y_offset, x_size, y_size) of the data actually read
+          (tile extended by <overlap> pixels and clipped at the raster edge)
+        * 'core' : (rows, cols) slices of the tile inside the arrays read over 'window'
+        * 'bands' : OrderedDict with arrays from each band (same as from Nansat.__getitem__)
+        * 'lon', 'lat' : longitude and latitude of the window (only if <lonlat> is True)
+
+        Parameters
+        -----------
+        bands : list of int or str
+            numbers or names of the bands to read
+        block_shape : tuple
+            (rows, cols) of the tile. Rounded up to multiple of the native
+            block size. If None, the native block size of the first band is used.
+        overlap : int
+            number of pixels to read around each tile (e.g. for filtering)
+        lonlat : bool
+            add longitude and latitude grids to each tile?
+
+        Yields
+        -------
+        tile : dict
+
+        Examples
+        --------
+            >>> for tile in n.iter_blocks(['sigma0_HH', 'sigma0_HV'], block_shape=(1024, 1024)):
+            >>>     ratio = tile['bands']['sigma0_HV'] / tile['bands']['sigma0_HH']
 
         """
+        if not isinstance(bands, (list, tuple)):
+            bands = [bands]
+        block_x_size, block_y_size = self._get_raster_band(bands[0]).GetBlockSize()
+        if block_shape is not None:
+            block_y_size *= int(np.ceil(float(block_shape[0]) / block_y_size))
+            block_x_size *= int(np.ceil(float(block_shape[1]) / block_x_size))
+
+        raster_y_size, raster_x_size = self.shape()
+        for y_offset in range(0, raster_y_size, block_y_size):
+            y_size = min(block_y_size, raster_y_size - y_offset)
+            win_y_offset = max(y_offset - overlap, 0)
+            win_y_size = min(y_offset + y_size + overlap, raster_y_size) - win_y_offset
+            for x_offset in range(0, raster_x_size, block_x_size):
+                x_size = min(block_x_size, raster_x_size - x_offset)
+                win_x_offset = max(x_offset - overlap, 0)
+                win_x_size = min(x_offset + x_size + overlap, raster_x_size) - win_x_offset
+                window = (win_x_offset, win_y_offset, win_x_size, win_y_size)
+                tile = {
+                    'x_offset': x_offset,
+                    'y_offset': y_offset,
+                    'x_size': x_size,
+                    'y_size': y_size,
+                    'window': window,
+                    'core': (slice(y_offset - win_y_offset, y_offset - win_y_offset + y_size),
+                             slice(x_offset - win_x_offset, x_offset - win_x_offset + x_size)),
+                    'bands': OrderedDict([(band_id, self._read_band(band_id, window))
+                                          for band_id in bands]),
+                }
+                if lonlat:
+                    tile['lon'], tile['lat'] = self._get_window_geolocation_grids(*window)
+                yield tile
+
+    @staticmethod
+    def _get_read_kwargs(window=None, buf_shape=None):
+        """Make keyword arguments for GDAL Band.ReadAsArray from window and buffer shape"""
+        read_kwargs = {}
+        if window is not None:
+            read_kwargs = dict(zip(['xoff', 'yoff', 'win_xsize', 'win_ysize'], window))
+        if buf_shape is not None:
+            read_kwargs['buf_ysize'], read_kwargs['buf_xsize'] = buf_shape
+        return read_kwargs
+
+    def _read_band(self, band_id, window=None, buf_shape=None):
+        """Read full band or window from band and apply expression, fill value and swath mask
+
+        Parameters
+        -----------
+        band_id : int or str
+            number or name of the band
+        window : tuple
+            x_offset, y_offset, x_size, y_size. If None the full band is read
+        buf_shape : tuple
+            (rows, cols) of the output array
+
+        Returns
+        --------
+        a : NumPy array
+
+        """
+        read_kwargs = self._get_read_kwargs(window, buf_shape)
+        self.vrt._touch_files()
         # get band
-        band = self.get_GDALRasterBand(band_id)
+        band = self._get_raster_band(band_id)
+        band_metadata = band.GetMetadata()
         # get expression from metadata
-        expression = band.GetMetadata().get('expression', '')
+        expression = band_metadata.get('expression', '')
         # get data
-        band_data = band.ReadAsArray()
+        band_data = band.ReadAsArray(**read_kwargs)
         if band_data is None:
             raise NansatGDALError('Cannot read array from band %s' % str(band_data))
 
         # execute expression if any
         if expression != '':
-            band_data = eval(expression)
+            band_data = self._eval_expression(expression, band_data, window, buf_shape)
 
-        all_float_flag = band_data.dtype.char in np.typecodes['AllFloat']
-        # Set invalid and missing data to np.nan (for floats only)
-        if '_FillValue' in band.GetMetadata() and all_float_flag:
-            band_data = self._fill_with_nan(band, band_data)
+        swathmask = None
+        if (self.has_band('swathmask') and
+                band_data.dtype.char in np.typecodes['AllFloat']):
+            swathmask = self._get_raster_band('swathmask').ReadAsArray(**read_kwargs)
 
-        # replace infs with np.NAN
-        if np.size(np.where(np.isinf(band_data))) > 0:
-            band_data[np.isinf(band_data)] = np.nan
+        return self._postprocess_band(band_metadata, band_data, swathmask)
+
+    def _postprocess_band(self, band_metadata, band_data, swathmask=None):
+        """Replace fill values, infs and out-of-swath pixels with np.nan in one pass
+
+        Parameters
+        -----------
+        band_metadata : dict
+            metadata of the band
+        band_data : numpy.ndarray
+            array read from the band
+        swathmask : numpy.ndarray
+            array read from swathmask band (or None)
+
+        Returns
+        --------
+        a : NumPy array
 
-        # erase out-of-swath pixels with np.Nan (if not integer)
-        if self.has_band('swathmask') and all_float_flag:
-            swathmask = self.get_GDALRasterBand('swathmask').ReadAsArray()
-            band_data[swathmask == 0] = np.nan
+        """
+        # integer data cannot have infs or np.nan
+        if band_data.dtype.char not in np.typecodes['AllFloat']:
+            return band_data
+
+        # find infs, missing data and out-of-swath pixels and replace all with np.nan at once
+        invalid = np.isinf(band_data)
+        if '_FillValue' in band_metadata:
+            fill_value = float(band_metadata['_FillValue'])
+            invalid |= band_data == fill_value
+            # quick hack to avoid problem with wrong _FillValue - see issue #123
+            if fill_value == self.FILL_VALUE:
+                invalid |= band_data == self.ALT_FILL_VALUE
+        if swathmask is not None:
+            invalid |= swathmask == 0
+        if invalid.any():
+            band_data[invalid] = np.nan
 
         return band_data
 
+    def read_bands(self, bands, out=None, dtype=None):
+        """Read several bands into one 3D array
+
+        Bands without expression are read from the dataset with one RasterIO
+        call directly into the output buffer. Fill values, infs and
+        out-of-swath pixels of float bands are replaced with np.nan in place
+        (as in Nansat.__getitem__, integer bands are not modified).
+
+        Parameters
+        -----------
+        bands : list of int or str
+            numbers or names of the bands to read
+        out : numpy.ndarray
+            preallocated array with shape (len(bands), rows, cols) to read data into.
+            Can be reused for reading several datasets of the same shape.
+        dtype : str or numpy.dtype
+            data type of the output array. If None, it is defined by the bands' data types.
+            Ignored if <out> is given.
+
+        Returns
+        --------
+        out : numpy.ndarray
+            3D array with shape (len(bands), rows, cols)
+
+        Examples
+        --------
+            >>> rgb = n.read_bands(['red', 'green', 'blue'])
+            >>> buf = np.empty((3,) + n.shape(), 'float32')
+            >>> for filename in filenames:
+            >>>     Nansat(filename).read_bands([1, 2, 3], out=buf)
+
+        """
+        band_numbers = [self.get_band_number(band_id) for band_id in bands]
+        self.vrt._touch_files()
+        gdal_bands = [self.vrt._dataset_readonly.GetRasterBand(band_number)
+                      for band_number in band_numbers]
+        band_metadatas = [band.GetMetadata() for band in gdal_bands]
+        expression_data = {}
+        for i, (band_number, band_metadata) in enumerate(zip(band_numbers, band_metadatas)):
+            if band_metadata.get('expression', '') != '':
+                expression_data[i] = self._read_band(band_number)
+
+        if out is None:
+            if dtype is None:
+                dtype = np.result_type(*[
+                    expression_data[i].dtype if i in expression_data else
+                    gdal_type_to_numpy[gdal.GetDataTypeName(band.DataType)]
+                    for i, band in enumerate(gdal_bands)])
+            out = np.empty((len(bands),) + self.shape(), dtype)
+        elif out.shape != (len(bands),) + self.shape():
+            raise ValueError('Shape of <out> %s should be %s' %
+                             (out.shape, (len(bands),) + self.shape()))
+
+        if len(expression_data) == 0 and len(bands) > 1:
+            self._read_raw_bands(band_numbers, out)
+        else:
+            for i, band in enumerate(gdal_bands):
+                if i in expression_data:
+                    out[i] = expression_data[i]
+                elif band.ReadAsArray(buf_obj=out[i]) is None:
+                    raise NansatGDALError('Cannot read array from band %s' % band_numbers[i])
+
+        if out.dtype.char not in np.typecodes['AllFloat']:
+            return out
+
+        # as in __getitem__, data of integer bands is not post-processed
+        postprocess = [i for i, band in enumerate(gdal_bands) if i not in expression_data and
+                       np.dtype(gdal_type_to_numpy[gdal.GetDataTypeName(band.DataType)]).char
+                       in np.typecodes['AllFloat']]
+        swathmask = None
+        if postprocess and self.has_band('swathmask'):
+            swathmask = self._get_raster_band('swathmask').ReadAsArray()
+        for i in postprocess:
+            self._postprocess_band(band_metadatas[i], out[i], swathmask)
+
+        return out
+
+    def _read_raw_bands(self, band_numbers, out):
+        """Read several bands with one RasterIO call into 3D array <out>"""
+        try:
+            band_data = self.vrt._dataset_readonly.ReadAsArray(buf_obj=out, band_list=band_numbers)
+        except TypeError:
+            # band_list is not supported by older GDAL, read bands one by one
+            band_data = out
+            for band_number, band_array in zip(band_numbers, out):
+                if self.vrt._dataset_readonly.GetRasterBand(band_number).ReadAsArray(
+                        buf_obj=band_array) is None:
+                    band_data = None
+        if band_data is None:
+            raise NansatGDALError('Cannot read array from bands %s' % band_numbers)
+
+    def _eval_expression(self, expression, band_data, window=None, buf_shape=None):
+        """Evaluate expression from band metadata
+
+        Bands referenced in the expression as self['band_name'] are read over
+        the same window as the band itself.
+
+        """
+        reader = self
+        if window is not None:
+            reader = _WindowReader(self, window, buf_shape)
+        band_data = np.asarray(Expression.get(expression).evaluate(reader, band_data))
+        if window is None:
+            return band_data
+
+        x_offset, y_offset, x_size, y_size = window
+        dst_shape = tuple(buf_shape or (y_size, x_size))
+        if band_data.shape == dst_shape:
+            return band_data
+        # expressions not depending on other bands may return full size arrays:
+        # take the window and resample it to the buffer (nearest neighbour, as GDAL)
+        if band_data.shape == self.shape():
+            rows = y_offset + ((np.arange(dst_shape[0]) + 0.5) * y_size // dst_shape[0])
+            cols = x_offset + ((np.arange(dst_shape[1]) + 0.5) * x_size // dst_shape[1])
+            return band_data[rows.astype(int)[:, None], cols.astype(int)[None, :]]
+        try:
+            return np.array(np.broadcast_to(band_data, dst_shape))
+        except ValueError:
+            raise ValueError('Expression %s returned array with shape %s instead of %s'
+                             % (expression, band_data.shape, dst_shape))
+
     def __repr__(self):
         """Creates string with basic info about the Nansat object"""
         out_str = '{separator}{filename}{separator}Mapper: {mapper}{bands}{separator}{domain}'
@@ -255,23 +610,12 @@ class Nansat(Domain, Exporter):
         if array is not None:
             self.add_band(array=array, parameters=parameters)
 
-    def _fill_with_nan(self, band, band_data):
-        """Fill input array with fill value taen from input band metadata"""
-        fill_value = float(band.GetMetadata()['_FillValue'])
-        band_data[band_data == fill_value] = np.nan
-        # quick hack to avoid problem with wrong _FillValue - see issue
-        # #123
-        if fill_value == self.FILL_VALUE:
-            band_data[band_data == self.ALT_FILL_VALUE] = np.nan
-
-        return band_data
-
-
     def add_band(self, array, parameters=None, nomem=False):
         """Add band from numpy array with metadata.
 
-        Create VRT object which contains VRT and RAW binary file and append it
-        to self.vrt.band_vrts
+        Create VRT object which refers to the array data (no copy is made) or
+        contains RAW binary file on disk (if nomem is True) and append it to
+        self.vrt.band_vrts
 
         Parameters
         -----------
@@ -284,7 +628,9 @@ class Nansat(Domain, Exporter):
 
         Notes
         -----
-        Creates VRT object with VRT-file and RAW-file. Adds band to the self.vrt.
+        Creates VRT object with VRT-file and reference to the array (or RAW-file).
+        Adds band to the self.vrt. The array is kept alive by the VRT object and
+        changes of the array values are visible in the band.
 
         Examples
         --------
@@ -297,8 +643,9 @@ class Nansat(Domain, Exporter):
     def add_bands(self, arrays, parameters=None, nomem=False):
         """Add bands from numpy arrays with metadata.
 
-        Create VRT object which contains VRT and RAW binary file and append it
-        to self.vrt.band_vrts
+        Create VRT objects which refer to the arrays data (no copy is made) or
+        contain RAW binary files on disk (if nomem is True) and append them to
+        self.vrt.band_vrts
 
         Parameters
         -----------
@@ -311,7 +658,9 @@ class Nansat(Domain, Exporter):
 
         Notes
         -----
-        Creates VRT object with VRT-file and RAW-file. Adds band to the self.vrt.
+        Creates VRT object with VRT-file and reference to the array (or RAW-file).
+        Adds band to the self.vrt. The array is kept alive by the VRT object and
+        changes of the array values are visible in the band.
 
         Examples
         --------
@@ -335,6 +684,71 @@ class Nansat(Domain, Exporter):
             self.vrt.band_vrts[vrt.filename] = vrt
 
         band_name = self.vrt.create_bands(band_metadata)
+        self._auto_compact()
+
+    def add_lazy_band(self, func, inputs, dtype='float32', parameters=None, **kwargs):
+        """Add band computed by a Python function only when the band is read
+
+        The function is registered as a GDAL Python pixel function (see nansat.lazy) and the band
+        is added as VRTDerivedRasterBand with sources from the <inputs> bands. No data is read or
+        computed when the band is added. GDAL calls the function block by block whenever pixels
+        of the band are requested (e.g. by __getitem__, read_window, reproject or export), and
+        only for the requested blocks.
+
+        Parameters
+        -----------
+        func : callable
+            function that accepts input arrays (one per band in <inputs>, in the same order) and
+            keyword arguments and returns array of the same shape as the input arrays
+        inputs : list of str or int
+            names or numbers of the bands used as input for <func>
+        dtype : str or numpy.dtype
+            data type of the new band
+        parameters : dict
+            band metadata: wkv, name, etc.
+        **kwargs : dict
+            keyword arguments for <func>
+
+        Notes
+        -----
+        Requires GDAL >= 2.2 built with Python support. The reference to <func> (and the objects
+        it refers to) is kept until the VRT with the lazy band (and all its copies) is closed.
+
+        Examples
+        --------
+            >>> n.add_lazy_band(lambda dn, s0: s0 / dn ** 2, ['DN_HH', 'sigma0_HH'],
+            ...                 parameters={'name': 'calib_HH'})
+            >>> n.add_lazy_band(np.clip, ['sigma0_HH'], a_min=0, a_max=1)
+
+        """
+        dtype = np.dtype(dtype).name
+        if dtype not in numpy_to_gdal_type:
+            raise ValueError('Data type %s is not supported' % dtype)
+        if parameters is None:
+            parameters = {}
+        band_numbers = [self.get_band_number(band_id) for band_id in inputs]
+        input_types = [gdal_type_to_numpy[gdal.GetDataTypeName(
+                       self.vrt.dataset.GetRasterBand(band_number).DataType)]
+                       for band_number in band_numbers]
+        transfer_type = np.result_type(*input_types).name
+
+        self.vrt = self.vrt.get_super_vrt()
+        src = [{'SourceFilename': self.vrt.vrt.filename, 'SourceBand': band_number}
+               for band_number in band_numbers]
+        lazy_function = lazy.register(func, kwargs)
+        self.vrt.lazy_functions.append(lazy_function)
+        dst = dict(parameters)
+        dst.update({
+            'dataType': gdal.GetDataTypeByName(numpy_to_gdal_type[dtype]),
+            'PixelFunctionType': lazy_function.name,
+            'PixelFunctionLanguage': 'Python',
+        })
+        if transfer_type in numpy_to_gdal_type:
+            dst['SourceTransferType'] = numpy_to_gdal_type[transfer_type]
+        band_name = self.vrt.create_band(src, dst)
+        self.vrt.dataset.FlushCache()
+        self._auto_compact()
+        return band_name
 
     def bands(self):
         """Make a dictionary with all metadata from all bands
@@ -345,11 +759,9 @@ class Nansat(Domain, Exporter):
             key = N, value = dict with all band metadata
 
         """
-        band_metadata = {}
-        for band_num in range(self.vrt.dataset.RasterCount):
-            band_metadata[band_num + 1] = self.get_metadata(band_id=band_num + 1)
-
-        return band_metadata
+        band_index = self.vrt.band_index
+        return dict([(band_num, dict(band_index['metadata'][band_num]))
+                     for band_num in band_index['metadata']])
 
     def has_band(self, band):
         """Check if self has band with name <band>
@@ -363,12 +775,8 @@ class Nansat(Domain, Exporter):
             True/False if band exists or not
 
         """
-        for band_num in self.bands():
-            band_meta = self.bands()[band_num]
-            if band_meta['name'] == band:
-                return True
-            elif 'standard_name' in band_meta and band_meta['standard_name'] == band:
-                return True
+        band_index = self.vrt.band_index
+        return band in band_index['name'] or band in band_index['standard_name']
 
     def _get_resize_shape(self, factor, width, height, dst_pixel_size):
         """Estimate new shape either from factor or destination width/height or pixel size"""
@@ -454,6 +862,7 @@ class Nansat(Domain, Exporter):
         subMetaData = self.vrt.vrt.dataset.GetMetadata()
         subMetaData.pop('filename')
         self.set_metadata(subMetaData)
+        self._auto_compact()
 
         return factor
 
@@ -485,6 +894,10 @@ class Nansat(Domain, Exporter):
         # the GDAL RasterBand of the corresponding band is returned
         return self.vrt.dataset.GetRasterBand(bandNumber)
 
+    def _get_raster_band(self, band_id):
+        """Get GDALRasterBand for reading only (cached XML of the VRT is kept)"""
+        return self.vrt._dataset_readonly.GetRasterBand(self.get_band_number(band_id))
+
     def list_bands(self, do_print=True):
         """Show band information of the given Nansat object
 
@@ -519,8 +932,9 @@ class Nansat(Domain, Exporter):
             return outString
 
     def reproject(self, dst_domain=None, resample_alg=0,
-                  block_size=None, tps=None, skip_gcps=1, addmask=True,
-                  **kwargs):
+                  block_size=None, tps=None, skip_gcps=1, addmask=True, performance=None,
+                  num_threads=None, warp_memory_mb=None, engine='gdal', gcp_tolerance=None,
+                  skip_if_disjoint=False, **kwargs):
         """
         Change projection of the object based on the given Domain
 
@@ -556,9 +970,38 @@ class Nansat(Domain, Exporter):
             If not given explicitly, 'skip_gcps' is fetched from the
             metadata of self, or from dst_domain (as set by mapper or user).
             [defaults to 1 if not specified, i.e. using all GCPs]
+        gcp_tolerance : float
+            Instead of uniform thinning with skip_gcps, use the smallest subset of GCPs
+            whose TPS (or polynomial) fit reproduces all GCPs within <gcp_tolerance> pixels.
+            The subset is cached and reused by repeated reprojections.
         addmask : bool
             If True, add band 'swathmask'. 1 - valid data, 0 no-data.
             This band is used to replace no-data values with np.nan
+        performance : str or dict
+            name of profile or dict with settings 'threads' and 'warp_memory_mb' written into
+            the warped VRT (see nansat.config.get_warp_settings). Warping is done when data
+            is read, so other settings (e.g. 'cache_mb') raise ValueError and should be
+            applied with nansat.config.performance when data is read. Settings of a profile
+            other than 'threads' and 'warp_memory_mb' are ignored.
+        num_threads : int or str
+            number of threads used by GDAL for warping, e.g. 4 or 'ALL_CPUS'.
+            If not given, setting 'threads' of <performance>, of nansat.config.performance
+            or 'ALL_CPUS' is used.
+        warp_memory_mb : int
+            memory limit for warping in MB. Larger value allows warping larger chunks in
+            parallel. If not given, setting 'warp_memory_mb' of <performance>, of
+            nansat.config.performance or the GDAL default (64 MB) is used.
+        engine : str
+            'gdal' - warping by GDAL (GCPs, TPS, geolocation arrays or geotransform),
+            'kdtree' - resampling of all bands with KD-tree of longitudes and latitudes of self
+            (see nansat.resampling.KDTreeResampler, requires scipy). Options of KDTreeResampler
+            (method, radius_of_influence, neighbours, sigma, chunk_size, workers) are given in
+            **kwargs. resample_alg, block_size, tps, skip_gcps and gcp_tolerance are ignored.
+            warp_memory_mb limits memory used for caching neighbours of destination pixels.
+        skip_if_disjoint : bool
+            If True, footprints of self and dst_domain are compared before warping (see
+            Domain.is_disjoint) and NansatDisjointError is raised without warping if they
+            do not intersect. Self is not changed in that case.
 
         Notes
         -----
@@ -572,10 +1015,41 @@ class Nansat(Domain, Exporter):
         http://www.gdal.org/gdalwarp.html
 
         """
-        # This is time consuming and therefore not done...:
-        #if not self.overlaps(dst_domain):
-        #    raise ValueError('Source and destination domains do not overlap')
+        if engine not in ['gdal', 'kdtree']:
+            raise ValueError('Unknown reprojection engine %s. Use gdal or kdtree' % engine)
 
+        if skip_if_disjoint and self.is_disjoint(dst_domain):
+            raise NansatDisjointError('Source and destination domains do not overlap')
+
+        if engine == 'kdtree':
+            if warp_memory_mb is None:
+                warp_memory_mb = config.get_warp_settings(performance).get('warp_memory_mb')
+            self._reproject_kdtree(dst_domain, addmask, warp_memory_mb, **kwargs)
+            return
+
+        self.vrt = self._get_warped_vrt(dst_domain, resample_alg, block_size, tps, skip_gcps,
+                                        addmask, performance, num_threads, warp_memory_mb,
+                                        gcp_tolerance, **kwargs)
+
+        # set global metadata from subVRT
+        subMetaData = self.vrt.vrt.dataset.GetMetadata()
+        subMetaData.pop('filename')
+        self.set_metadata(subMetaData)
+        self._auto_compact()
+
+    def _get_warped_vrt(self, dst_domain, resample_alg=0, block_size=None, tps=None,
+                        skip_gcps=1, addmask=True, performance=None, num_threads=None,
+                        warp_memory_mb=None, gcp_tolerance=None, **kwargs):
+        """Create warped VRT from self.vrt on the <dst_domain> (see reproject) without
+        modifying self.vrt"""
+        # warping is done when data is read: only settings written into the VRT apply
+        warp_settings = config.get_warp_settings(performance)
+        if num_threads is None:
+            num_threads = warp_settings.get('threads')
+        if warp_memory_mb is None:
+            warp_memory_mb = warp_settings.get('warp_memory_mb')
+
+        vrt = self.vrt
         # if self spans from 0 to 360 AND dst_domain is west of 0:
         #     shift self westwards by 180 degrees
         # check span
@@ -585,7 +1059,7 @@ class Nansat(Domain, Exporter):
             dstCorners = dst_domain.get_corners()
             if min(dstCorners[0]) < 0:
                 # shift
-                self.vrt = self.vrt.get_shifted_vrt(-180)
+                vrt = vrt.get_shifted_vrt(-180)
 
         # get projection of destination dataset
         dstSRS = dst_domain.vrt.dataset.GetProjection()
@@ -601,15 +1075,9 @@ class Nansat(Domain, Exporter):
 
         geoTransform = dst_domain.vrt.dataset.GetGeoTransform()
 
-        # set trigger for using TPS
-        if tps is True:
-            self.vrt.tps = True
-        elif tps is False:
-            self.vrt.tps = False
-
         # Reduce number of GCPs for faster reprojection
         # when using TPS (if requested)
-        src_skip_gcps = self.vrt.dataset.GetMetadataItem('skip_gcps')
+        src_skip_gcps = vrt.dataset.GetMetadataItem('skip_gcps')
         dst_skip_gcps = dst_domain.vrt.dataset.GetMetadataItem('skip_gcps')
         kwargs['skip_gcps'] = skip_gcps  # default (use all GCPs)
         if dst_skip_gcps is not None:  # ...or use setting from dst
@@ -621,9 +1089,9 @@ class Nansat(Domain, Exporter):
         # after reproject
         # TODD: REFACTOR: replace with VRT._add_swath_mask_band
         if addmask:
-            self.vrt = self.vrt.get_super_vrt()
+            vrt = vrt.get_super_vrt()
             src = [{
-                'SourceFilename': self.vrt.vrt.filename,
+                'SourceFilename': vrt.vrt.filename,
                 'SourceBand':  1,
                 'DataType': gdal.GDT_Byte
             }]
@@ -632,19 +1100,347 @@ class Nansat(Domain, Exporter):
                 'wkv': 'swath_binary_mask',
                 'PixelFunctionType': 'OnesPixelFunc',
             }
-            self.vrt.create_band(src=src, dst=dst)
-            self.vrt.dataset.FlushCache()
+            vrt.create_band(src=src, dst=dst)
+            vrt.dataset.FlushCache()
+
+        # set trigger for using TPS only while the warped VRT is created
+        # (vrt can be self.vrt which should not be modified)
+        vrt_tps = vrt.tps
+        if tps is True:
+            vrt.tps = True
+        elif tps is False:
+            vrt.tps = False
 
         # create Warped VRT
-        self.vrt = self.vrt.get_warped_vrt(dstSRS, x_size, y_size, geoTransform,
-                                           resample_alg=resample_alg,
-                                           dst_gcps=dstGCPs,
-                                           block_size=block_size, **kwargs)
+        try:
+            return vrt.get_warped_vrt(dstSRS, x_size, y_size, geoTransform,
+                                      resample_alg=resample_alg,
+                                      dst_gcps=dstGCPs,
+                                      block_size=block_size,
+                                      num_threads=num_threads,
+                                      warp_memory_mb=warp_memory_mb,
+                                      gcp_tolerance=gcp_tolerance, **kwargs)
+        finally:
+            vrt.tps = vrt_tps
+
+    def reproject_to_file(self, dst_domain, filename, bands=None, driver='GTiff', tile=1024,
+                          workers=1, options=None, **kwargs):
+        """Reproject bands onto <dst_domain> tile by tile and write them directly into file
+
+        The warped VRT is created once (as in reproject, self is not changed). Destination
+        is split into square tiles which are warped independently by GDAL (by <workers>
+        threads, each with own dataset handle) and written into the file as soon as they are
+        ready. At most <workers> tiles are kept in memory. Tiles outside the footprint of
+        self (see Domain.is_disjoint) and tiles without valid data are not written and
+        remain nodata (NaN for float bands, _FillValue or 0 for integer bands).
 
-        # set global metadata from subVRT
-        subMetaData = self.vrt.vrt.dataset.GetMetadata()
-        subMetaData.pop('filename')
-        self.set_metadata(subMetaData)
+        Parameters
+        -----------
+        dst_domain : Domain
+            destination Domain (e.g. continental grid too large for reading in memory)
+        filename : str
+            name of output file
+        bands : list of int or str
+            numbers or names of the bands to write. If None, all bands are written.
+        driver : str
+            'GTiff' or 'netCDF' (or other GDAL driver supporting Create)
+        tile : int
+            size of tiles in pixels
+        workers : int
+            number of threads warping tiles
+        options : list of str
+            creation options of the GDAL driver. If None, TILED_FILE_OPTIONS are used.
+        **kwargs : dict
+            parameters of reproject (resample_alg, tps, block_size, gcp_tolerance, etc)
+
+        Examples
+        --------
+            >>> n.reproject_to_file(europe_100m, 'sigma0.tif', ['sigma0_HH'], tile=2048, workers=8)
+
+        """
+        if bands is None:
+            bands = list(range(1, self.vrt.dataset.RasterCount + 1))
+        band_numbers = [self.get_band_number(band_id) for band_id in bands]
+        band_metadatas = [self.vrt.dataset.GetRasterBand(band_number).GetMetadata()
+                          for band_number in band_numbers]
+        for band_number, band_metadata in zip(band_numbers, band_metadatas):
+            if band_metadata.get('expression', '') != '':
+                raise ValueError('Band %d with expression cannot be reprojected to file' %
+                                 band_number)
+
+        kwargs['addmask'] = True
+        warped_vrt = self._get_warped_vrt(dst_domain, **kwargs)
+        mask_number = warped_vrt.dataset.RasterCount
+        dtypes = [np.dtype(gdal_type_to_numpy[gdal.GetDataTypeName(
+                  warped_vrt.dataset.GetRasterBand(band_number).DataType)])
+                  for band_number in band_numbers]
+        nodata_values = [np.nan if dtype.char in np.typecodes['AllFloat'] else
+                         float(band_metadata.get('_FillValue', 0))
+                         for dtype, band_metadata in zip(dtypes, band_metadatas)]
+
+        dataset = self._create_tiled_file(dst_domain, filename, driver, tile, options,
+                                          np.result_type(*dtypes).name, len(band_numbers))
+        for i, band_number in enumerate(band_numbers):
+            band = dataset.GetRasterBand(i + 1)
+            parameters = self._get_band_parameters(band_number)
+            band.SetMetadata(parameters)
+            band.SetDescription(str(parameters.get('name', '')))
+            band.SetNoDataValue(nodata_values[i])
+
+        windows = self._get_tile_windows(dst_domain, tile)
+        thread_data = threading.local()
+        handles = []
+
+        def read_tile(window):
+            """Warp one tile in a thread, return swath mask and bands or None if tile is empty"""
+            if workers == 1:
+                src_dataset = warped_vrt.dataset
+            else:
+                if not hasattr(thread_data, 'dataset'):
+                    thread_data.dataset = gdal.Open(warped_vrt.filename)
+                    handles.append(thread_data.dataset)
+                src_dataset = thread_data.dataset
+            mask = src_dataset.GetRasterBand(mask_number).ReadAsArray(*window)
+            if mask is None:
+                raise NansatGDALError('Cannot read tile %s from %s' % (str(window), self.filename))
+            if not mask.any():
+                return None
+            arrays = []
+            for band_number, band_metadata in zip(band_numbers, band_metadatas):
+                array = src_dataset.GetRasterBand(band_number).ReadAsArray(*window)
+                if array is None:
+                    raise NansatGDALError('Cannot read tile %s from %s' % (str(window),
+                                                                          self.filename))
+                arrays.append(self._postprocess_band(band_metadata, array, mask))
+            return mask, arrays
+
+        pool = ThreadPool(workers) if workers > 1 else None
+        n_written = 0
+        try:
+            for i in range(0, len(windows), workers):
+                batch = windows[i:i + workers]
+                if pool is None:
+                    tiles = [read_tile(window) for window in batch]
+                else:
+                    tiles = pool.map(read_tile, batch)
+                for window, tile_data in zip(batch, tiles):
+                    if tile_data is None:
+                        continue
+                    mask, arrays = tile_data
+                    for j, array in enumerate(arrays):
+                        if not np.isnan(nodata_values[j]):
+                            array[mask == 0] = nodata_values[j]
+                        dataset.GetRasterBand(j + 1).WriteArray(array, window[0], window[1])
+                    n_written += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            del handles[:]
+            dataset = None
+        self.logger.info('%d tiles of %d written to %s' % (n_written, len(windows), filename))
+
+    def _create_tiled_file(self, dst_domain, filename, driver, tile, options, dtype, n_bands):
+        """Create empty GDAL dataset with georeference of <dst_domain> for writing tiles"""
+        if options is None:
+            options = list(self.TILED_FILE_OPTIONS.get(driver, []))
+            if driver == 'GTiff' and tile % 16 == 0:
+                options += ['BLOCKXSIZE=%d' % tile, 'BLOCKYSIZE=%d' % tile]
+        gdal_driver = gdal.GetDriverByName(str(driver))
+        if gdal_driver is None:
+            raise ValueError('Unknown GDAL driver %s' % driver)
+        dataset = gdal_driver.Create(filename, dst_domain.vrt.dataset.RasterXSize,
+                                     dst_domain.vrt.dataset.RasterYSize, n_bands,
+                                     gdal.GetDataTypeByName(numpy_to_gdal_type[dtype]),
+                                     [str(option) for option in options])
+        if dataset is None:
+            raise NansatGDALError('Cannot create %s with driver %s' % (filename, driver))
+        dst_gcps = dst_domain.vrt.dataset.GetGCPs()
+        if len(dst_gcps) > 0:
+            dataset.SetGCPs(dst_gcps, dst_domain.vrt.dataset.GetGCPProjection())
+        else:
+            dataset.SetGeoTransform(dst_domain.vrt.dataset.GetGeoTransform())
+            dataset.SetProjection(dst_domain.vrt.dataset.GetProjection())
+        dataset.SetMetadata(remove_keys(self.vrt.dataset.GetMetadata(), ['filename']))
+        return dataset
+
+    def _get_tile_windows(self, dst_domain, tile, n_points=10):
+        """Return windows (x_offset, y_offset, x_size, y_size) of tiles of <dst_domain>
+        which intersect footprint of self (all tiles if <dst_domain> has GCPs)
+
+        Borders of all tiles (<n_points> on each side) are transformed to lon/lat at once.
+        Envelopes of tiles are compared with the envelope of the footprint of self, and border
+        polygons are intersected only for tiles with intersecting envelopes.
+
+        """
+        y_size, x_size = dst_domain.shape()
+        windows = [(x_offset, y_offset, min(tile, x_size - x_offset), min(tile, y_size - y_offset))
+                   for y_offset in range(0, y_size, tile)
+                   for x_offset in range(0, x_size, tile)]
+        footprint = self._get_footprint()
+        if len(dst_domain.vrt.dataset.GetGCPs()) > 0 or footprint is None:
+            return windows
+
+        # pixel/line coordinates of borders of all tiles (one row per tile)
+        steps = np.arange(n_points) / float(n_points)
+        border_x = np.hstack([steps, np.ones(n_points), 1 - steps, np.zeros(n_points)])
+        border_y = np.hstack([np.zeros(n_points), steps, np.ones(n_points), 1 - steps])
+        x_offset, y_offset, x_tile, y_tile = [np.array(values, dtype=np.float64)[:, None]
+                                              for values in zip(*windows)]
+        lon, lat = dst_domain.transform_points((x_offset + x_tile * border_x).ravel(),
+                                               (y_offset + y_tile * border_y).ravel())
+        lon = np.array(lon, dtype=np.float64).reshape(len(windows), -1)
+        lat = np.array(lat, dtype=np.float64).reshape(len(windows), -1)
+
+        tile_windows = []
+        for window, tile_lon, tile_lat in zip(windows, lon, lat):
+            if np.diff(tile_lon).max() > 100:
+                # tile crosses dateline (as in Domain.get_border)
+                tile_lon[tile_lon < 0] += 360
+            envelope = Domain._envelope_from_border(tile_lon, tile_lat)[0]
+            if not Domain._get_envelope_shifts(footprint['envelope'], envelope):
+                continue
+            tile_footprint = Domain._footprint_from_border(tile_lon, tile_lat)
+            if (tile_footprint is not None and
+                    Domain._footprints_are_disjoint(footprint, tile_footprint)):
+                continue
+            tile_windows.append(window)
+        return tile_windows
+
+    def apply_resampling_index(self, index, bands=None, dst_domain=None, fill_value=np.nan):
+        """Resample bands onto destination grid using precomputed index
+
+        Each band is read and resampled by NumPy indexing with the mapping computed by
+        Domain.build_resampling_index. No GDAL transformer is created. Expression, fill
+        values and other corrections of bands are applied before resampling (as in n[band]).
+
+        Parameters
+        -----------
+        index : ResamplingIndex
+            resampling index (e.g. from Domain.build_resampling_index or ResamplingIndex.load)
+        bands : list of int or str
+            numbers or names of the bands to resample. If None, all bands are resampled.
+        dst_domain : Domain
+            destination Domain. If None, it is created from georeference kept in <index>
+        fill_value : float
+            value of pixels outside of self
+
+        Returns
+        --------
+        n : Nansat
+            new object on the destination grid with resampled bands and metadata of self
+
+        Examples
+        --------
+            >>> index = dst_domain.build_resampling_index(n, method='bilinear')
+            >>> n_dst = n.apply_resampling_index(index, ['sigma0_HH', 'sigma0_HV'], dst_domain)
+
+        """
+        if self.shape() != index.src_shape:
+            raise ValueError('Shape of %s %s does not match source shape of the index %s' %
+                             (self.filename, str(self.shape()), str(index.src_shape)))
+        if dst_domain is None:
+            dst_domain = Domain(ds=index.get_dst_vrt().dataset)
+        if bands is None:
+            bands = list(range(1, self.vrt.dataset.RasterCount + 1))
+
+        arrays, parameters = [], []
+        for band_id in bands:
+            arrays.append(index.apply(self[band_id], fill_value))
+            parameters.append(self._get_band_parameters(band_id))
+
+        n = Nansat.from_domain(dst_domain, log_level=self.logger.level)
+        n.set_metadata(remove_keys(self.get_metadata(), ['filename']))
+        n.add_bands(arrays, parameters)
+        return n
+
+    def _reproject_kdtree(self, dst_domain, addmask=True, warp_memory_mb=None, **kwargs):
+        """Resample all bands onto <dst_domain> with KDTreeResampler and replace self.vrt
+
+        Source bands are read one by one and the destination is filled in blocks of rows
+        (about <chunk_size> pixels). Neighbours found for each block are cached and reused
+        for all bands while their size is within <warp_memory_mb> (or setting
+        'warp_memory_mb' of nansat.config.performance, 64 MB by default); otherwise they are
+        found again for each band. An existing 'swathmask' band is not resampled as data: it
+        is replaced by the new swathmask computed from it.
+        The new VRT keeps self.vrt as sub-VRT, so undo() restores the original object.
+
+        """
+        src_lon, src_lat = self.get_geolocation_grids()
+        resampler = KDTreeResampler(src_lon, src_lat, **kwargs)
+        del src_lon, src_lat
+
+        if warp_memory_mb is None:
+            warp_memory_mb = config.get_setting('warp_memory_mb', 64)
+        dst_shape = dst_domain.shape()
+        rows_per_block = max(1, resampler.chunk_size // dst_shape[1])
+        blocks = [(row, min(rows_per_block, dst_shape[0] - row))
+                  for row in range(0, dst_shape[0], rows_per_block)]
+        neighbours = {}
+
+        def get_neighbours(block):
+            """Return index and weights of neighbours for the block of destination rows"""
+            if block in neighbours:
+                return neighbours[block]
+            dst_lon, dst_lat = dst_domain._get_window_geolocation_grids(
+                0, block[0], dst_shape[1], block[1])
+            index, weights = resampler.query(dst_lon, dst_lat)
+            cached_bytes = sum(index.nbytes + weights.nbytes
+                               for index, weights in neighbours.values())
+            if cached_bytes + index.nbytes + weights.nbytes <= warp_memory_mb * 1024**2:
+                neighbours[block] = index, weights
+            return index, weights
+
+        def resample_band(array, fill_value):
+            """Resample one source band block by block"""
+            src_values = resampler.get_src_values(array)
+            dst_array = np.empty(dst_shape, resampler.get_dst_type(src_values.dtype, fill_value))
+            for block in blocks:
+                index, weights = get_neighbours(block)
+                dst_array[block[0]:block[0] + block[1]] = resampler.apply(
+                    src_values, index, weights, fill_value).reshape(block[1], dst_shape[1])
+            return dst_array
+
+        swathmask_number = None
+        if self.has_band('swathmask'):
+            swathmask_number = self.get_band_number('swathmask')
+        band_ids = [band_id for band_id in range(1, self.vrt.dataset.RasterCount + 1)
+                    if band_id != swathmask_number]
+        band_vrts, parameters = [], []
+        for band_id in band_ids:
+            band_vrts.append(VRT.from_array(resample_band(self[band_id], np.nan)))
+            parameters.append(self._get_band_parameters(band_id))
+        if addmask or swathmask_number is not None:
+            if swathmask_number is None:
+                src_mask = np.ones(self.shape(), np.uint8)
+            else:
+                src_mask = self[swathmask_number]
+            dst_mask = (resample_band(src_mask, 0) > 0).astype(np.uint8)
+            band_vrts.append(VRT.from_array(dst_mask))
+            parameters.append({'wkv': 'swath_binary_mask'})
+
+        metadata = self.vrt.dataset.GetMetadata()
+        metadata.pop('filename', None)
+        dst_vrt = VRT.from_gdal_dataset(dst_domain.vrt.dataset,
+                                        geolocation=dst_domain.vrt.geolocation,
+                                        metadata=metadata)
+        band_metadata = []
+        for band_vrt, parameter in zip(band_vrts, parameters):
+            band_metadata.append({
+                'src': {'SourceFilename': band_vrt.filename, 'SourceBand': 1},
+                'dst': parameter
+                })
+            dst_vrt.band_vrts[band_vrt.filename] = band_vrt
+        dst_vrt.create_bands(band_metadata)
+        dst_vrt.vrt = self.vrt
+        self.vrt = dst_vrt
+        self._auto_compact()
+
+    def _get_band_parameters(self, band_id):
+        """Return metadata of band without keys describing the source of the band"""
+        return remove_keys(self.get_metadata(band_id=band_id),
+                           ['SourceFilename', 'SourceBand', 'dataType',
+                            'PixelFunctionType', 'expression'])
 
     def undo(self, steps=1):
         """Undo reproject, resize, add_band or crop of Nansat object
@@ -656,12 +1452,55 @@ class Nansat(Domain, Exporter):
         steps : int
             How many steps back to undo
 
+        Notes
+        ------
+        Modifies self.vrt. The restored VRT is a copy of the sub-VRT because the sub-VRTs
+        may be shared and should not be modified.
+
+        """
+        sub_vrt = self.vrt.get_sub_vrt(steps)
+        if sub_vrt is not self.vrt:
+            sub_vrt = sub_vrt.copy()
+        self.vrt = sub_vrt
+
+    def compact(self):
+        """Compact VRT: let bands read data through the minimal number of VRT levels
+
+        After a chain of operations (e.g. crop, add_band, resize, reproject) reading of each pixel
+        goes through all levels of the VRT history. Consecutive crops and subsamplings and
+        pass-through levels are folded into one source of each band (see VRT.get_compacted_vrt).
+        The history is kept and undo works as before. Use self.vrt.get_chain_info() to see depth
+        of the history and number of VRT files read for one pixel.
+
+        Compaction is done automatically after every AUTO_COMPACT_DEPTH operations if
+        Nansat.AUTO_COMPACT_DEPTH is set to an integer.
+
         Notes
         ------
         Modifies self.vrt
 
+        Examples
+        --------
+            >>> n.crop(10, 10, 100, 100)
+            >>> n.resize(0.5, resample_alg=0)
+            >>> n.compact()
+            >>> n.vrt.get_chain_info()['read_depth']
+
         """
-        self.vrt = self.vrt.get_sub_vrt(steps)
+        self.vrt = self.vrt.get_compacted_vrt()
+
+    def _auto_compact(self):
+        """Compact self.vrt if AUTO_COMPACT_DEPTH operations were done since last compaction"""
+        if self.AUTO_COMPACT_DEPTH is None:
+            return
+        chain = self.vrt.get_chain()
+        n_operations = len(chain) - 1
+        for i, vrt in enumerate(chain):
+            if vrt._compacted:
+                n_operations = i
+                break
+        if n_operations >= self.AUTO_COMPACT_DEPTH:
+            self.compact()
 
     def watermask(self, mod44path=None, dst_domain=None, **kwargs):
         """
@@ -813,18 +1652,9 @@ class Nansat(Domain, Exporter):
             bands = [self.get_band_number(bands)]
 
         # == create 3D ARRAY ==
-        array = None
-        for band in bands:
-            # get array from band and reshape to (1,height,width)
-            iArray = self[band]
-            if array_modfunc:
-                iArray = array_modfunc(iArray)
-            iArray = iArray.reshape(1, iArray.shape[0], iArray.shape[1])
-            # create new 3D array or append band
-            if array is None:
-                array = iArray
-            else:
-                array = np.append(array, iArray, axis=0)
+        array = self.read_bands(bands)
+        if array_modfunc:
+            array = np.array([array_modfunc(band_array) for band_array in array])
 
         # == CREATE FIGURE object and parse input parameters ==
         fig = Figure(array, **kwargs)
@@ -986,9 +1816,9 @@ class Nansat(Domain, Exporter):
         """
         # get all metadata from dataset or from band
         if band_id is None:
-            metadata = self.vrt.dataset.GetMetadata()
+            metadata = self.vrt._dataset_readonly.GetMetadata()
         else:
-            metadata = self.get_GDALRasterBand(band_id).GetMetadata()
+            metadata = self._get_raster_band(band_id).GetMetadata()
 
         # remove escapes of special characters
         if unescape:
@@ -1036,6 +1866,9 @@ class Nansat(Domain, Exporter):
         else:
             metadata_receiver.SetMetadataItem(str(key), str(value))
 
+        if band_id is not None:
+            self.vrt.invalidate_band_index()
+
     def _get_dataset_metadata(self):
         # open GDAL dataset. It will be parsed to all mappers for testing
         gdal_dataset, metadata = None, dict()
@@ -1187,32 +2020,41 @@ class Nansat(Domain, Exporter):
         if type(band_id) == str:
             band_id = {'name': band_id}
 
-        # if band_id is dict: search self.bands with seraching criteria
         if type(band_id) == dict:
-            bands_meta = self.bands()
-            for b in bands_meta:
-                num_correct_keys = 0
-                for key in band_id:
-                    if (key in bands_meta[b] and
-                            band_id[key] == bands_meta[b][key]):
-                        num_correct_keys = num_correct_keys + 1
-                    if num_correct_keys == len(band_id):
-                        band_number = b
-                        break
+            band_number = self._search_band_index(band_id)
+            # band metadata could have been changed directly in the dataset:
+            # rebuild the index and search again before raising error
+            if band_number == 0:
+                self.vrt.invalidate_band_index()
+                band_number = self._search_band_index(band_id)
 
         # if band_id is int and with bounds: return this number
         if (type(band_id) == int and band_id >= 1 and
-                band_id <= self.vrt.dataset.RasterCount):
+                band_id <= self.vrt._dataset_readonly.RasterCount):
             band_number = band_id
 
         # if no band_number found - raise error
         if band_number == 0:
             raise ValueError('Cannot find band %s! '
                               'band_number is from 1 to %s'
-                              % (str(band_id), self.vrt.dataset.RasterCount))
+                              % (str(band_id), self.vrt._dataset_readonly.RasterCount))
 
         return band_number
 
+    def _search_band_index(self, band_id):
+        """Return number of band with metadata from <band_id> (dict) or 0 if not found"""
+        # if band_id is dict with name only: get number from the band index
+        if list(band_id.keys()) == ['name']:
+            return self.vrt.band_index['name'].get(band_id['name'], 0)
+        # if band_id is dict: search band metadata with seraching criteria
+        band_number = 0
+        bands_meta = self.vrt.band_index['metadata']
+        for b in bands_meta:
+            if all(key in bands_meta[b] and band_id[key] == bands_meta[b][key]
+                   for key in band_id):
+                band_number = b
+        return band_number
+
     def get_transect(self, points, bands,
                         lonlat=True,
                         smooth_radius=0,
@@ -1490,10 +2332,13 @@ class Nansat(Domain, Exporter):
 
         # create super VRT and change it
         self.vrt = self.vrt.get_super_vrt()
+        self.vrt.begin_xml_edit()
         self.vrt.set_offset_size('x', x_offset, x_size)
         self.vrt.set_offset_size('y', y_offset, y_size)
+        self.vrt.commit_xml_edit()
         self.vrt.shift_cropped_gcps(x_offset, x_size, y_offset, y_size)
         self.vrt.shift_cropped_geo_transform(x_offset, x_size, y_offset, y_size)
+        self._auto_compact()
         return extent
 
     def extend(self, left=0, right=0, top=0, bottom=0):
@@ -1551,6 +2396,24 @@ class Nansat(Domain, Exporter):
         return pixVector[gpi], linVector[gpi]
 
 
+class _WindowReader(object):
+    """Proxy for Nansat object which reads bands over a given window
+
+    Used in evaluation of band expressions when only a window is read
+
+    """
+    def __init__(self, nansat, window, buf_shape=None):
+        self.nansat = nansat
+        self.window = window
+        self.buf_shape = buf_shape
+
+    def __getitem__(self, band_id):
+        return self.nansat.read_window(band_id, *self.window, buf_shape=self.buf_shape)
+
+    def __getattr__(self, name):
+        return getattr(self.nansat, name)
+
+
 def _import_mappers(log_level=None):
     """Import available mappers into a dictionary
 
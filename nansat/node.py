@@ -17,9 +17,19 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
 from __future__ import unicode_literals
 
+import io
 import os
 import re
 import xml.dom.minidom as xdm
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# namespace which is bound to the prefix 'xml' by definition
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+# characters replaced by rawxml()
+ESCAPE_ENTITIES = [('&', '&amp;'), ('<', '&lt;'), ('"', '&quot;'), ('>', '&gt;')]
 
 
 class Node(object):
@@ -65,9 +75,13 @@ class Node(object):
     specific language' by subclassing Node to create Node types
     specific to your problem domain.
 
-    This implementation uses xml.dom.minidom which is available
-    in the standard Python 2.4 library. However, it can be
-    retargeted to use other XML libraries without much effort.
+    XML is parsed with xml.etree (iterparse) and written by rawxml()
+    directly from the Node objects, without building a DOM. Namespace
+    prefixes and xmlns attributes are kept as in the input text. Edits of
+    tags, attributes and values are done in place on the Node objects and
+    the XML is serialized only once, when rawxml() is called.
+    xml.dom.minidom is used only for pretty printing (xml()) and for
+    Nodes created from a DOM.
 
     """
 
@@ -206,11 +220,9 @@ class Node(object):
 
     def insert(self, contents):
         ''' return Node of the node with inserted <contents>'''
-        dom2 = xdm.parseString(contents)
-        dom1 = xdm.parseString(self.dom().toxml())
-        dom1.childNodes[0].appendChild(dom1.importNode(dom2.childNodes[0],
-                                                       True))
-        return Node.create(dom1)
+        node = Node._parse(self.rawxml())
+        node += Node._parse(contents)
+        return node
 
     def __getitem__(self, tag):
         '''
@@ -286,26 +298,39 @@ class Node(object):
         return self.dom().toprettyxml(separator)
 
     def rawxml(self):
-        return str(self.dom().toxml())
+        """ Return XML of this node without formatting (same as self.dom().toxml()) """
+        chunks = []
+        self._write_xml(chunks)
+        return str(''.join(chunks))
+
+    def _write_xml(self, chunks):
+        """ Append XML of this node to the list of strings <chunks> """
+        chunks.append('<' + self.tag)
+        for key, val in self.attributes.items():
+            chunks.append(' %s="%s"' % (key, _escape(val)))
+        if not self.value and not self.children:
+            chunks.append('/>')
+            return
+        chunks.append('>')
+        if self.value:
+            chunks.append(_escape(self.value))
+        for child in self.children:
+            child._write_xml(chunks)
+        chunks.append('</%s>' % self.tag)
 
     @staticmethod
     def create(dom):
         """
         Create a Node representation, given either
-        a string representation of an XML doc, or a dom.
+        a string representation of an XML doc, a name of XML file, or a dom.
 
         """
         if isinstance(dom, str):
             if os.path.exists(dom):
                 # parse input file
-                dom = xdm.parse(dom)
-            else:
-                # Strip all extraneous whitespace so that
-                # text input is handled consistently:
-                dom = re.sub('\s+', ' ', dom)
-                dom = dom.replace('> ', '>')
-                dom = dom.replace(' <', '<')
-                return Node.create(xdm.parseString(str(dom)))
+                with open(dom, 'rb') as xml_file:
+                    return Node._iterparse(xml_file)
+            return Node._parse(dom)
 
         # To pass test for python3, decoding of bytes object is requested
         if dom.nodeType == dom.DOCUMENT_NODE:
@@ -324,3 +349,84 @@ class Node(object):
                 if subnode:
                     node += subnode
         return node
+
+    @staticmethod
+    def _parse(text):
+        """ Create Node from XML text """
+        # Strip all extraneous whitespace so that
+        # text input is handled consistently:
+        text = re.sub(r'\s+', ' ', text)
+        text = text.replace('> ', '>')
+        text = text.replace(' <', '<')
+        # remove XML declaration (text is encoded to UTF-8 below)
+        text = re.sub(r'^ ?<\?xml[^>]*\?>', '', text)
+        return Node._iterparse(io.BytesIO(text.encode('utf-8')))
+
+    @staticmethod
+    def _iterparse(source):
+        """ Create Node from a file-like object with XML
+
+        Tags and attributes are named as in the input: with namespace
+        prefixes (if any), and namespace declarations are kept as xmlns
+        attributes of the elements where they are declared.
+
+        """
+        prefixes = {XML_NAMESPACE: 'xml'}
+        names = {}
+        declarations = []
+        bindings = []
+        parents = []
+        root = None
+        for event, item in ET.iterparse(source, events=('start-ns', 'end-ns', 'start', 'end')):
+            if event == 'start-ns':
+                prefix, uri = item
+                bindings.append((uri, prefixes.get(uri)))
+                prefixes[uri] = prefix
+                declarations.append((('xmlns:' + prefix) if prefix else 'xmlns', uri))
+                # names in this namespace may change
+                names.clear()
+            elif event == 'end-ns':
+                uri, prefix = bindings.pop()
+                if prefix is None:
+                    del prefixes[uri]
+                else:
+                    prefixes[uri] = prefix
+                names.clear()
+            elif event == 'start':
+                node = Node(_get_name(item.tag, prefixes, names))
+                for key, val in declarations:
+                    node.attributes[key] = val
+                declarations = []
+                for key, val in item.attrib.items():
+                    node.attributes[_get_name(key, prefixes, names)] = val
+                if parents:
+                    parents[-1].children.append(node)
+                else:
+                    root = node
+                parents.append(node)
+            else:
+                node = parents.pop()
+                # value is the last text which is not only whitespaces
+                for text in [item.text] + [child.tail for child in item]:
+                    if text and text.strip():
+                        node.value = text
+        return root
+
+
+def _get_name(name, prefixes, names):
+    """ Convert name of tag or attribute from {uri}local to prefix:local """
+    if name[0] != '{':
+        return name
+    if name not in names:
+        uri, local = name[1:].split('}', 1)
+        prefix = prefixes.get(uri)
+        names[name] = ('%s:%s' % (prefix, local)) if prefix else local
+    return names[name]
+
+
+def _escape(text):
+    """ Escape text of element or value of attribute in the same way as minidom """
+    for char, entity in ESCAPE_ENTITIES:
+        if char in text:
+            text = text.replace(char, entity)
+    return text
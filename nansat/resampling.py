@@ -0,0 +1,472 @@
+# Name:         resampling.py
+# Purpose:      Reusable lookup table for resampling of swath data onto a grid
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Resampling index: mapping of destination pixels to source pixels computed once
+
+The GDAL transformer (GCP, TPS, geolocation arrays or geotransform) is applied once to all
+pixels of the destination grid. Result is stored as compact arrays (int32 index of the source
+pixel and float32 weights for bilinear interpolation) which can be saved into .npz file and
+applied to any number of bands with vectorized NumPy indexing.
+
+KDTreeResampler finds source pixels near each destination pixel in a KD-tree built on
+Earth-centered (ECEF) coordinates of source longitudes and latitudes. It does not depend on
+GCPs or on the GDAL geolocation transformer and is accurate near the poles and the dateline.
+It requires scipy.
+
+Examples
+--------
+    >>> index = dst_domain.build_resampling_index(n, method='bilinear')
+    >>> index.save('s1_to_arctic.npz')
+    >>> index = ResamplingIndex.load('s1_to_arctic.npz')
+    >>> n_dst = n.apply_resampling_index(index, ['sigma0_HH', 'sigma0_HV'])
+
+    >>> resampler = KDTreeResampler(src_lon, src_lat, method='gauss', radius_of_influence=5000)
+    >>> sst, chl = resampler.resample([src_sst, src_chl], dst_lon, dst_lat)
+
+"""
+from __future__ import absolute_import, division
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    SCIPY_IS_INSTALLED = False
+else:
+    SCIPY_IS_INSTALLED = True
+
+from nansat.nsr import NSR
+from nansat.tools import gdal
+from nansat.vrt import VRT
+
+
+def _get_fill_type(dtype, fill_value):
+    """Return data type which can keep values of <dtype> and <fill_value> (at least float32)"""
+    fill_type = np.result_type(dtype, np.min_scalar_type(fill_value))
+    if fill_type.kind == 'f':
+        fill_type = np.promote_types(fill_type, np.float32)
+    return fill_type
+
+
+class ResamplingIndex(object):
+    """Mapping of destination pixels to source pixels with interpolation weights
+
+    Parameters
+    ----------
+    method : str
+        'nearest' or 'bilinear'
+    src_shape, dst_shape : tuple
+        (rows, cols) of source and destination rasters
+    index : numpy.ndarray
+        int32 array with shape <dst_shape>: number of the source pixel (in the flattened source
+        array) for each destination pixel (top-left neighbour for bilinear). -1 - no data
+    weights : numpy.ndarray
+        float32 array with shape (2,) + <dst_shape>: distance in columns and rows from the pixel
+        <index> (for 'bilinear' only)
+    dst_srs : str
+        WKT of the destination projection (of the GCPs if destination has GCPs)
+    dst_geo_transform : tuple
+        GDAL geotransform of the destination
+    dst_gcps : numpy.ndarray
+        array with (pixel, line, x, y, z) of destination GCPs with shape (N, 5)
+
+    """
+    METHODS = ['nearest', 'bilinear']
+    MAX_POINTS = 2**20
+
+    def __init__(self, method, src_shape, dst_shape, index, weights=None, dst_srs='',
+                 dst_geo_transform=(0., 1., 0., 0., 0., 1.), dst_gcps=None):
+        if method not in self.METHODS:
+            raise ValueError('Unknown resampling method %s. Use one of %s' % (method, self.METHODS))
+        self.method = method
+        self.src_shape = tuple(int(i) for i in src_shape)
+        self.dst_shape = tuple(int(i) for i in dst_shape)
+        self.index = index
+        self.weights = weights
+        self.dst_srs = dst_srs
+        self.dst_geo_transform = tuple(float(i) for i in dst_geo_transform)
+        if dst_gcps is None:
+            dst_gcps = np.zeros((0, 5))
+        self.dst_gcps = dst_gcps
+
+    @classmethod
+    def build(cls, src_vrt, dst_vrt, method='nearest'):
+        """Compute resampling index from source VRT to destination VRT
+
+        Parameters
+        ----------
+        src_vrt : VRT
+            source (e.g. swath with GCPs or geolocation arrays)
+        dst_vrt : VRT
+            destination (e.g. VRT of a Domain)
+        method : str
+            'nearest' or 'bilinear'
+
+        Returns
+        -------
+        index : ResamplingIndex
+
+        """
+        if method not in cls.METHODS:
+            raise ValueError('Unknown resampling method %s. Use one of %s' % (method, cls.METHODS))
+        src_shape = (src_vrt.dataset.RasterYSize, src_vrt.dataset.RasterXSize)
+        dst_shape = (dst_vrt.dataset.RasterYSize, dst_vrt.dataset.RasterXSize)
+        if src_shape[0] * src_shape[1] >= 2**31:
+            raise ValueError('Source raster %s is too large for resampling index' % str(src_shape))
+
+        transformer = cls._get_transformer(src_vrt, dst_vrt)
+        index = np.empty(dst_shape, np.int32)
+        weights = None
+        if method == 'bilinear':
+            weights = np.empty((2,) + dst_shape, np.float32)
+
+        # transform pixel centers of the destination in chunks of rows
+        rows_per_chunk = max(1, cls.MAX_POINTS // dst_shape[1])
+        cols = np.arange(dst_shape[1]) + 0.5
+        for row0 in range(0, dst_shape[0], rows_per_chunk):
+            rows = np.arange(row0, min(row0 + rows_per_chunk, dst_shape[0])) + 0.5
+            dst_x, dst_y = [grid.flatten() for grid in np.meshgrid(cols, rows)]
+            points, success = transformer.TransformPoints(1, np.vstack([dst_x, dst_y]).T)
+            points = np.array(points, dtype=np.float64).reshape(-1, 3)
+            src_x, src_y = points[:, 0], points[:, 1]
+            valid = ((np.array(success, dtype=bool)) &
+                     (src_x >= 0) & (src_x < src_shape[1]) &
+                     (src_y >= 0) & (src_y < src_shape[0]))
+            src_x, src_y = np.where(valid, src_x, 0), np.where(valid, src_y, 0)
+            chunk = slice(row0, row0 + rows.size)
+            if method == 'nearest':
+                chunk_index = cls._get_nearest_index(src_x, src_y, src_shape)
+            else:
+                chunk_index, chunk_weights = cls._get_bilinear_index(src_x, src_y, src_shape)
+                weights[:, chunk] = chunk_weights.reshape((2, rows.size, dst_shape[1]))
+            chunk_index[~valid] = -1
+            index[chunk] = chunk_index.reshape(rows.size, dst_shape[1])
+
+        dst_gcps = np.array([(gcp.GCPPixel, gcp.GCPLine, gcp.GCPX, gcp.GCPY, gcp.GCPZ)
+                             for gcp in dst_vrt.dataset.GetGCPs()]).reshape(-1, 5)
+        return cls(method, src_shape, dst_shape, index, weights,
+                   dst_srs=dst_vrt.get_projection()[0],
+                   dst_geo_transform=dst_vrt.dataset.GetGeoTransform(),
+                   dst_gcps=dst_gcps)
+
+    @staticmethod
+    def _get_transformer(src_vrt, dst_vrt):
+        """Create GDAL transformer from pixel/line of source to pixel/line of destination"""
+        options = ['SRC_SRS=' + src_vrt.get_projection()[0],
+                   'DST_SRS=' + NSR(dst_vrt.get_projection()[0]).wkt]
+        if src_vrt.tps and len(src_vrt.dataset.GetGCPs()) > 0:
+            options.append('METHOD=GCP_TPS')
+        return gdal.Transformer(src_vrt.dataset, dst_vrt.dataset, options)
+
+    @staticmethod
+    def _get_nearest_index(src_x, src_y, src_shape):
+        """Return index of source pixels containing points <src_x>, <src_y>"""
+        cols = np.clip(np.floor(src_x), 0, src_shape[1] - 1).astype(np.int32)
+        rows = np.clip(np.floor(src_y), 0, src_shape[0] - 1).astype(np.int32)
+        return rows * src_shape[1] + cols
+
+    @staticmethod
+    def _get_bilinear_index(src_x, src_y, src_shape):
+        """Return index of top-left neighbours and weights for bilinear interpolation"""
+        weights = []
+        indices = []
+        for coord, size in [(src_x, src_shape[1]), (src_y, src_shape[0])]:
+            # coordinates relative to pixel centers
+            coord = np.clip(coord - 0.5, 0, size - 1)
+            index0 = np.clip(np.floor(coord), 0, max(size - 2, 0)).astype(np.int32)
+            indices.append(index0)
+            weights.append((coord - index0).astype(np.float32))
+        return indices[1] * src_shape[1] + indices[0], np.array(weights)
+
+    def apply(self, array, fill_value=np.nan):
+        """Resample source array onto the destination grid
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            source data with shape <src_shape>
+        fill_value : float
+            value of destination pixels outside the source
+
+        Returns
+        -------
+        dst_array : numpy.ndarray
+            resampled data with shape <dst_shape>. Data type of the input array is kept for
+            'nearest' (unless <fill_value> requires other type). Float is returned for 'bilinear'.
+
+        """
+        if array.shape != self.src_shape:
+            raise ValueError('Shape of array %s does not match source shape %s' %
+                             (str(array.shape), str(self.src_shape)))
+        src_array = array.ravel()
+        valid = self.index >= 0
+        index = np.where(valid, self.index, 0)
+        if self.method == 'nearest':
+            dst_array = src_array[index]
+        else:
+            cols0 = index % self.src_shape[1]
+            rows0 = index // self.src_shape[1]
+            cols1 = np.minimum(cols0 + 1, self.src_shape[1] - 1)
+            rows1 = np.minimum(rows0 + 1, self.src_shape[0] - 1)
+            weight_x, weight_y = self.weights
+            if not np.issubdtype(src_array.dtype, np.floating):
+                src_array = src_array.astype(np.float32)
+            top = (src_array[rows0 * self.src_shape[1] + cols0] * (1 - weight_x) +
+                   src_array[rows0 * self.src_shape[1] + cols1] * weight_x)
+            bottom = (src_array[rows1 * self.src_shape[1] + cols0] * (1 - weight_x) +
+                      src_array[rows1 * self.src_shape[1] + cols1] * weight_x)
+            dst_array = top * (1 - weight_y) + bottom * weight_y
+
+        if not valid.all():
+            dst_array = dst_array.astype(_get_fill_type(dst_array.dtype, fill_value))
+            dst_array[~valid] = fill_value
+        return dst_array
+
+    def get_dst_vrt(self):
+        """Return VRT (without bands) with size and georeference of the destination"""
+        gcps = [gdal.GCP(float(x), float(y), float(z), float(pixel), float(line))
+                for pixel, line, x, y, z in self.dst_gcps]
+        if len(gcps) > 0:
+            return VRT.from_dataset_params(self.dst_shape[1], self.dst_shape[0],
+                                           self.dst_geo_transform, '', gcps, self.dst_srs)
+        return VRT.from_dataset_params(self.dst_shape[1], self.dst_shape[0],
+                                       self.dst_geo_transform, self.dst_srs, gcps, '')
+
+    def save(self, filename):
+        """Save resampling index into .npz file"""
+        weights = self.weights
+        if weights is None:
+            weights = np.zeros((0,), np.float32)
+        np.savez_compressed(filename,
+                            method=np.array(self.method),
+                            src_shape=np.array(self.src_shape),
+                            dst_shape=np.array(self.dst_shape),
+                            index=self.index,
+                            weights=weights,
+                            dst_srs=np.array(self.dst_srs),
+                            dst_geo_transform=np.array(self.dst_geo_transform),
+                            dst_gcps=self.dst_gcps)
+
+    @classmethod
+    def load(cls, filename):
+        """Load resampling index from .npz file created by save()"""
+        with np.load(filename) as data:
+            weights = data['weights']
+            if weights.size == 0:
+                weights = None
+            return cls(str(data['method']), data['src_shape'], data['dst_shape'],
+                       data['index'], weights,
+                       dst_srs=str(data['dst_srs']),
+                       dst_geo_transform=data['dst_geo_transform'],
+                       dst_gcps=data['dst_gcps'])
+
+    def __repr__(self):
+        return ('ResamplingIndex(method=%s, src_shape=%s, dst_shape=%s, valid=%d)' %
+                (self.method, self.src_shape, self.dst_shape, (self.index >= 0).sum()))
+
+
+def lonlat_to_ecef(lon, lat, radius=6371000.):
+    """Convert longitude and latitude (degrees) into Earth-centered X, Y, Z (m) on a sphere"""
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([(radius * cos_lat * np.cos(lon)).ravel(),
+                            (radius * cos_lat * np.sin(lon)).ravel(),
+                            (radius * np.sin(lat)).ravel()])
+
+
+class KDTreeResampler(object):
+    """Resampling of swath data with a KD-tree of source geolocation
+
+    Parameters
+    ----------
+    src_lon, src_lat : numpy.ndarray
+        longitudes and latitudes of source pixels
+    method : str
+        'nearest' - value of the nearest source pixel,
+        'idw' - inverse distance weighted mean of <neighbours> nearest pixels,
+        'gauss' - Gaussian weighted mean of <neighbours> nearest pixels
+    radius_of_influence : float
+        maximum distance (m) to source pixels. If None, two times the largest spacing
+        between source pixels is used.
+    neighbours : int
+        number of source pixels used for 'idw' and 'gauss'
+    sigma : float
+        e-folding distance (m) for 'gauss'. If None, half of the radius of influence is used.
+    chunk_size : int
+        number of destination pixels processed at once (limits memory usage)
+    workers : int
+        number of processes for querying the KD-tree (-1 - all CPUs)
+
+    """
+    METHODS = ['nearest', 'idw', 'gauss']
+
+    def __init__(self, src_lon, src_lat, method='nearest', radius_of_influence=None,
+                 neighbours=8, sigma=None, chunk_size=2**18, workers=-1):
+        if not SCIPY_IS_INSTALLED:
+            raise ImportError(' Scipy is not installed ')
+        if method not in self.METHODS:
+            raise ValueError('Unknown resampling method %s. Use one of %s' % (method, self.METHODS))
+        self.method = method
+        self.src_shape = np.shape(src_lon)
+        self.neighbours = 1 if method == 'nearest' else int(neighbours)
+        self.chunk_size = int(chunk_size)
+        self.workers = workers
+
+        src_xyz = lonlat_to_ecef(src_lon, src_lat)
+        self.src_valid_index = np.flatnonzero(np.isfinite(src_xyz).all(axis=1))
+        self.tree = cKDTree(src_xyz[self.src_valid_index])
+
+        if radius_of_influence is None:
+            radius_of_influence = 2 * self._get_max_spacing(src_xyz.reshape(self.src_shape + (3,)))
+        self.radius_of_influence = float(radius_of_influence)
+        if sigma is None:
+            sigma = self.radius_of_influence / 2.
+        self.sigma = float(sigma)
+
+    @staticmethod
+    def _get_max_spacing(src_xyz):
+        """Estimate the largest distance between neighbouring source pixels"""
+        spacing = [0]
+        for axis in range(src_xyz.ndim - 1):
+            if src_xyz.shape[axis] > 1:
+                distance = np.sqrt((np.diff(src_xyz, axis=axis) ** 2).sum(axis=-1))
+                spacing.append(np.nanmedian(distance))
+        return max(spacing)
+
+    def _query(self, dst_xyz):
+        """Find neighbours of destination points within radius of influence"""
+        kwargs = dict(k=self.neighbours, distance_upper_bound=self.radius_of_influence)
+        try:
+            distance, index = self.tree.query(dst_xyz, workers=self.workers, **kwargs)
+        except TypeError:
+            # scipy < 1.6
+            distance, index = self.tree.query(dst_xyz, n_jobs=self.workers, **kwargs)
+        return distance.reshape(-1, self.neighbours), index.reshape(-1, self.neighbours)
+
+    def _get_weights(self, distance):
+        """Return weights of neighbours (zero for missing neighbours)"""
+        found = np.isfinite(distance)
+        if self.method == 'nearest':
+            return found.astype(np.float64)
+        distance = np.where(found, distance, 0)
+        if self.method == 'idw':
+            weights = 1. / np.maximum(distance, 1e-3) ** 2
+        else:
+            weights = np.exp(-(distance / self.sigma) ** 2)
+        return np.where(found, weights, 0)
+
+    def get_src_values(self, array):
+        """Return values of <array> at source pixels with valid geolocation (flattened)"""
+        if np.shape(array) != self.src_shape:
+            raise ValueError('Shape of array %s does not match source shape %s' %
+                             (str(np.shape(array)), str(self.src_shape)))
+        return np.asarray(array).ravel()[self.src_valid_index]
+
+    def get_dst_type(self, dtype, fill_value=np.nan):
+        """Return data type of resampled values of source data type <dtype>"""
+        if self.method == 'nearest':
+            return _get_fill_type(dtype, fill_value)
+        return np.result_type(dtype, np.float32)
+
+    def query(self, dst_lon, dst_lat):
+        """Find neighbours of destination points and their weights
+
+        Parameters
+        ----------
+        dst_lon, dst_lat : numpy.ndarray
+            longitudes and latitudes of destination points (at most <chunk_size> points are
+            recommended for limiting memory usage)
+
+        Returns
+        -------
+        index : numpy.ndarray
+            (N, neighbours) array with indices of neighbours in values returned by
+            get_src_values (0 for missing neighbours)
+        weights : numpy.ndarray
+            (N, neighbours) array with weights of neighbours (0 for missing neighbours)
+
+        """
+        distance, index = self._query(lonlat_to_ecef(np.ravel(dst_lon), np.ravel(dst_lat)))
+        weights = self._get_weights(distance)
+        # missing neighbours have index equal to the size of the tree
+        return np.where(weights > 0, index, 0), weights
+
+    def apply(self, src_values, index, weights, fill_value=np.nan):
+        """Compute values at destination points from neighbours found by query()
+
+        Parameters
+        ----------
+        src_values : numpy.ndarray
+            values returned by get_src_values
+        index, weights : numpy.ndarray
+            neighbours returned by query
+        fill_value : float
+            value of destination points without source pixels within radius of influence
+
+        Returns
+        -------
+        dst_values : numpy.ndarray
+            1D array with values at destination points
+
+        """
+        return self._apply_weights(src_values[index], weights, fill_value)
+
+    def resample(self, arrays, dst_lon, dst_lat, fill_value=np.nan):
+        """Resample source arrays onto destination longitudes and latitudes
+
+        The KD-tree is queried once for each chunk of destination pixels and the result is
+        applied to all arrays.
+
+        Parameters
+        ----------
+        arrays : list of numpy.ndarray
+            source data with the shape of src_lon
+        dst_lon, dst_lat : numpy.ndarray
+            longitudes and latitudes of destination pixels
+        fill_value : float
+            value of destination pixels without source pixels within radius of influence
+
+        Returns
+        -------
+        dst_arrays : list of numpy.ndarray
+            resampled data with the shape of dst_lon. Data type of the input arrays is kept
+            for 'nearest' (unless <fill_value> requires other type). Float is returned for
+            'idw' and 'gauss'. NaN values of source pixels are ignored by 'idw' and 'gauss'.
+
+        """
+        src_arrays = [self.get_src_values(array) for array in arrays]
+        dst_shape = np.shape(dst_lon)
+        dst_size = int(np.prod(dst_shape))
+        dst_arrays = [np.empty(dst_size, self.get_dst_type(array.dtype, fill_value))
+                      for array in src_arrays]
+
+        dst_lon, dst_lat = np.ravel(dst_lon), np.ravel(dst_lat)
+        for start in range(0, dst_size, self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            index, weights = self.query(dst_lon[chunk], dst_lat[chunk])
+            for src_array, dst_array in zip(src_arrays, dst_arrays):
+                dst_array[chunk] = self.apply(src_array, index, weights, fill_value)
+
+        return [dst_array.reshape(dst_shape) for dst_array in dst_arrays]
+
+    def _apply_weights(self, values, weights, fill_value):
+        """Compute weighted mean of neighbour values (or fill_value if no neighbours)"""
+        if self.method == 'nearest':
+            return np.where(weights[:, 0] > 0, values[:, 0], fill_value)
+        weights = np.where(np.isnan(values), 0, weights)
+        weights_sum = weights.sum(axis=1)
+        values_sum = (np.where(weights > 0, values, 0) * weights).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(weights_sum > 0, values_sum / weights_sum, fill_value)
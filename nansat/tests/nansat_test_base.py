@@ -15,10 +15,13 @@ import os
 import sys
 import unittest
 import tempfile
+from contextlib import contextmanager
 import pythesint
 
 from mock import patch, PropertyMock, Mock, MagicMock, DEFAULT
 
+from nansat import vsimem
+from nansat.tools import gdal
 from nansat.tests import nansat_test_data as ntd
 
 
@@ -52,3 +55,13 @@ class NansatTestBase(unittest.TestCase):
         except OSError:
             pass
 
+
+    @contextmanager
+    def assertNoVSIMemLeaks(self):
+        """ Check that all files registered in /vsimem inside the block are deleted """
+        old_files = set([f['filename'] for f in vsimem.get_files()])
+        yield
+        new_files = [f['filename'] for f in vsimem.get_files()
+                     if f['filename'] not in old_files]
+        leaked_files = [f for f in new_files if gdal.VSIStatL(str(f)) is not None]
+        self.assertEqual(leaked_files, [])
@@ -0,0 +1,68 @@
+# ------------------------------------------------------------------------------
+# Name:         test_batch.py
+# Purpose:      Test the batch reprojection of many files
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+from __future__ import absolute_import
+import os
+import unittest
+
+import numpy as np
+
+from nansat import Nansat, Domain
+from nansat.batch import reproject_many, serialize_domain, deserialize_domain
+from nansat.tests.nansat_test_base import NansatTestBase
+
+
+class ReprojectManyTest(NansatTestBase):
+    def setUp(self):
+        super(ReprojectManyTest, self).setUp()
+        self.dst_domain = Domain(4326, '-te 27 70 31 72 -ts 40 20')
+        self.out_dir = os.path.join(self.tmp_data_path, 'batch')
+        if not os.path.exists(self.out_dir):
+            os.mkdir(self.out_dir)
+
+    def test_serialize_domain(self):
+        lon, lat = np.meshgrid(np.linspace(0, 10, 20), np.linspace(70, 60, 10))
+        for domain in [self.dst_domain, Domain.from_lonlat(lon, lat)]:
+            domain2 = deserialize_domain(serialize_domain(domain))
+            self.assertEqual(domain2.shape(), domain.shape())
+            self.assertEqual(domain2.vrt.dataset.GetGeoTransform(),
+                             domain.vrt.dataset.GetGeoTransform())
+            self.assertEqual(len(domain2.vrt.dataset.GetGCPs()),
+                             len(domain.vrt.dataset.GetGCPs()))
+
+    def test_reproject_many(self):
+        files = [self.test_file_gcps, self.test_file_stere, 'missing_file.tif']
+        reported = []
+        for workers in [1, 2]:
+            del reported[:]
+            results = reproject_many(files, self.dst_domain, bands=[1], workers=workers,
+                                     out_dir=self.out_dir, callback=reported.append)
+
+            self.assertEqual([r['filename'] for r in results], files)
+            self.assertEqual(len(reported), 3)
+            self.assertIsNone(results[0]['error'])
+            self.assertIsNotNone(results[2]['error'])
+            self.assertIsNone(results[2]['output'])
+            n = Nansat(results[0]['output'])
+            self.assertEqual(n.shape(), self.dst_domain.shape())
+
+    def test_reproject_many_same_names(self):
+        other_file = os.path.join(self.tmp_data_path, 'other',
+                                  os.path.basename(self.test_file_gcps))
+        for files in [[self.test_file_gcps, self.test_file_gcps],
+                      [self.test_file_gcps, other_file]]:
+            with self.assertRaises(ValueError):
+                reproject_many(files, self.dst_domain, workers=1, out_dir=self.out_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# ------------------------------------------------------------------------------
+# Name:         test_config.py
+# Purpose:      Test the scoped GDAL performance settings
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+from __future__ import absolute_import
+import threading
+import unittest
+
+import numpy as np
+
+from nansat import Nansat, Domain, config
+from nansat.node import Node
+from nansat.tools import gdal
+from nansat.tests.nansat_test_base import NansatTestBase
+
+
+class PerformanceTest(NansatTestBase):
+    def test_settings_are_restored(self):
+        cache_max = gdal.GetCacheMax()
+        num_threads = config._get_config_option('GDAL_NUM_THREADS')
+        with config.performance(cache_mb=16, threads=3):
+            self.assertEqual(gdal.GetCacheMax(), 16 * 1024**2)
+            self.assertEqual(gdal.GetConfigOption(str('GDAL_NUM_THREADS')), '3')
+            self.assertEqual(config.get_setting('threads'), 3)
+
+        self.assertEqual(gdal.GetCacheMax(), cache_max)
+        self.assertEqual(config._get_config_option('GDAL_NUM_THREADS'), num_threads)
+        self.assertIsNone(config.get_setting('threads'))
+
+    def test_nested_blocks_and_profiles(self):
+        with config.performance('throughput'):
+            with config.performance('low-memory', warp_memory_mb=32):
+                self.assertEqual(config.get_setting('threads'), 1)
+                self.assertEqual(config.get_setting('warp_memory_mb'), 32)
+                self.assertEqual(gdal.GetConfigOption(str('VSI_CACHE')), 'FALSE')
+            self.assertEqual(config.get_setting('threads'), 'ALL_CPUS')
+            self.assertEqual(config.get_settings()['warp_memory_mb'], 512)
+
+    def test_settings_are_not_shared_between_threads(self):
+        settings = []
+        with config.performance(threads=2):
+            thread = threading.Thread(target=lambda: settings.append(config.get_settings()))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(settings, [{}])
+
+    def test_wrong_profile_and_setting(self):
+        with self.assertRaises(ValueError):
+            config.performance('fastest')
+        with self.assertRaises(ValueError):
+            config.performance(num_threads=2)
+
+    def test_from_arg(self):
+        self.assertEqual(config.performance.from_arg(None).settings, {})
+        self.assertEqual(config.performance.from_arg('low-memory').settings,
+                         config.PROFILES['low-memory'])
+        self.assertEqual(config.performance.from_arg({'threads': 2}).settings, {'threads': 2})
+
+    def test_get_warp_settings(self):
+        self.assertEqual(config.get_warp_settings(None), {})
+        self.assertEqual(config.get_warp_settings('throughput'),
+                         {'threads': 'ALL_CPUS', 'warp_memory_mb': 512})
+        self.assertEqual(config.get_warp_settings({'warp_memory_mb': 32}), {'warp_memory_mb': 32})
+        with self.assertRaises(ValueError):
+            config.get_warp_settings({'cache_mb': 8, 'threads': 2})
+
+    def test_reproject_with_performance(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 27 70 30 72 -ts 500 500")
+        with self.assertRaises(ValueError):
+            n.reproject(d, performance={'vsi_cache': True})
+        n.reproject(d, performance={'warp_memory_mb': 32, 'threads': 2})
+        warp_options = Node.create(str(n.vrt.xml)).node('GDALWarpOptions')
+
+        self.assertEqual(float(warp_options.node('WarpMemoryLimit').value), 32 * 1024**2)
+
+    def test_read_window_with_performance(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        data1 = n.read_window(1, 0, 0, 10, 10)
+        data2 = n.read_window(1, 0, 0, 10, 10, performance={'cache_mb': 8, 'threads': 2})
+
+        self.assertTrue(np.allclose(data1, data2))
+        self.assertEqual(config.get_settings(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
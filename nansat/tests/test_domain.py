@@ -168,6 +168,40 @@ class DomainTest(unittest.TestCase):
         self.assertEqual(type(lat), np.ndarray)
         self.assertEqual(lat.shape, (500, 500))
 
+    def test_get_geolocation_grids_cached(self):
+        Domain.GRID_CACHE.clear()
+        grids = np.meshgrid(np.linspace(0, 1, 7), np.linspace(1, 0, 9))
+        expected_lon = grids[0].copy()
+        d = Domain(4326, "-te 0 0 1 1 -ts 7 9")
+        with patch.object(Domain, '_compute_geolocation_grids', return_value=grids) as compute:
+            lon1, lat1 = d.get_geolocation_grids()
+            lon1[:] = 100
+            lon2, lat2 = d.get_geolocation_grids()
+            d.get_geolocation_grids(2)
+        self.assertEqual(compute.call_count, 2)
+        self.assertTrue(np.all(grids[0] == expected_lon))
+        self.assertTrue(np.all(lon2 == expected_lon))
+
+    def test_get_geolocation_grids_step_from_geolocationArray(self):
+        lat, lon = np.mgrid[25:35:0.02, 70:72:0.004]
+        d = Domain(lon=lon, lat=lat)
+        lon10, lat10 = d.get_geolocation_grids(10)
+        self.assertTrue(np.allclose(lon10, lon[::10, ::10]))
+        self.assertTrue(np.allclose(lat10, lat[::10, ::10]))
+
+    def test_from_tie_points(self):
+        lon, lat = np.meshgrid(np.linspace(0, 10, 11), np.linspace(60, 70, 21))
+        d = Domain.from_tie_points(lon, lat, np.linspace(0, 999, 11), np.linspace(0, 1999, 21),
+                                   1000, 2000)
+        lon_full, lat_full = d.get_geolocation_grids()
+
+        self.assertEqual(d.shape(), (2000, 1000))
+        self.assertEqual(lon_full.shape, (2000, 1000))
+        self.assertTrue(d.vrt.geolocation.is_tie_point_grid())
+        self.assertTrue(np.allclose(lon_full[0, [0, -1]], [0, 10]))
+        self.assertTrue(np.allclose(lat_full[[0, -1], 0], [60, 70]))
+        self.assertGreater(len(d.vrt.dataset.GetGCPs()), 0)
+
     def test_get_geolocation_grids_from_geolocationArray(self):
         lat, lon = np.mgrid[25:35:0.02, 70:72:0.004]
         d = Domain(lon=lon, lat=lat)
@@ -394,6 +428,37 @@ class DomainTest(unittest.TestCase):
         self.assertFalse(Norway.contains(WestCoast))
         self.assertFalse(Paris.contains(Norway))
 
+    def test_is_disjoint(self):
+        Bergen = Domain(4326, EXTENT_BERGEN)
+        Norway = Domain(4326, EXTENT_NORWAY)
+        Paris = Domain(4326, EXTENT_PARIS)
+        arctic = Domain('+proj=stere +lat_0=90 +lon_0=0 +datum=WGS84 +units=m',
+                        '-te -1000000 -1000000 1000000 1000000 -ts 100 100')
+        svalbard = Domain(4326, '-te 10 77 30 81 -ts 100 100')
+        dateline_east = Domain(4326, '-te -179 60 -170 65 -ts 100 100')
+        dateline = Domain('+proj=stere +datum=WGS84 +ellps=WGS84 +lat_0=60 +lon_0=180 +no_defs',
+                          '-te -300000 -100000 300000 100000 -ts 10 10')
+
+        self.assertFalse(Bergen.is_disjoint(Norway))
+        self.assertTrue(Paris.is_disjoint(Norway))
+        self.assertFalse(arctic.is_disjoint(svalbard))
+        self.assertTrue(arctic.is_disjoint(Paris))
+        self.assertFalse(dateline.is_disjoint(dateline_east))
+        self.assertFalse(dateline_east.is_disjoint(dateline))
+
+    def test_footprint_is_cached(self):
+        d = Domain(4326, EXTENT_BERGEN)
+        with warnings.catch_warnings(record=True) as recorded_warnings:
+            warnings.simplefilter('always')
+            geometry1 = d.get_border_geometry()
+            geometry2 = d.get_border_geometry()
+        self.assertEqual(len([w for w in recorded_warnings if '180 deg' in str(w.message)]), 1)
+        self.assertTrue(geometry1.Equals(geometry2))
+        self.assertIsNot(geometry1, geometry2)
+        # cache is reset if georeference changes
+        d.vrt.dataset.SetGeoTransform((10, 0.002, 0, 61, 0, -0.002))
+        self.assertEqual(d.get_border_geometry().GetEnvelope()[0], 10)
+
     def test_get_border_postgis(self):
         d = Domain(4326, "-te 25 70 35 72 -ts 500 500")
         result = d.get_border_postgis()
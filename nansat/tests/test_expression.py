@@ -0,0 +1,80 @@
+#------------------------------------------------------------------------------
+# Name:         test_expression.py
+# Purpose:      Test the Expression class
+#
+# Author:       Anton Korosov
+#
+# Created:      2026-10-16
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+#------------------------------------------------------------------------------
+from __future__ import absolute_import
+import unittest
+
+import numpy as np
+
+from nansat.expression import Expression
+
+
+class BandReader(object):
+    """ Returns a new array for each band, as Nansat does """
+    def __getitem__(self, band_id):
+        return np.arange(6, dtype='float32').reshape(2, 3) + len(str(band_id))
+
+
+class ExpressionTest(unittest.TestCase):
+    def setUp(self):
+        self.reader = BandReader()
+        self.band = self.reader['band']
+
+    def test_get_is_cached(self):
+        expression = Expression.get('np.power(10., self["band"])')
+        self.assertIs(Expression.get('np.power(10., self["band"])'), expression)
+        self.assertEqual(expression.bands, ['band'])
+
+    def test_evaluate_numpy(self):
+        result = Expression('np.power(10., self["band"])').evaluate(self.reader)
+        self.assertTrue(np.allclose(result, np.power(10., self.band)))
+        self.assertEqual(result.dtype, np.float32)
+
+    def test_evaluate_constant(self):
+        result = Expression('np.array([0,1,2,3,np.inf,5,6,7])').evaluate(self.reader)
+        self.assertEqual(result.shape, (8,))
+        self.assertTrue(np.isinf(result[4]))
+
+    def test_evaluate_arithmetic(self):
+        band_data = np.ones((2, 3))
+        result = Expression('-self["band"] / 2 + self["band"] ** 2 - band_data').evaluate(
+            self.reader, band_data)
+        self.assertTrue(np.allclose(result, -self.band / 2 + self.band ** 2 - band_data))
+        self.assertTrue(np.all(band_data == 1))
+
+    def test_evaluate_compare(self):
+        result = Expression('np.where((self["band"] > 5) & (self["band"] < 9), 1, 0)').evaluate(
+            self.reader)
+        self.assertTrue(np.all(result == np.where((self.band > 5) & (self.band < 9), 1, 0)))
+
+    def test_evaluate_does_not_modify_inputs(self):
+        band = self.reader['band']
+        band_data = self.reader['band']
+        result = Expression('self["band"] * 2 + band_data').evaluate({'band': band}, band_data)
+        self.assertIsNot(result, band)
+        self.assertIsNot(result, band_data)
+        self.assertTrue(np.all(band == self.band))
+        self.assertTrue(np.all(band_data == self.band))
+        self.assertTrue(np.allclose(result, self.band * 3))
+
+    def test_evaluate_in_place_of_temporary(self):
+        result = Expression('(band_data * 2 + 1) * 3').evaluate(self.reader, self.band.copy())
+        self.assertTrue(np.allclose(result, (self.band * 2 + 1) * 3))
+
+    def test_not_allowed(self):
+        for source in ['__import__("os")', 'self.vrt', 'np.load("file.npy")',
+                       'band_data.tofile("file")', '[x for x in band_data]',
+                       'lambda: 1', 'np._NoValue', '().__class__', 'self["band"] +',
+                       'np.memmap("file")', 'np.lib.format.open_memmap("file")',
+                       'np.DataSource()', 'np.ma.core.np.load("file")']:
+            with self.assertRaises(ValueError):
+                Expression(source)
@@ -0,0 +1,63 @@
+# ------------------------------------------------------------------------------
+# Name:         test_gcps.py
+# Purpose:      Test the error-driven selection of GCPs
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+from __future__ import absolute_import
+import unittest
+
+import numpy as np
+
+from nansat.gcps import select_gcps, fit_tps, fit_polynomial, get_polynomial_order
+
+
+class GCPsTest(unittest.TestCase):
+    def setUp(self):
+        # 21 x 10 GCPs of a curved swath
+        pixel, line = np.meshgrid(np.linspace(0, 25000, 21), np.linspace(0, 16000, 10))
+        self.pixel, self.line = pixel.ravel(), line.ravel()
+        u, v = self.pixel / 25000., self.line / 16000.
+        self.lon = 10 + 8 * u + 0.5 * u * v
+        self.lat = 70 + 2 * v + 0.3 * u ** 2
+
+    def test_fit_tps_interpolates_control_points(self):
+        values = np.column_stack([self.pixel, self.line])
+        values_fit = fit_tps(self.lon, self.lat, values, self.lon, self.lat)
+        self.assertTrue(np.allclose(values_fit, values, atol=1e-3))
+
+    def test_fit_polynomial(self):
+        values = np.column_stack([self.lon ** 2, self.lat])
+        values_fit = fit_polynomial(self.lon, self.lat, values, self.lon, self.lat)
+        self.assertTrue(np.allclose(values_fit, values))
+        self.assertEqual(get_polynomial_order(5), 1)
+        self.assertEqual(get_polynomial_order(9), 2)
+        self.assertEqual(get_polynomial_order(100), 3)
+
+    def test_select_gcps_tps(self):
+        indices = select_gcps(self.pixel, self.line, self.lon, self.lat, tolerance=0.5)
+        values = np.column_stack([self.pixel, self.line])
+        values_fit = fit_tps(self.lon[indices], self.lat[indices], values[indices],
+                             self.lon, self.lat)
+
+        self.assertLess(len(indices), len(self.pixel))
+        self.assertLessEqual(np.hypot(*(values_fit - values).T).max(), 0.5)
+
+    def test_select_gcps_tolerance(self):
+        indices1 = select_gcps(self.pixel, self.line, self.lon, self.lat, tolerance=5)
+        indices2 = select_gcps(self.pixel, self.line, self.lon, self.lat, tolerance=0.01)
+        self.assertLess(len(indices1), len(indices2))
+
+    def test_select_gcps_polynomial(self):
+        indices = select_gcps(self.pixel, self.line, self.lon, self.lat, tolerance=0.5, tps=False)
+        self.assertTrue(len(indices) >= 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,7 +17,7 @@ import gdal
 import numpy as np
 
 from nansat.vrt import VRT
-from nansat.geolocation import Geolocation
+from nansat.geolocation import Geolocation, interpolate_tie_points, regularize_tie_points
 from nansat.tests import nansat_test_data as ntd
 
 class GeolocationTest(unittest.TestCase):
@@ -65,3 +65,54 @@ class GeolocationTest(unittest.TestCase):
         self.assertEqual(g.data['LINE_STEP'], '1')
         self.assertEqual(g.data['PIXEL_OFFSET'], '0')
         self.assertEqual(g.data['PIXEL_STEP'], '1')
+
+    def test_get_geolocation_grids_tie_points(self):
+        lon, lat = np.meshgrid(np.linspace(0, 5, 6), np.linspace(10, 20, 11))
+        g = Geolocation(VRT.from_array(lon), VRT.from_array(lat),
+                        pixel_offset=0, pixel_step=10, line_offset=0, line_step=20)
+        lon_full, lat_full = g.get_geolocation_grids()
+        lon_win, lat_win = g.get_geolocation_grids(5, 10, 20, 40, step=2, method='bilinear')
+
+        self.assertTrue(g.is_tie_point_grid())
+        self.assertEqual(lon_full.shape, (201, 51))
+        self.assertTrue(np.allclose(lon_full[::20, ::10], lon))
+        self.assertTrue(np.allclose(lat_full[::20, ::10], lat))
+        self.assertEqual(lon_win.shape, (20, 10))
+        self.assertTrue(np.allclose(lon_win[0], np.arange(5, 25, 2) / 10.))
+        self.assertTrue(np.allclose(lat_win[:, 0], 10 + np.arange(10, 50, 2) / 20.))
+
+    def test_get_geolocation_grids_step(self):
+        lon, lat = np.meshgrid(np.arange(37.), np.arange(23.))
+        g = Geolocation(VRT.from_array(lon), VRT.from_array(lat))
+        for x_off, y_off, x_size, y_size, step in [(0, 0, 37, 23, 2), (0, 0, 37, 23, 5),
+                                                   (3, 1, 30, 20, 4), (1, 2, 36, 21, 7)]:
+            lon_dec, lat_dec = g.get_geolocation_grids(x_off, y_off, x_size, y_size, step)
+            window = (slice(y_off, y_off + y_size, step), slice(x_off, x_off + x_size, step))
+            self.assertTrue(np.all(lon_dec == lon[window]))
+            self.assertTrue(np.all(lat_dec == lat[window]))
+
+    def test_get_geolocation_grids_offset_without_size(self):
+        lon, lat = np.meshgrid(np.arange(37.), np.arange(23.))
+        g = Geolocation(VRT.from_array(lon), VRT.from_array(lat))
+        for step in [1, 3]:
+            lon_win, lat_win = g.get_geolocation_grids(5, 3, step=step)
+            self.assertTrue(np.all(lon_win == lon[3::step, 5::step]))
+            self.assertTrue(np.all(lat_win == lat[3::step, 5::step]))
+
+    def test_interpolate_tie_points_dateline(self):
+        lon, lat = np.meshgrid([170., 180., -170.], [60., 70.])
+        lon_int, lat_int = interpolate_tie_points(lon, lat, np.linspace(0, 2, 21), [0., 0.5])
+
+        self.assertTrue(np.all(np.abs(lon_int) >= 170))
+        self.assertTrue(np.allclose(lat_int[0], 60, atol=0.5))
+        with self.assertRaises(ValueError):
+            interpolate_tie_points(lon, lat, [0.], [0.], method='cubic')
+
+    def test_regularize_tie_points(self):
+        pixel, line = np.array([0., 90, 210, 300]), np.array([0., 100, 200])
+        lon, lat = np.meshgrid(pixel / 10., line / 10.)
+        lon_reg, lat_reg, pixel_offset, pixel_step, line_offset, line_step = (
+            regularize_tie_points(lon, lat, pixel, line, method='bilinear'))
+
+        self.assertEqual((pixel_offset, pixel_step, line_offset, line_step), (0, 100, 0, 100))
+        self.assertTrue(np.allclose(lon_reg[0], [0, 10, 20, 30]))
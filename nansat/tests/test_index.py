@@ -0,0 +1,91 @@
+# ------------------------------------------------------------------------------
+# Name:         test_index.py
+# Purpose:      Test the spatial index of footprints
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+from __future__ import absolute_import
+import datetime
+import os
+import unittest
+
+import numpy as np
+
+from nansat import Domain
+from nansat.index import FootprintIndex
+from nansat.tests.nansat_test_base import NansatTestBase
+
+
+class FootprintIndexTest(NansatTestBase):
+    def setUp(self):
+        super(FootprintIndexTest, self).setUp()
+        self.index = FootprintIndex()
+        self.index.add('west', Domain(4326, '-te 0 60 10 70 -ts 100 100'),
+                       '2026-01-01', '2026-01-02')
+        self.index.add('east', Domain(4326, '-te 20 60 30 70 -ts 100 100'),
+                       datetime.datetime(2026, 1, 5))
+
+    def tearDown(self):
+        self.index.close()
+        super(FootprintIndexTest, self).tearDown()
+
+    def test_query_bbox(self):
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.query_bbox(5, 65, 25, 66), ['west', 'east'])
+        self.assertEqual(self.index.query_bbox(12, 65, 18, 66), [])
+        self.assertEqual(self.index.query_bbox(5, 75, 25, 76), [])
+
+    def test_query_time_window(self):
+        self.assertEqual(self.index.query_bbox(-180, -90, 180, 90, start_time='2026-01-04'),
+                         ['east'])
+        self.assertEqual(self.index.query_bbox(-180, -90, 180, 90, end_time='2026-01-04'),
+                         ['west'])
+        self.assertEqual(self.index.query_bbox(-180, -90, 180, 90,
+                                               start_time='2026-01-02T12:00',
+                                               end_time='2026-01-04'), [])
+
+    def test_query_domain_and_polygon(self):
+        d = Domain(4326, '-te 8 68 22 75 -ts 100 100')
+        self.assertEqual(self.index.query_domain(d), ['west', 'east'])
+        # triangle between the footprints
+        self.assertEqual(self.index.query_polygon([11, 19, 15], [60, 60, 70]), [])
+
+    def test_dateline_and_pole(self):
+        self.index.add_border('dateline', [170, 190, 190, 170], [0, 0, 10, 10])
+        lon = np.arange(0, 360, 30)
+        self.index.add_border('arctic', lon, np.zeros(lon.size) + 80)
+        self.assertEqual(self.index.query_bbox(-175, 5, -172, 6), ['dateline'])
+        self.assertEqual(self.index.query_bbox(172, 5, 175, 6), ['dateline'])
+        self.assertEqual(self.index.query_bbox(100, 85, 101, 86), ['arctic'])
+
+    def test_add_many_replaces_names(self):
+        self.index.add_many([
+            ('west', Domain(4326, '-te 40 60 50 70 -ts 10 10')),
+            ('north', ([0, 10, 10, 0], [75, 75, 80, 80]), '2026-01-10', '2026-01-11'),
+        ])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.query_bbox(5, 65, 6, 66), [])
+        self.assertEqual(self.index.query_bbox(45, 65, 46, 66), ['west'])
+        self.index.remove('north')
+        self.assertNotIn('north', self.index)
+
+    def test_save_and_open(self):
+        filename = os.path.join(self.tmp_data_path, 'test_index.sqlite')
+        if os.path.exists(filename):
+            os.remove(filename)
+        self.index.save(filename)
+        with FootprintIndex(filename) as index:
+            self.assertEqual(len(index), 2)
+            self.assertEqual(index.query_bbox(5, 65, 6, 66, start_time='2026-01-01'),
+                             ['west'])
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
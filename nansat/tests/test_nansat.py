@@ -31,10 +31,13 @@ except ImportError:
 else:
     MATPLOTLIB_IS_INSTALLED = True
 
-from nansat import Nansat, Domain, NSR
+from nansat import Nansat, Domain, NSR, lazy
 from nansat.tools import gdal
+from nansat.node import Node
+from nansat.vrt import VRT
 
 from nansat.exceptions import NansatGDALError, WrongMapperError, NansatReadError
+from nansat.exceptions import NansatDisjointError
 from nansat.tests.nansat_test_base import NansatTestBase
 
 warnings.simplefilter("always", UserWarning)
@@ -135,6 +138,46 @@ class NansatTest(NansatTestBase):
         self.assertEqual(type(n[1]), np.ndarray)
         self.assertEqual(type(n[2]), np.ndarray)
 
+    def test_add_lazy_band(self):
+        d = Domain(4326, "-te 25 70 35 72 -ts 50 40")
+        arr1 = np.random.randn(40, 50).astype(np.float32)
+        arr2 = np.random.randn(40, 50).astype(np.float32)
+        calls = []
+        def func(a, b, factor=1):
+            calls.append(a.shape)
+            return (a + b) * factor
+
+        n = Nansat.from_domain(d, log_level=40)
+        n.add_bands([arr1, arr2], [{'name': 'band1'}, {'name': 'band2'}])
+        band_name = n.add_lazy_band(func, ['band1', 'band2'], dtype=np.float64,
+                                    parameters={'name': 'band3'}, factor=2)
+
+        self.assertEqual(band_name, 'band3')
+        self.assertEqual(calls, [])
+        self.assertEqual(n['band3'].dtype, np.float64)
+        np.testing.assert_allclose(n['band3'], (arr1 + arr2) * 2, rtol=1e-6)
+        np.testing.assert_allclose(n['band3', 10:20, 5:15],
+                                   ((arr1 + arr2) * 2)[10:20, 5:15], rtol=1e-6)
+        self.assertTrue(len(calls) > 0)
+
+    def test_close_removes_lazy_band_function(self):
+        d = Domain(4326, "-te 25 70 35 72 -ts 50 40")
+        n = Nansat.from_domain(d, np.ones((40, 50), np.float32), {'name': 'band1'})
+        n.add_lazy_band(np.negative, ['band1'], parameters={'name': 'band2'})
+        function_name = n.vrt.lazy_functions[0].name.split('.')[-1]
+        vrt_copy = n.vrt.copy()
+        n.close()
+
+        self.assertTrue(hasattr(lazy, function_name))
+        self.assertTrue(np.allclose(vrt_copy.dataset.GetRasterBand(2).ReadAsArray(), -1))
+        vrt_copy.close()
+        self.assertFalse(hasattr(lazy, function_name))
+
+    def test_add_lazy_band_wrong_dtype(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        with self.assertRaises(ValueError):
+            n.add_lazy_band(np.abs, [1], dtype='float16')
+
     def test_add_subvrts_only_to_one_nansat(self):
         d = Domain(4326, "-te 25 70 35 72 -ts 500 500")
         arr = np.random.randn(500, 500)
@@ -166,6 +209,30 @@ class NansatTest(NansatTestBase):
         hb = n.has_band('surface_upwelling_spectral_radiance_in_air_emerging_from_sea_water')
         self.assertTrue(hb)
 
+    def test_has_band_if_not_exists(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        self.assertFalse(n.has_band('not_existing_band'))
+
+    def test_band_index_updated(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        self.assertFalse(n.has_band('new_band'))
+        n.add_band(np.zeros(n.shape()), {'name': 'new_band'})
+        self.assertTrue(n.has_band('new_band'))
+        self.assertEqual(n.get_band_number('new_band'), 4)
+        n.set_metadata('name', 'renamed_band', band_id=4)
+        self.assertFalse(n.has_band('new_band'))
+        self.assertEqual(n.get_band_number('renamed_band'), 4)
+        self.assertEqual(n.bands()[4]['name'], 'renamed_band')
+        n.undo()
+        self.assertFalse(n.has_band('renamed_band'))
+
+    def test_get_band_number_after_direct_rename(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        self.assertEqual(n.get_band_number('L_645'), 1)
+        n.vrt.dataset.GetRasterBand(1).SetMetadataItem(str('name'), str('Rrs_645'))
+
+        self.assertEqual(n.get_band_number('Rrs_645'), 1)
+
     def test_write_fig_tif(self):
         n = Nansat(self.test_file_arctic, mapper=self.default_mapper)
         tmpfilename = os.path.join(self.tmp_data_path,
@@ -310,6 +377,20 @@ class NansatTest(NansatTestBase):
         self.assertEqual(type(n[1]), np.ndarray)
         self.assertTrue(n.has_band('swathmask'))
 
+    def test_reproject_num_threads_warp_memory(self):
+        n1 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        n2 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 27 70 30 72 -ts 500 500")
+        n1.reproject(d, num_threads=1)
+        n2.reproject(d, num_threads=2, warp_memory_mb=16)
+        warp_options = Node.create(str(n2.vrt.xml)).node('GDALWarpOptions')
+        num_threads = [option.value for option in warp_options.nodeList('Option')
+                       if option.getAttribute('name') == 'NUM_THREADS']
+
+        self.assertEqual(num_threads, ['2'])
+        self.assertEqual(float(warp_options.node('WarpMemoryLimit').value), 16 * 1024**2)
+        self.assertTrue(np.allclose(n1[1], n2[1]))
+
     @patch.object(Nansat, 'get_corners',
                   return_value=(np.array([0, 0, 360, 360]), np.array([90,-90, 90, -90])))
     def test_reproject_domain_if_source_and_destination_domain_span_entire_lons(self, mock_Nansat):
@@ -406,6 +487,66 @@ class NansatTest(NansatTestBase):
         self.assertEqual(n1.shape(), n2.shape())
         self.assertEqual(type(n1[1]), np.ndarray)
 
+    def test_reproject_gcp_tolerance(self):
+        n1 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        n2 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 27 70 30 72 -ts 500 500")
+        n1.reproject(d, tps=True)
+        n2.reproject(d, tps=True, gcp_tolerance=0.1)
+        mask = n1['swathmask'] * n2['swathmask'] == 1
+
+        # GCPs reproduced within 0.1 pixel change value of few pixels only
+        self.assertGreater((n1[1][mask] == n2[1][mask]).mean(), 0.95)
+
+    def test_reproject_skip_if_disjoint(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        shape = n.shape()
+        d = Domain(4326, "-te -30 -10 -20 0 -ts 100 100")
+        with self.assertRaises(NansatDisjointError):
+            n.reproject(d, skip_if_disjoint=True)
+
+        self.assertEqual(n.shape(), shape)
+        n.reproject(Domain(4326, "-te 27 70 30 72 -ts 50 50"), skip_if_disjoint=True)
+        self.assertEqual(n.shape(), (50, 50))
+
+    def test_reproject_to_file(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 20 68 35 74 -ts 300 120")
+        for workers in [1, 2]:
+            filename = os.path.join(self.tmp_data_path, 'reproject_to_file_%d.tif' % workers)
+            n.reproject_to_file(d, filename, [1], tile=64, workers=workers)
+            ds = gdal.Open(filename)
+            array = ds.GetRasterBand(1).ReadAsArray()
+
+            self.assertEqual(array.shape, (120, 300))
+            self.assertEqual(ds.GetGeoTransform(), d.vrt.dataset.GetGeoTransform())
+            self.assertEqual(ds.GetRasterBand(1).GetDescription(), n.bands()[1]['name'])
+            n.reproject(d)
+            # tiles are warped independently and may differ from full warping at few pixels
+            self.assertGreater((array == n[1]).mean(), 0.99)
+            n.undo()
+
+    def test_reproject_to_file_does_not_change_tps(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 27 70 30 72 -ts 100 100")
+        tps = n.vrt.tps
+        n.reproject_to_file(d, os.path.join(self.tmp_data_path, 'reproject_to_file_tps.tif'),
+                            [1], tile=64, tps=not tps)
+
+        self.assertEqual(n.vrt.tps, tps)
+
+    def test_get_tile_windows(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 0 60 60 80 -ts 600 200")
+        windows = n._get_tile_windows(d, 100)
+        lon_min, lon_max, lat_min, lat_max = n._get_footprint()['envelope']
+
+        self.assertGreater(len(windows), 0)
+        self.assertLess(len(windows), 12)
+        for x_offset, y_offset, x_size, y_size in windows:
+            self.assertLessEqual(x_offset / 10., lon_max)
+            self.assertGreaterEqual((x_offset + x_size) / 10., lon_min)
+
     def test_reproject_gcps_on_repro_gcps(self):
         n1 = Nansat(self.test_file_stere, log_level=40, mapper=self.default_mapper)
         n2 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
@@ -440,6 +581,71 @@ class NansatTest(NansatTestBase):
 
         self.assertEqual(shape1, shape2)
 
+    def test_undo_keeps_history_unchanged(self):
+        n1 = Nansat(self.test_file_stere, log_level=40, mapper=self.default_mapper)
+        n1.crop(10, 20, 50, 60)
+        n1.resize(0.5)
+        crop_vrt = n1.vrt.vrt
+        n1.undo()
+        n1.set_metadata('new_key', 'new_value')
+
+        self.assertEqual(n1.shape(), (60, 50))
+        self.assertIsNot(n1.vrt, crop_vrt)
+        self.assertEqual(crop_vrt.dataset.GetMetadataItem(str('new_key')), None)
+
+    def test_compact(self):
+        n1 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        n1.crop(10, 20, 50, 60)
+        n1.resize(0.5, resample_alg=0)
+        data1 = n1[1]
+        read_depth1 = n1.vrt.get_chain_info()['read_depth']
+        n1.compact()
+
+        self.assertTrue(np.allclose(n1[1], data1))
+        self.assertLess(n1.vrt.get_chain_info()['read_depth'], read_depth1)
+        n1.undo()
+        self.assertEqual(n1.shape(), (60, 50))
+
+    def test_auto_compact(self):
+        n1 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        n1.AUTO_COMPACT_DEPTH = len(n1.vrt.get_chain()) + 1
+        n1.crop(10, 20, 50, 60)
+        self.assertFalse(n1.vrt._compacted)
+        n1.crop(5, 5, 30, 30)
+        self.assertTrue(n1.vrt._compacted)
+        n1.crop(5, 5, 20, 20)
+        self.assertFalse(n1.vrt._compacted)
+
+    def test_close(self):
+        with self.assertNoVSIMemLeaks():
+            n1 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+            n1.crop(10, 20, 50, 60)
+            n1.add_band(np.ones(n1.shape(), np.float32))
+            n1.resize(0.5)
+            n1.close()
+
+        self.assertIsNone(n1.vrt)
+
+    def test_context_manager(self):
+        with self.assertNoVSIMemLeaks():
+            with Nansat(self.test_file_stere, log_level=40, mapper=self.default_mapper) as n1:
+                n1.resize(0.5)
+                shape = n1.shape()
+                data = n1[1]
+
+        self.assertIsNone(n1.vrt)
+        self.assertEqual(data.shape, shape)
+
+    def test_close_keeps_shared_geolocation(self):
+        lon, lat = np.meshgrid(np.linspace(0, 5, 10), np.linspace(40, 45, 10))
+        d = Domain.from_lonlat(lon=lon, lat=lat)
+        n1 = Nansat.from_domain(d, np.ones((10, 10), np.float32))
+        n1.close()
+
+        lon1, lat1 = d.get_geolocation_grids()
+        self.assertTrue(np.allclose(lon1, lon))
+        self.assertTrue(np.allclose(lat1, lat))
+
     def test_write_figure(self):
         n1 = Nansat(self.test_file_stere, log_level=40, mapper=self.default_mapper)
         tmpfilename = os.path.join(self.tmp_data_path, 'nansat_write_figure.png')
@@ -548,6 +754,16 @@ class NansatTest(NansatTestBase):
         n1 = Nansat(self.test_file_stere, log_level=40, mapper=self.default_mapper)
         self.assertEqual(n1.get_band_number(1), 1)
 
+    def test_get_band_number_from_dict(self):
+        n1 = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        band2 = n1.bands()[2]
+        self.assertEqual(n1.get_band_number(band2['name']), 2)
+        self.assertEqual(n1.get_band_number({'name': band2['name']}), 2)
+        self.assertEqual(n1.get_band_number({'name': band2['name'],
+                                             'SourceBand': band2['SourceBand']}), 2)
+        with self.assertRaises(ValueError):
+            n1.get_band_number('not_existing_band')
+
     @unittest.skipUnless(MATPLOTLIB_IS_INSTALLED, 'Matplotlib is required')
     def test_get_transect(self):
         plt.switch_backend('agg')
@@ -763,6 +979,143 @@ class NansatTest(NansatTestBase):
         with self.assertRaises(NansatGDALError):
             Nansat(self.test_file_stere, mapper=self.default_mapper).__getitem__(1)
 
+    def test_getitem_window(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        b1 = n[1]
+        w1 = n[1, 10:30, 20:60]
+        r1 = n[1, 15]
+        c1 = n[1, :, -5]
+
+        self.assertEqual(w1.shape, (20, 40))
+        self.assertTrue(np.allclose(w1, b1[10:30, 20:60]))
+        self.assertTrue(np.allclose(r1, b1[15]))
+        self.assertTrue(np.allclose(c1, b1[:, -5]))
+
+    def test_getitem_window_wrong_key(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        with self.assertRaises(IndexError):
+            n[1, 0:10:2, 0:10]
+        with self.assertRaises(IndexError):
+            n[1, 0:10, 0:10, 0:10]
+
+    def test_read_window(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        w1 = n.read_window(1, 20, 10, 40, 20)
+        w2 = n.read_window(1, 20, 10, 40, 20, buf_shape=(10, 20))
+
+        self.assertTrue(np.allclose(w1, n[1][10:30, 20:60]))
+        self.assertEqual(w2.shape, (10, 20))
+        with self.assertRaises(IndexError):
+            n.read_window(1, 20, 10, 4000, 20)
+
+    def test_read_window_swathmask(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        d = Domain(4326, "-te 27 70 30 72 -ts 500 500")
+        n.reproject(d)
+        b1 = n[1]
+        w1 = n.read_window(1, 0, 0, 300, 300)
+
+        self.assertTrue(np.isnan(w1[0, 0]))
+        np.testing.assert_array_equal(w1, b1[:300, :300])
+
+    def test_read_window_expression(self):
+        self.mock_pti['get_wkv_variable'].return_value=dict(short_name='newband')
+        d = Domain(4326, "-te 25 70 35 72 -ts 500 500")
+        n = Nansat.from_domain(d, np.random.randn(500, 500), {'name': 'band1'})
+        n.add_band(np.zeros((500, 500)), {'expression': 'self["band1"] * 2'})
+        n.add_band(np.zeros((500, 500)), {'expression': 'np.ones((500, 500))'})
+
+        self.assertTrue(np.allclose(n[2, 10:20, 30:50], n[1][10:20, 30:50] * 2))
+        self.assertEqual(n[3, 10:20, 30:50].shape, (10, 20))
+
+    def test_read_window_expression_buf_shape(self):
+        self.mock_pti['get_wkv_variable'].return_value=dict(short_name='newband')
+        d = Domain(4326, "-te 25 70 35 72 -ts 500 500")
+        n = Nansat.from_domain(d, np.random.randn(500, 500), {'name': 'band1'})
+        n.add_band(np.zeros((500, 500)), {'expression': 'self["band1"] * 2'})
+        n.add_band(np.zeros((500, 500)), {'expression': 'np.ones((500, 500))'})
+        n.add_band(np.zeros((500, 500)), {'expression': '1'})
+
+        w2 = n.read_window(2, 0, 0, 100, 100, buf_shape=(500, 500))
+        w3 = n.read_window(3, 0, 0, 500, 500, buf_shape=(50, 50))
+        w4 = n.read_window(4, 10, 10, 20, 20)
+
+        self.assertEqual(w2.shape, (500, 500))
+        self.assertEqual(w3.shape, (50, 50))
+        self.assertTrue(np.all(w3 == 1))
+        self.assertEqual(w4.shape, (20, 20))
+
+    def test_reads_keep_xml_cache(self):
+        d = Domain(4326, "-te 25 70 35 72 -ts 50 40")
+        n = Nansat.from_domain(d, np.random.randn(40, 50), {'name': 'band1'})
+        n.vrt = n.vrt.get_super_vrt()
+        n.vrt.write_xml(n.vrt.xml)
+        with patch.object(VRT, 'read_vsi', wraps=VRT.read_vsi) as mock_read_vsi:
+            n['band1']
+            n.read_bands(['band1'])
+            n.has_band('swathmask')
+            n.get_metadata('name', 'band1')
+            n.vrt.set_offset_size('x', 5, 30)
+            n['band1', 0:10, 0:10]
+            xml = n.vrt.xml
+            self.assertEqual(mock_read_vsi.call_count, 0)
+
+        self.assertEqual(Node.create(str(xml)).node('SrcRect').getAttribute('xOff'), '5')
+
+    def test_iter_blocks(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        b1 = n[1]
+        b2 = np.zeros_like(b1)
+        tiles = 0
+        for tile in n.iter_blocks([1, 2], block_shape=(50, 50)):
+            tiles += 1
+            y0, x0 = tile['y_offset'], tile['x_offset']
+            b2[y0:y0 + tile['y_size'], x0:x0 + tile['x_size']] = tile['bands'][1]
+            self.assertIn(2, tile['bands'])
+            self.assertNotIn('lon', tile)
+
+        self.assertGreater(tiles, 1)
+        self.assertTrue(np.allclose(b1, b2))
+
+    def test_iter_blocks_overlap_lonlat(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        b1 = n[1]
+        lon, lat = n.get_geolocation_grids()
+        for tile in n.iter_blocks(1, block_shape=(50, 50), overlap=5, lonlat=True):
+            x0, y0, xs, ys = tile['window']
+            self.assertTrue(np.allclose(tile['bands'][1], b1[y0:y0 + ys, x0:x0 + xs]))
+            self.assertTrue(np.allclose(tile['lon'], lon[y0:y0 + ys, x0:x0 + xs]))
+            self.assertTrue(np.allclose(tile['lat'], lat[y0:y0 + ys, x0:x0 + xs]))
+            self.assertEqual(tile['bands'][1][tile['core']].shape,
+                             (tile['y_size'], tile['x_size']))
+
+    def test_read_bands(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        bands = n.read_bands([1, 2, 3])
+        out = np.zeros((2,) + n.shape(), 'float32')
+        bands2 = n.read_bands([3, 'L_469'], out=out)
+
+        self.assertEqual(bands.shape, (3,) + n.shape())
+        self.assertEqual(bands.dtype, n[1].dtype)
+        self.assertTrue(np.allclose(bands[1], n[2]))
+        self.assertIs(bands2, out)
+        self.assertTrue(np.allclose(out[0], n[3]))
+        self.assertTrue(np.allclose(out[1], n['L_469']))
+        with self.assertRaises(ValueError):
+            n.read_bands([1, 2, 3], out=out)
+
+    def test_read_bands_expression_swathmask(self):
+        n = Nansat(self.test_file_gcps, log_level=40, mapper=self.default_mapper)
+        n.add_band(np.zeros(n.shape()), {'expression': 'self[1] * 0.5'})
+        n.reproject(Domain(4326, "-te 27 70 30 72 -ts 500 500"))
+        bands = n.read_bands([1, 4], dtype='float32')
+
+        self.assertEqual(bands.dtype, np.float32)
+        # integer band is not post-processed (as in n[1])
+        self.assertTrue(np.all(bands[0] == n[1]))
+        np.testing.assert_allclose(bands[1], n[4], rtol=1e-6)
+        self.assertTrue(np.isnan(bands[1, 0, 0]))
+
     @patch.object(Nansat, 'digitize_points')
     def test_crop_interactive(self, mock_digitize_points):
         mock_digitize_points.return_value=[np.array([[10, 20], [10, 30]])]
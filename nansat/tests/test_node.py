@@ -70,6 +70,35 @@ class NodeTest(unittest.TestCase):
         rawElement = root.children[0]
         self.assertEqual(fileElement.xml(), rawElement.xml())
 
+    def test_create_keeps_namespaces(self):
+        contents = ('<product xmlns="http://www.rsi.ca/rs2/prod/xml/schemas" '
+                    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+                    '<satellite xsi:type="string">RADARSAT-2</satellite>'
+                    '</product>')
+        root = Node.create(contents)
+        self.assertEqual(root.tag, 'product')
+        self.assertEqual(root['satellite'], 'RADARSAT-2')
+        self.assertEqual(root.node('satellite').getAttribute('xsi:type'), 'string')
+        self.assertEqual(root.getAttribute('xmlns:xsi'),
+                         'http://www.w3.org/2001/XMLSchema-instance')
+        self.assertEqual(root.rawxml(), contents)
+
+    def test_create_collapses_whitespace(self):
+        contents = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<Root>\n  <Sub attr="a   b">  some\n   value </Sub>\n</Root>')
+        root = Node.create(contents)
+        self.assertEqual(root['Sub'], 'some value')
+        self.assertEqual(root.node('Sub').getAttribute('attr'), 'a b')
+        self.assertEqual(root.rawxml(), '<Root><Sub attr="a b">some value</Sub></Root>')
+
+    def test_rawxml_escape(self):
+        root = Node('Root', value='1 < 2 & 3 > 2', attr='"q" & <a>')
+        root2 = Node.create(root.rawxml())
+        self.assertEqual(root2.value, root.value)
+        self.assertEqual(root2.getAttribute('attr'), root.getAttribute('attr'))
+        self.assertEqual(root.rawxml(), ('<Root attr="&quot;q&quot; &amp; &lt;a&gt;">'
+                                         '1 &lt; 2 &amp; 3 &gt; 2</Root>'))
+
     def test_delete_attribute(self):
         tag = 'Root'
         value = '   Value   '
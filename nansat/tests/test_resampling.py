@@ -0,0 +1,136 @@
+# ------------------------------------------------------------------------------
+# Name:         test_resampling.py
+# Purpose:      Test the reusable resampling index
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+from __future__ import absolute_import
+import os
+import unittest
+
+import numpy as np
+
+from nansat import Nansat, Domain
+from nansat.resampling import ResamplingIndex, KDTreeResampler, SCIPY_IS_INSTALLED
+from nansat.tests.nansat_test_base import NansatTestBase
+
+
+class ResamplingIndexTest(NansatTestBase):
+    def setUp(self):
+        super(ResamplingIndexTest, self).setUp()
+        self.src_domain = Domain(4326, '-te 0 0 10 10 -ts 100 100')
+        self.dst_domain = Domain(4326, '-te 2.05 2.05 12.05 7.05 -ts 50 25')
+        self.array = np.random.randn(100, 100).astype(np.float32)
+
+    def test_build_nearest(self):
+        index = self.dst_domain.build_resampling_index(self.src_domain)
+
+        self.assertEqual(index.index.dtype, np.int32)
+        self.assertEqual(index.index.shape, (25, 50))
+        self.assertIsNone(index.weights)
+        # center of destination pixel (0, 0) at 2.15E 6.95N is in source pixel (row 30, col 21)
+        self.assertEqual(index.index[0, 0], 30 * 100 + 21)
+        # destination east of 10E is outside of source
+        self.assertTrue((index.index[:, -10:] == -1).all())
+
+    def test_apply_bilinear(self):
+        index = self.dst_domain.build_resampling_index(self.src_domain, method='bilinear')
+        cols, rows = np.meshgrid(np.arange(100), np.arange(100))
+        dst_array = index.apply(cols.astype(np.float32))
+
+        self.assertEqual(index.weights.dtype, np.float32)
+        self.assertTrue(np.allclose(dst_array[:, 0], 21))
+        self.assertTrue(np.isnan(dst_array[:, -10:]).all())
+
+    def test_save_load(self):
+        index1 = self.dst_domain.build_resampling_index(self.src_domain, method='bilinear')
+        filename = os.path.join(self.tmp_data_path, 'resampling_index.npz')
+        index1.save(filename)
+        index2 = ResamplingIndex.load(filename)
+
+        self.assertEqual(index2.method, 'bilinear')
+        self.assertEqual(index2.src_shape, (100, 100))
+        self.assertTrue(np.allclose(index2.apply(self.array), index1.apply(self.array),
+                                    equal_nan=True))
+        self.assertEqual(index2.get_dst_vrt().dataset.GetGeoTransform(),
+                         self.dst_domain.vrt.dataset.GetGeoTransform())
+
+    def test_wrong_method_and_shape(self):
+        with self.assertRaises(ValueError):
+            self.dst_domain.build_resampling_index(self.src_domain, method='cubic')
+        index = self.dst_domain.build_resampling_index(self.src_domain)
+        with self.assertRaises(ValueError):
+            index.apply(self.array[:50])
+
+    def test_apply_resampling_index(self):
+        n = Nansat.from_domain(self.src_domain, self.array, {'name': 'band1'})
+        n.add_band(self.array * 2, {'name': 'band2'})
+        index = self.dst_domain.build_resampling_index(n)
+        n_dst = n.apply_resampling_index(index, ['band1', 'band2'])
+        n.reproject(self.dst_domain, addmask=False)
+
+        self.assertEqual(n_dst.shape(), (25, 50))
+        self.assertTrue(n_dst.has_band('band2'))
+        self.assertTrue(np.allclose(n_dst['band1'][:, :30], n['band1'][:, :30]))
+        self.assertTrue(np.allclose(n_dst['band2'], n_dst['band1'] * 2, equal_nan=True))
+
+
+
+@unittest.skipUnless(SCIPY_IS_INSTALLED, 'Scipy is not installed')
+class KDTreeResamplerTest(NansatTestBase):
+    def setUp(self):
+        super(KDTreeResamplerTest, self).setUp()
+        # swath crossing the dateline near the pole
+        lon, self.lat = np.meshgrid(np.linspace(170, 190, 200), np.linspace(80, 85, 100))
+        self.lon = (lon + 180) % 360 - 180
+        dst_lon, self.dst_lat = np.meshgrid(np.linspace(175, 185, 50), np.linspace(81, 84, 30))
+        self.dst_lon = (dst_lon + 180) % 360 - 180
+
+    def test_resample(self):
+        for method in KDTreeResampler.METHODS:
+            resampler = KDTreeResampler(self.lon, self.lat, method=method, chunk_size=500)
+            dst_lat, dst_ones = resampler.resample([self.lat, np.ones(self.lat.shape, np.uint8)],
+                                                   self.dst_lon, self.dst_lat)
+
+            self.assertEqual(dst_lat.shape, (30, 50))
+            self.assertTrue(np.allclose(dst_lat, self.dst_lat, atol=0.03))
+            self.assertTrue(np.allclose(dst_ones, 1))
+
+    def test_resample_outside_radius(self):
+        resampler = KDTreeResampler(self.lon, self.lat, method='idw', radius_of_influence=10000)
+        dst_lat, = resampler.resample([self.lat], np.array([0., 175.]), np.array([0., 82.]))
+
+        self.assertTrue(np.isnan(dst_lat[0]))
+        self.assertTrue(np.isfinite(dst_lat[1]))
+
+    def test_reproject_kdtree(self):
+        n = Nansat.from_domain(Domain.from_lonlat(self.lon, self.lat), self.lat, {'name': 'lat'})
+        dst_domain = Domain.from_lonlat(self.dst_lon, self.dst_lat, add_gcps=False)
+        n.reproject(dst_domain, engine='kdtree', method='gauss')
+
+        self.assertEqual(n.shape(), (30, 50))
+        self.assertTrue(np.allclose(n['lat'], self.dst_lat, atol=0.03))
+        self.assertTrue(n.has_band('swathmask'))
+        n.undo()
+        self.assertEqual(n.shape(), (100, 200))
+
+    def test_reproject_kdtree_in_blocks_replaces_swathmask(self):
+        n = Nansat.from_domain(Domain.from_lonlat(self.lon, self.lat), self.lat, {'name': 'lat'})
+        dst_domain = Domain.from_lonlat(self.dst_lon, self.dst_lat, add_gcps=False)
+        n.reproject(dst_domain, engine='kdtree', chunk_size=120, warp_memory_mb=0)
+        n.reproject(dst_domain, engine='kdtree', chunk_size=120)
+
+        band_names = [n.get_metadata(band_id=i, key='name') for i in n.bands()]
+        self.assertEqual(band_names.count('swathmask'), 1)
+        self.assertEqual(len(band_names), 2)
+        self.assertTrue(np.allclose(n['lat'], self.dst_lat, atol=0.03))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,6 +26,7 @@ import pythesint as pti
 from nansat.node import Node
 from nansat.nsr import NSR
 from nansat.vrt import VRT
+from nansat.gcps import select_gcps
 from nansat.tests.nansat_test_base import NansatTestBase
 
 from nansat.exceptions import NansatProjectionError
@@ -106,7 +107,33 @@ class VRTTest(NansatTestBase):
         self.assertEqual(vrt.dataset.RasterYSize, array.shape[0])
         self.assertEqual(vrt.dataset.RasterCount, 1)
         self.assertIn('filename', list(vrt.dataset.GetMetadata().keys()))
-        self.assertEqual(gdal.Unlink(vrt.filename.replace('.vrt', '.raw')), 0)
+        self.assertTrue(np.all(vrt.dataset.ReadAsArray() == array))
+        # no copy of data in VSI memory
+        self.assertIsNone(gdal.VSIStatL(vrt.filename.replace('.vrt', '.raw')))
+
+    def test_from_array_is_not_copied(self):
+        array = np.zeros((10, 20), 'float32')
+        vrt = VRT.from_array(array)
+        array[5, 5] = 1
+
+        self.assertEqual(vrt.dataset.ReadAsArray()[5, 5], 1)
+
+    def test_from_array_strided(self):
+        array = np.random.randn(10, 20) + 1j * np.random.randn(10, 20)
+        vrt = VRT.from_array(array.real[::-1, ::2])
+
+        self.assertTrue(np.allclose(vrt.dataset.ReadAsArray(), array.real[::-1, ::2]))
+
+    def test_from_array_nomem(self):
+        array = gdal.Open(self.test_file_gcps).ReadAsArray()[1, 10:, :]
+        vrt = VRT.from_array(array, nomem=True)
+        raw_filename = vrt.filename.replace('.vrt', '.raw')
+
+        self.assertFalse(vrt.filename.startswith('/vsimem/'))
+        self.assertTrue(os.path.exists(raw_filename))
+        self.assertTrue(np.all(vrt.dataset.ReadAsArray() == array))
+        vrt = None
+        self.assertFalse(os.path.exists(raw_filename))
 
     def test_from_lonlat(self):
         geo_keys = ['LINE_OFFSET', 'LINE_STEP', 'PIXEL_OFFSET', 'PIXEL_STEP', 'SRS',
@@ -365,6 +392,36 @@ class VRTTest(NansatTestBase):
         vrt.dataset.GetRasterBand(1).SetMetadata({'name':'band1'})
         self.assertEqual(vrt._create_band_name({'name': 'band1'}), ('band1_0000', {}))
 
+    def test_band_index(self):
+        self.mock_pti['get_wkv_variable'].side_effect = IndexError
+        vrt = VRT.from_array(np.zeros((10,10)))
+        vrt.create_band({'SourceFilename': vrt.filename, 'SourceBand': 1},
+                        {'name': 'band2', 'standard_name': 'std_name2'})
+        band_index = vrt.band_index
+        self.assertEqual(band_index['name']['band2'], 2)
+        self.assertEqual(band_index['standard_name']['std_name2'], 2)
+        self.assertEqual(band_index['metadata'][2]['name'], 'band2')
+        self.assertIs(vrt.band_index, band_index)
+
+        vrt.dataset.GetRasterBand(2).SetMetadataItem(str('name'), str('band3'))
+        vrt.invalidate_band_index()
+        self.assertEqual(vrt.band_index['name']['band3'], 2)
+        self.assertNotIn('band2', vrt.band_index['name'])
+
+    def test_band_index_after_rename_and_create_band(self):
+        self.mock_pti['get_wkv_variable'].side_effect = IndexError
+        vrt = VRT.from_array(np.zeros((10,10)))
+        vrt.dataset.GetRasterBand(1).SetMetadataItem(str('name'), str('band1'))
+        self.assertIn('band1', vrt.band_index['name'])
+
+        vrt.dataset.GetRasterBand(1).SetMetadataItem(str('name'), str('Rrs_443'))
+        name = vrt.create_band({'SourceFilename': vrt.filename, 'SourceBand': 1},
+                               {'name': 'Rrs_443'})
+        self.assertEqual(name, 'Rrs_443_0000')
+        self.assertEqual(vrt.band_index['name']['Rrs_443'], 1)
+        self.assertEqual(vrt.band_index['name']['Rrs_443_0000'], 2)
+        self.assertNotIn('band1', vrt.band_index['name'])
+
     def test_create_band_name_wkv_and_name(self):
         name = 'some_name'
         wkv = dict(short_name='sigma0')
@@ -552,6 +609,108 @@ class VRTTest(NansatTestBase):
         self.assertTrue(vrt2.geolocation.x_vrt is not None)
         self.assertTrue(vrt2.geolocation.y_vrt is not None)
 
+    def test_get_super_vrt_shares_history(self):
+        array = np.random.randn(10, 10)
+        vrt1 = VRT.from_array(array)
+        vrt2 = vrt1.get_super_vrt()
+        vrt3 = vrt2.get_super_vrt()
+
+        self.assertIs(vrt2.vrt, vrt1)
+        self.assertIs(vrt3.vrt, vrt2)
+        self.assertIs(vrt3.vrt.vrt, vrt1)
+        self.assertTrue(np.allclose(vrt3.dataset.ReadAsArray(), array))
+
+    def test_copy_shares_sub_vrt(self):
+        array = np.random.randn(10, 10)
+        vrt1 = VRT.from_array(array).get_super_vrt()
+        vrt2 = vrt1.copy()
+
+        self.assertIsNot(vrt2, vrt1)
+        self.assertNotEqual(vrt2.filename, vrt1.filename)
+        self.assertIs(vrt2.vrt, vrt1.vrt)
+        vrt1 = None
+        self.assertTrue(np.allclose(vrt2.dataset.ReadAsArray(), array))
+
+    def test_close(self):
+        with self.assertNoVSIMemLeaks():
+            vrt1 = VRT.from_array(np.random.randn(10, 10))
+            vrt2 = vrt1.get_super_vrt()
+            vrt2.close()
+
+            self.assertIsNone(vrt2.vrt)
+            self.assertIsNone(vrt2.dataset)
+            self.assertIsNone(vrt1.dataset)
+
+    def test_close_keeps_shared_history(self):
+        array = np.random.randn(10, 10)
+        with self.assertNoVSIMemLeaks():
+            vrt1 = VRT.from_array(array).get_super_vrt()
+            vrt2 = vrt1.copy()
+            vrt1.close()
+
+            self.assertTrue(np.allclose(vrt2.dataset.ReadAsArray(), array))
+            vrt2.close()
+
+    def test_xml_edit(self):
+        array = np.random.randn(40, 50)
+        vrt = VRT.from_array(array).get_super_vrt()
+        with patch('nansat.vrt.gdal.Open', wraps=gdal.Open) as mock_open:
+            vrt.begin_xml_edit()
+            vrt.set_offset_size('x', 5, 30)
+            vrt.set_offset_size('y', 10, 20)
+            self.assertEqual(mock_open.call_count, 0)
+            vrt.commit_xml_edit()
+            self.assertEqual(mock_open.call_count, 1)
+
+        self.assertTrue(np.allclose(vrt.dataset.ReadAsArray(), array[10:30, 5:35]))
+        with self.assertRaises(ValueError):
+            vrt.commit_xml_edit()
+
+    def test_xml_cache(self):
+        vrt = VRT.from_array(np.random.randn(10, 10))
+        vrt.write_xml(vrt.xml.replace('<VRTDataset', '<VRTDataset '))
+        with patch.object(VRT, 'read_vsi', wraps=VRT.read_vsi) as mock_read_vsi:
+            xml1 = vrt.xml
+            self.assertEqual(mock_read_vsi.call_count, 0)
+            vrt.dataset.SetMetadataItem(str('new_key'), str('new_value'))
+            xml2 = vrt.xml
+            self.assertEqual(mock_read_vsi.call_count, 1)
+
+        self.assertNotIn('new_key', xml1)
+        self.assertIn('new_key', xml2)
+
+    def test_get_gcp_subset(self):
+        ds = gdal.Open(self.test_file_gcps)
+        vrt1 = VRT.from_gdal_dataset(ds)
+        vrt2 = vrt1.get_super_vrt()
+        with patch('nansat.vrt.select_gcps', wraps=select_gcps) as mock_select_gcps:
+            gcps1 = vrt2.get_gcp_subset(0.5, tps=True)
+            gcps2 = vrt2.get_super_vrt().get_gcp_subset(0.5, tps=True)
+            self.assertEqual(mock_select_gcps.call_count, 1)
+
+        self.assertTrue(0 < len(gcps1) <= len(ds.GetGCPs()))
+        self.assertEqual([gcp.GCPX for gcp in gcps1], [gcp.GCPX for gcp in gcps2])
+        self.assertEqual(len(vrt1._gcp_subsets), 1)
+
+    def test_get_compacted_vrt(self):
+        array = np.random.randn(40, 50).astype(np.float32)
+        vrt1 = VRT.from_array(array)
+        vrt2 = vrt1.get_super_vrt()
+        vrt2.set_offset_size('x', 5, 30)
+        vrt2.set_offset_size('y', 10, 20)
+        vrt3 = vrt2.get_super_vrt()
+        vrt3.set_offset_size('x', 2, 10)
+        vrt3.set_offset_size('y', 3, 10)
+        vrt4 = vrt3.get_super_vrt()
+        compact_vrt = vrt4.get_compacted_vrt()
+        chain_info = compact_vrt.get_chain_info()
+
+        self.assertIs(compact_vrt.vrt, vrt3)
+        self.assertTrue(np.allclose(compact_vrt.dataset.ReadAsArray(), array[13:23, 7:17]))
+        self.assertEqual(chain_info['depth'], 4)
+        self.assertEqual(len(chain_info['levels']), 4)
+        self.assertLess(chain_info['read_depth'], vrt4.get_chain_info()['read_depth'])
+
     def test_get_super_vrt_and_copy(self):
         array = np.zeros((10,10))
         vrt = VRT.from_array(array)
@@ -588,6 +747,41 @@ class VRTTest(NansatTestBase):
         self.assertTrue(np.allclose(lon, np.array([])))
         self.assertTrue(np.allclose(lat, np.array([])))
 
+    def test_transform_points_affine(self):
+        ds = gdal.Open(self.test_file_stere)
+        vrt = VRT.from_gdal_dataset(ds)
+        cols, rows = np.meshgrid(np.arange(0, 200, 10), np.arange(0, 200, 10))
+        options = ['SRC_SRS=' + vrt.get_projection()[0], 'DST_SRS=' + NSR().wkt]
+        lon1, lat1 = vrt.transform_points(cols, rows)
+        lon2, lat2 = vrt.transform_points(cols.flatten(), rows.flatten(), options=options)
+        cols2, rows2 = vrt.transform_points(lon1, lat1, dst2src=1)
+
+        self.assertTrue(vrt._has_affine_georeference())
+        self.assertEqual(lon1.shape, (20, 20))
+        self.assertTrue(np.allclose(lon1.flatten(), lon2))
+        self.assertTrue(np.allclose(lat1.flatten(), lat2))
+        self.assertTrue(np.allclose(cols2, cols))
+        self.assertTrue(np.allclose(rows2, rows))
+
+    def test_transform_points_cached_chunks(self):
+        ds = gdal.Open(self.test_file_gcps)
+        vrt = VRT.from_gdal_dataset(ds, metadata=ds.GetMetadata())
+        cols, rows = np.meshgrid(np.arange(0, 200, 5), np.arange(0, 200, 5))
+        lon1, lat1 = vrt.transform_points(cols, rows)
+        transformers = vrt._transformers[1]
+        chunk_size = VRT.TRANSFORM_CHUNK_SIZE
+        VRT.TRANSFORM_CHUNK_SIZE = 100
+        try:
+            lon2, lat2 = vrt.transform_points(cols, rows, workers=3)
+        finally:
+            VRT.TRANSFORM_CHUNK_SIZE = chunk_size
+
+        self.assertFalse(vrt._has_affine_georeference())
+        self.assertIs(vrt._transformers[1], transformers)
+        self.assertEqual(len(list(transformers.values())[0]), 3)
+        self.assertTrue(np.allclose(lon1, lon2))
+        self.assertTrue(np.allclose(lat1, lat2))
+
     def test_make_filename(self):
         filename1 = VRT._make_filename()
         filename2 = VRT._make_filename(extention='smth')
@@ -0,0 +1,106 @@
+# ------------------------------------------------------------------------------
+# Name:         test_vsimem.py
+# Purpose:      Test the registry of files in VSI memory
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+from __future__ import absolute_import
+import os
+import unittest
+
+import numpy as np
+
+from nansat import vsimem
+from nansat.vrt import VRT
+from nansat.tests.nansat_test_base import NansatTestBase
+
+
+class VSIMemTest(NansatTestBase):
+    def tearDown(self):
+        vsimem.set_budget(None)
+        super(VSIMemTest, self).tearDown()
+
+    def _get_files(self, vrt, kind):
+        return [info for info in vsimem.get_files()
+                if info['owner'] and vrt.filename in info['owner'] and info['kind'] == kind]
+
+    def _create_raw_vrt(self, array):
+        vrt = VRT(x_size=array.shape[1], y_size=array.shape[0])
+        vrt.write_xml(vrt._get_raw_array_xml(array, 'Float64'))
+        return vrt
+
+    def test_register_vrt(self):
+        vrt = VRT()
+        filename = vrt.filename
+        files = self._get_files(vrt, 'vrt')
+
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0]['filename'], filename)
+        self.assertTrue(files[0]['in_memory'])
+        self.assertIn('test_vsimem.py', files[0]['site'])
+        self.assertIn(filename, vsimem.report())
+        vrt = None
+        self.assertNotIn(filename, [info['filename'] for info in vsimem.get_files()])
+
+    def test_raw_file_size(self):
+        array = np.random.randn(100, 100)
+        size0 = vsimem.get_total_size()
+        vrt = self._create_raw_vrt(array)
+        files = self._get_files(vrt, 'raw')
+
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0]['size'], array.nbytes)
+        self.assertTrue(files[0]['in_memory'])
+        self.assertGreaterEqual(vsimem.get_total_size() - size0, array.nbytes)
+
+    def test_raw_file_over_budget_on_disk(self):
+        array = np.random.randn(100, 100)
+        vsimem.set_budget(vsimem.get_total_size() + array.nbytes // 2)
+        vrt = self._create_raw_vrt(array)
+        files = self._get_files(vrt, 'raw')
+
+        self.assertFalse(files[0]['in_memory'])
+        self.assertTrue(os.path.exists(files[0]['filename']))
+        self.assertTrue(np.allclose(vrt.dataset.ReadAsArray(), array))
+        vrt = None
+        self.assertFalse(os.path.exists(files[0]['filename']))
+
+    def test_set_budget_moves_lru_file_to_disk(self):
+        array = np.random.randn(100, 100)
+        vrt1 = self._create_raw_vrt(array)
+        vrt2 = self._create_raw_vrt(array)
+        vsimem.set_budget(vsimem.get_total_size() - array.nbytes // 2)
+
+        self.assertFalse(self._get_files(vrt1, 'raw')[0]['in_memory'])
+        self.assertTrue(self._get_files(vrt2, 'raw')[0]['in_memory'])
+        self.assertTrue(np.allclose(vrt1.dataset.ReadAsArray(), array))
+
+    def test_set_budget_keeps_recently_used_file(self):
+        array = np.random.randn(100, 100)
+        vrt1 = self._create_raw_vrt(array)
+        vrt2 = self._create_raw_vrt(array)
+        vrt1._touch_files()
+        vsimem.set_budget(vsimem.get_total_size() - array.nbytes // 2)
+
+        self.assertTrue(self._get_files(vrt1, 'raw')[0]['in_memory'])
+        self.assertFalse(self._get_files(vrt2, 'raw')[0]['in_memory'])
+
+    def test_total_size_is_updated(self):
+        array = np.random.randn(100, 100)
+        size0 = vsimem.get_total_size()
+        vrt = self._create_raw_vrt(array)
+        size1 = vsimem.get_total_size()
+        vrt = None
+
+        self.assertGreaterEqual(size1 - size0, array.nbytes)
+        self.assertEqual(vsimem.get_total_size(), size0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -420,6 +420,19 @@ numpy_to_gdal_type = {
     'complex64': 'CFloat32',
     'complex128': 'CFloat64'}
 
+gdal_type_to_numpy = {
+    'Byte': 'uint8',
+    'UInt16': 'uint16',
+    'Int16': 'int16',
+    'UInt32': 'uint32',
+    'Int32': 'int32',
+    'Float32': 'float32',
+    'Float64': 'float64',
+    'CInt16': 'complex64',
+    'CInt32': 'complex128',
+    'CFloat32': 'complex64',
+    'CFloat64': 'complex128'}
+
 gdal_type_to_offset = {
     'Byte': '1',
     'UInt16': '2',
@@ -17,18 +17,23 @@
 from __future__ import absolute_import, unicode_literals, division
 import os
 import tempfile
+import weakref
+from multiprocessing.pool import ThreadPool
 from string import Template, ascii_uppercase, digits
 from random import choice
 import warnings
+from xml.sax import saxutils
 import pythesint as pti
 
 import osr
 import gdal
 import numpy as np
 
+from nansat import config, vsimem
+from nansat.gcps import select_gcps
 from nansat.node import Node
 from nansat.nsr import NSR
-from nansat.geolocation import Geolocation
+from nansat.geolocation import Geolocation, regularize_tie_points
 from nansat.tools import add_logger, numpy_to_gdal_type, gdal_type_to_offset, remove_keys
 
 from nansat.exceptions import NansatProjectionError
@@ -66,6 +71,8 @@ class VRT(object):
     input file). After most of the operations with Nansat object
     (e.g. reproject, crop, resize, add_band) self.vrt is replaced with a new
     VRT object which has reference to the previous VRT object inside (self.vrt.vrt).
+    The previous VRT objects are not copied but shared (e.g. between a VRT and its copy)
+    and should not be modified after a new VRT is created on top of them.
 
     Parameters
     ----------
@@ -109,6 +116,26 @@ class VRT(object):
               </VRTRasterBand>
             </VRTDataset> ''')
 
+    MEM_ARRAY_BAND_SOURCE_XML = Template('''
+            <VRTDataset rasterXSize="$XSize" rasterYSize="$YSize">
+              <VRTRasterBand dataType="$DataType" band="1">
+                <SimpleSource>
+                  <SourceFilename relativeToVRT="0">$SrcFileName</SourceFilename>
+                  <SourceBand>1</SourceBand>
+                </SimpleSource>
+              </VRTRasterBand>
+            </VRTDataset> ''')
+
+    # sources and their elements which can be folded by get_compacted_vrt
+    COMPACT_SOURCE_TYPES = ['SimpleSource', 'ComplexSource', 'AveragedSource']
+    COMPACT_SOURCE_TAGS = ['SourceFilename', 'SourceBand', 'SourceProperties', 'SrcRect', 'DstRect',
+                           'ScaleOffset', 'ScaleRatio', 'NODATA', 'LUT']
+    COMPACT_BAND_TAGS = ['Metadata', 'Description', 'ColorInterp', 'UnitType', 'Offset', 'Scale',
+                         'CategoryNames', 'ColorTable', 'SimpleSource', 'ComplexSource']
+
+    # number of points transformed at once by transform_points
+    TRANSFORM_CHUNK_SIZE = 1000000
+
     REPROJECT_TRANSFORMER = Template('''
         <ReprojectTransformer>
           <ReprojectionTransformer>
@@ -119,13 +146,25 @@ class VRT(object):
 
     # instance attributes
     filename = ''
-    vrt = None
-    dataset = None
     logger = None
     driver = None
     band_vrts = None
+    lazy_functions = None
     tps = None
     geolocation = None
+    _band_index = None
+    _array = None
+    _compacted = False
+    _sub_vrt = None
+    _users = None
+    _closed = False
+    _dataset = None
+    _xml_cache = None
+    _xml_pending = None
+    _xml_edit_depth = 0
+    _gcp_subsets = None
+    _footprints = None
+    _transformers = None
 
     @classmethod
     def from_gdal_dataset(cls, gdal_dataset, **kwargs):
@@ -230,6 +269,37 @@ class VRT(object):
         vrt._init_from_lonlat(lon, lat, add_gcps, **kwargs)
         return vrt
 
+    @classmethod
+    def from_tie_points(cls, lon, lat, pixel, line, x_size, y_size, add_gcps=True, **kwargs):
+        """Create VRT with geolocation given by tie-point grids of longitude and latitude
+
+        Only the small tie-point grids are stored (in GEOLOCATION with PIXEL_OFFSET,
+        PIXEL_STEP, LINE_OFFSET, LINE_STEP). Full resolution longitudes and latitudes are
+        interpolated on demand (see Geolocation.get_geolocation_grids). Tie points at
+        irregular pixels/lines are first interpolated onto regularly spaced pixels/lines.
+
+        Parameters
+        ----------
+        lon, lat : numpy.ndarray
+            2D grids with longitudes and latitudes of tie points
+        pixel, line : numpy.ndarray
+            1D vectors with pixel and line coordinates of columns and rows of tie points
+        x_size, y_size : int
+            size of the dataset
+        add_gcps : bool
+            Create GCPs from tie points and add to dataset
+        **kwargs : dict
+            arguments for VRT() and VRT._tie_points2gcps
+
+        Returns
+        -------
+        vrt : VRT
+
+        """
+        vrt = cls.__new__(cls)
+        vrt._init_from_tie_points(lon, lat, pixel, line, x_size, y_size, add_gcps, **kwargs)
+        return vrt
+
     @classmethod
     def copy_dataset(cls, gdal_dataset, **kwargs):
         """Create VRT with bands and georefernce as a full copy of input GDAL Dataset
@@ -260,8 +330,10 @@ class VRT(object):
         self.driver = gdal.GetDriverByName(str('VRT'))
         self.filename = str(VRT._make_filename(nomem=nomem))
         self.band_vrts = dict()
+        self.lazy_functions = []
         self.tps = False
         self.vrt = None
+        vsimem.register(self.filename, self)
 
         # create dataset
         self.dataset = self.driver.Create(self.filename, x_size, y_size, bands=0)
@@ -345,58 +417,112 @@ class VRT(object):
         # write file contents
         self.dataset.FlushCache()
 
-    def _init_from_array(self, array, **kwargs):
+    def _init_from_array(self, array, nomem=False, **kwargs):
         """Init VRT from numpy array with dataset wih one band but without georeference.
 
-        Write contents of the array into flat binary file (VSI)
-        Write VRT file with RawRastesrBand, which points to the binary file
-        Open the VRT file as self.dataset with GDAL
+        By default, no copy of the array is made: the band is a GDAL MEM dataset
+        which points to the array data, and the array is kept alive by the VRT
+        object. Changing values in the array therefore changes the band.
+        If nomem is True, the array is written into a flat binary file on disk.
+        If GDAL cannot open MEM dataset from the pointer, the array is written
+        into flat binary file in VSI memory.
 
         Parameters
         ----------
         array : numpy.ndarray
             array with data
+        nomem : bool
+            write data into a binary file on disk?
         **kwargs : dict
             arguments for VRT()
 
         Notes
         ---------
-        binary file is written (VSI)
+        binary file is written (only if nomem is True or MEM dataset is not available)
         VRT file is written (VSI)
         self - adds all VRT attributes
         self.dataset is updated
 
         """
-        VRT.__init__(self, **kwargs)
-        # create flat binary file (in VSI) from numpy array
-        array_type = array.dtype.name
-        array_shape = array.shape
-        binary_file = self.filename.replace('.vrt', '.raw')
-        ofile = gdal.VSIFOpenL(str(binary_file), str('wb'))
-        gdal.VSIFWriteL(array.tostring(), len(array.tostring()), 1, ofile)
-        gdal.VSIFCloseL(ofile)
-        array = None
+        VRT.__init__(self, nomem=nomem, **kwargs)
+        # convert Numpy datatype to gdal datatype
+        gdal_data_type = numpy_to_gdal_type[array.dtype.name]
 
-        # convert Numpy datatype to gdal datatype and pixel offset
-        gdal_data_type = numpy_to_gdal_type[array_type]
-        pixel_offset = gdal_type_to_offset[gdal_data_type]
+        contents = None
+        if not nomem:
+            contents = self._get_mem_array_xml(array, gdal_data_type)
+        if contents is None:
+            contents = self._get_raw_array_xml(array, gdal_data_type)
+
+        # write XML contents to VRT-file
+        self.write_xml(contents)
+        self.dataset.SetMetadataItem(str('filename'), self.filename)
+        self.dataset.FlushCache()
+
+    def _get_mem_array_xml(self, array, gdal_data_type):
+        """Create VRT XML with a band which refers to MEM dataset pointing to the array data
+
+        Returns None if GDAL cannot open MEM dataset from the data pointer.
+        Keeps reference to the array in self._array.
+
+        """
+        if not array.dtype.isnative or min(array.strides) <= 0:
+            array = np.ascontiguousarray(array, array.dtype.newbyteorder('='))
+        mem_filename = ('MEM:::DATAPOINTER=0x%x,PIXELS=%d,LINES=%d,BANDS=1,DATATYPE=%s,'
+                        'PIXELOFFSET=%d,LINEOFFSET=%d' % (array.__array_interface__['data'][0],
+                        array.shape[1], array.shape[0], gdal_data_type,
+                        array.strides[1], array.strides[0]))
+        try:
+            mem_dataset = gdal.Open(str(mem_filename))
+        except RuntimeError:
+            mem_dataset = None
+        if mem_dataset is None:
+            self.logger.debug('Cannot open MEM dataset. Array is copied to VSI memory.')
+            return None
+        mem_dataset = None
+        self._array = array
+        return self.MEM_ARRAY_BAND_SOURCE_XML.substitute(
+            XSize=array.shape[1],
+            YSize=array.shape[0],
+            DataType=gdal_data_type,
+            SrcFileName=mem_filename)
+
+    def _get_raw_array_xml(self, array, gdal_data_type):
+        """Write array into flat binary file and create VRT XML with RawRasterBand pointing to it
+
+        The file is written on disk or in VSI memory (depending on self.filename) row by row,
+        without making a full copy of the array.
+
+        """
+        binary_file = self.filename.replace('.vrt', '.raw')
+        if binary_file.startswith('/vsimem/') and vsimem.is_over_budget(array.nbytes):
+            # spill to disk if memory budget is exceeded
+            binary_file = VRT._make_filename(extention='raw', nomem=True)
+            self.logger.debug('Memory budget is exceeded. Array is written to %s' % binary_file)
+        if binary_file.startswith('/vsimem/'):
+            ofile = gdal.VSIFOpenL(str(binary_file), str('wb'))
+            rows_per_chunk = max(1, 2**24 // max(array[:1].nbytes, 1))
+            for row in range(0, array.shape[0], rows_per_chunk):
+                chunk = array[row:row + rows_per_chunk].tobytes()
+                gdal.VSIFWriteL(chunk, len(chunk), 1, ofile)
+            gdal.VSIFCloseL(ofile)
+        else:
+            array.tofile(binary_file)
+        vsimem.register(binary_file, self, 'raw', array.nbytes)
+        vsimem.enforce_budget()
 
         # create XML contents of VRT-file
-        line_offset = str(int(pixel_offset) * array_shape[1])
-        contents = self.RAW_RASTER_BAND_SOURCE_XML.substitute(
-            XSize=array_shape[1],
-            YSize=array_shape[0],
+        pixel_offset = gdal_type_to_offset[gdal_data_type]
+        line_offset = str(int(pixel_offset) * array.shape[1])
+        return self.RAW_RASTER_BAND_SOURCE_XML.substitute(
+            XSize=array.shape[1],
+            YSize=array.shape[0],
             DataType=gdal_data_type,
             BandNum=1,
             SrcFileName=binary_file,
             PixelOffset=pixel_offset,
             LineOffset=line_offset)
 
-        # write XML contents to VRT-file
-        self.write_xml(contents)
-        self.dataset.SetMetadataItem(str('filename'), self.filename)
-        self.dataset.FlushCache()
-
     def _init_from_lonlat(self, lon, lat, add_gcps=True, **kwargs):
         """Init VRT from longitude, latitude arrays
 
@@ -429,6 +555,22 @@ class VRT(object):
         self.dataset.SetMetadataItem(str('filename'), self.filename)
         self.dataset.FlushCache()
 
+    def _init_from_tie_points(self, lon, lat, pixel, line, x_size, y_size, add_gcps=True,
+                              **kwargs):
+        """Init VRT from tie-point grids of longitude, latitude (see VRT.from_tie_points)"""
+        lon, lat, pixel_offset, pixel_step, line_offset, line_step = regularize_tie_points(
+            lon, lat, pixel, line)
+        VRT.__init__(self, x_size, y_size, **kwargs)
+        if add_gcps:
+            self.dataset.SetGCPs(VRT._tie_points2gcps(lon, lat, pixel_offset, pixel_step,
+                                                      line_offset, line_step, **kwargs),
+                                 NSR().wkt)
+        self._add_geolocation(Geolocation(VRT.from_array(lon), VRT.from_array(lat),
+                                          pixel_offset=pixel_offset, pixel_step=pixel_step,
+                                          line_offset=line_offset, line_step=line_step))
+        self.dataset.SetMetadataItem(str('filename'), self.filename)
+        self.dataset.FlushCache()
+
     def _copy_from_dataset(self, gdal_dataset, geolocation=None, **kwargs):
         """Init VRT with bands and georefernce as a full copy of input GDAL Dataset
 
@@ -457,6 +599,10 @@ class VRT(object):
 
     def __del__(self):
         """Destructor deletes VRT and RAW files"""
+        self._delete_files()
+
+    def _delete_files(self):
+        """Close dataset and delete VRT and RAW files"""
         self.dataset = None
 
         if gdal.VSIStatL(self.filename) is not None:
@@ -465,6 +611,111 @@ class VRT(object):
         if gdal.VSIStatL(self.filename.replace('vrt', 'raw')) is not None:
             gdal.Unlink(self.filename.replace('vrt', 'raw'))
 
+        vsimem.unregister_owner(self.filename)
+
+    def _touch_files(self):
+        """Mark files of self, of the band VRTs and of the history as recently used in vsimem"""
+        visited = set()
+        vrts = [self]
+        while vrts:
+            vrt = vrts.pop()
+            if vrt is None or id(vrt) in visited:
+                continue
+            visited.add(id(vrt))
+            vsimem.touch_owner(vrt.filename)
+            vrts.extend((vrt.band_vrts or {}).values())
+            vrts.append(vrt.vrt)
+
+    @property
+    def dataset(self):
+        """GDAL dataset of the VRT file
+
+        Pending edits of XML (see begin_xml_edit) are written before the dataset is returned.
+        The cached XML is discarded because the dataset can be modified by the caller. Code
+        which only reads from the dataset should use _dataset_readonly.
+
+        """
+        self._xml_cache = None
+        return self._dataset_readonly
+
+    @property
+    def _dataset_readonly(self):
+        """GDAL dataset of the VRT file for reading only (the cached XML is kept)"""
+        if self._xml_pending is not None:
+            self._write_pending_xml()
+        return self._dataset
+
+    @dataset.setter
+    def dataset(self, dataset):
+        """Set GDAL dataset and discard cached XML"""
+        self._xml_cache = None
+        self._xml_pending = None
+        self._dataset = dataset
+
+    @property
+    def vrt(self):
+        """Sub-VRT object (the previous level of the history) or None"""
+        return self._sub_vrt
+
+    @vrt.setter
+    def vrt(self, sub_vrt):
+        """Set sub-VRT object and register self as its user"""
+        if self._sub_vrt is not None:
+            self._sub_vrt._remove_user(self)
+        if sub_vrt is not None:
+            sub_vrt._add_user(self)
+        self._sub_vrt = sub_vrt
+
+    def _add_user(self, user):
+        """Register VRT object which refers to self (as sub-VRT or band VRT)"""
+        if self._users is None:
+            self._users = weakref.WeakSet()
+        self._users.add(user)
+
+    def _remove_user(self, user):
+        """Unregister VRT object which referred to self"""
+        if self._users is not None:
+            self._users.discard(user)
+
+    def _release(self, user):
+        """Unregister user and close self if it is not used by other open VRT objects"""
+        self._remove_user(user)
+        if self._users is None or not [vrt for vrt in self._users if not vrt._closed]:
+            self.close()
+
+    def close(self):
+        """Close dataset and delete files of self and of all VRT objects used only by self
+
+        The dataset is closed and VRT and RAW files (in VSI memory or on disk) are deleted
+        immediately, without waiting for the garbage collector. The same is done recursively
+        with the sub-VRT (self.vrt), VRTs with band data (self.band_vrts) and VRTs of
+        geolocation, unless they are used by other open VRT objects (e.g. shared history of
+        a copy or geolocation shared with a Domain). Pixel functions of lazy bands are
+        unregistered when no other VRT object refers to them. The object cannot be used after
+        closing.
+
+        """
+        if self._closed:
+            return
+        self._closed = True
+        sub_vrts = list((self.band_vrts or {}).values())
+        if self.vrt is not None:
+            sub_vrts.append(self.vrt)
+        geolocation = self.geolocation
+
+        self.vrt = None
+        self.band_vrts = dict()
+        self.lazy_functions = []
+        self.geolocation = None
+        self._array = None
+        self._band_index = None
+        self._delete_files()
+
+        for sub_vrt in sub_vrts:
+            sub_vrt._release(self)
+        if geolocation is not None:
+            geolocation._release(self)
+
     def __repr__(self):
         str_out = os.path.split(self.filename)[1]
         if self.vrt is not None:
@@ -556,6 +807,7 @@ class VRT(object):
         if geolocation is None:
             return
         self.geolocation = geolocation
+        geolocation._add_user(self)
         self.dataset.SetMetadata(geolocation.data, str('GEOLOCATION'))
         self.dataset.FlushCache()
 
@@ -568,6 +820,8 @@ class VRT(object):
         Sets GEOLOCATION metadata to ''
 
         """
+        if self.geolocation is not None:
+            self.geolocation._remove_user(self)
         self.geolocation = None
 
         # add GEOLOCATION metadata (empty if geolocation is empty)
@@ -589,7 +843,7 @@ class VRT(object):
         # Write the modified elemements back into temporary VRT
         self.write_xml(node0.rawxml())
 
-    def _set_fake_gcps(self, dst_srs, dst_gcps, skip_gcps):
+    def _set_fake_gcps(self, dst_srs, dst_gcps, skip_gcps, gcp_tolerance=None):
         """Create GCPs with reference self.pixel/line ==> dst.pixel/line and set to self.dataset
 
         GCPs from a destination image (dst_gcps) are converted to a gcp of source
@@ -608,6 +862,9 @@ class VRT(object):
             GDAL GCPs
         skip_gcps : int
             number of GCPs to skip
+        gcp_tolerance : float
+            if given, only GCPs needed to reproduce all GCPs within <gcp_tolerance> pixels
+            are used (see nansat.gcps.select_gcps)
 
         Returns
         --------
@@ -636,9 +893,73 @@ class VRT(object):
             fake_gcps.append(gdal.GCP(g.GCPPixel, g.GCPLine,
                                      0, srcPixel, srcLine))
 
+        if gcp_tolerance is not None:
+            fake_gcps = [fake_gcps[i] for i in
+                         VRT._select_gcps(fake_gcps, gcp_tolerance, bool(self.tps))]
         self.dataset.SetGCPs(fake_gcps, NSR('+proj=stere').wkt)
         return None
 
+    @staticmethod
+    def _select_gcps(gcps, tolerance, tps):
+        """Return indices of GCPs selected by nansat.gcps.select_gcps"""
+        return select_gcps([gcp.GCPPixel for gcp in gcps], [gcp.GCPLine for gcp in gcps],
+                           [gcp.GCPX for gcp in gcps], [gcp.GCPY for gcp in gcps],
+                           tolerance, tps)
+
+    def get_gcp_subset(self, tolerance=0.5, tps=None):
+        """Return the smallest subset of GCPs which reproduces all GCPs within tolerance
+
+        GCPs are selected by nansat.gcps.select_gcps. The result is cached on the deepest VRT
+        in the history with the same GCPs, so repeated reprojections reuse it.
+
+        Parameters
+        ----------
+        tolerance : float
+            maximum error in pixels
+        tps : bool
+            select GCPs for thin plate spline (True) or polynomial (False). If None, self.tps
+            is used.
+
+        Returns
+        -------
+        gcps : list of GDAL GCPs
+
+        """
+        if tps is None:
+            tps = bool(self.tps)
+        gcps = self.dataset.GetGCPs()
+        if len(gcps) == 0:
+            return gcps
+        signature = VRT._get_gcps_signature(gcps)
+
+        owner = self
+        for vrt in self.get_chain()[1:]:
+            if VRT._get_gcps_signature(vrt.dataset.GetGCPs()) != signature:
+                break
+            owner = vrt
+        if owner._gcp_subsets is None:
+            owner._gcp_subsets = {}
+        key = (signature, float(tolerance), tps)
+        if key not in owner._gcp_subsets:
+            owner._gcp_subsets[key] = VRT._select_gcps(gcps, tolerance, tps)
+        return [gcps[i] for i in owner._gcp_subsets[key]]
+
+    @staticmethod
+    def _get_gcps_signature(gcps):
+        """Return hashable signature of GCPs"""
+        return hash(tuple((gcp.GCPPixel, gcp.GCPLine, gcp.GCPX, gcp.GCPY) for gcp in gcps))
+
+    def _get_georeference_signature(self):
+        """Return hashable signature of size, geotransform, projection, GCPs and geolocation"""
+        geolocation = None
+        if self.geolocation is not None:
+            geolocation = tuple(sorted(self.geolocation.data.items()))
+        dataset = self._dataset_readonly
+        return hash((dataset.RasterXSize, dataset.RasterYSize,
+                     dataset.GetGeoTransform(), dataset.GetProjection(),
+                     VRT._get_gcps_signature(dataset.GetGCPs()),
+                     dataset.GetGCPProjection(), geolocation))
+
     def _set_geotransform_for_resize(self):
         """Prepare VRT.dataset for resizing."""
         self.dataset.SetMetadata(str(''), str('GEOLOCATION'))
@@ -690,6 +1011,34 @@ class VRT(object):
         # overwrite XML file with updated size, geotranform, etc
         self.write_xml(node0.rawxml())
 
+    def _set_warp_options(self, num_threads=None, warp_memory_mb=None):
+        """Set NUM_THREADS and WarpMemoryLimit in GDALWarpOptions of warped VRT
+
+        Parameters
+        ----------
+        num_threads : int or str
+            number of threads for warping (e.g. 4 or 'ALL_CPUS'). Not changed if None.
+        warp_memory_mb : int
+            memory limit for warping in MB. Not changed if None.
+
+        """
+        node0 = Node.create(str(self.xml))
+        warp_options = node0.node('GDALWarpOptions')
+        if num_threads is not None:
+            for option in warp_options.nodeList('Option'):
+                if option.getAttribute('name') == 'NUM_THREADS':
+                    option.value = str(num_threads)
+                    break
+            else:
+                warp_options += Node('Option', value=str(num_threads), name='NUM_THREADS')
+        if warp_memory_mb is not None:
+            warp_memory_limit = str(float(warp_memory_mb) * 1024**2)
+            if warp_options.node('WarpMemoryLimit'):
+                warp_options.node('WarpMemoryLimit').value = warp_memory_limit
+            else:
+                warp_options += Node('WarpMemoryLimit', value=warp_memory_limit)
+        self.write_xml(node0.rawxml())
+
     def _create_band_name(self, dst):
         """Create band name based on destination band dictionary <dst>"""
         band_name = dst.get('name', None)
@@ -712,8 +1061,10 @@ class VRT(object):
                  band_name += '_' + dst['suffix']
 
         # create list of available bands (to prevent duplicate names)
-        band_names = [self.dataset.GetRasterBand(i + 1).GetMetadataItem(str('name'))
-                        for i in range(self.dataset.RasterCount)]
+        # names are read from the dataset: mappers can rename bands directly
+        dataset = self._dataset_readonly
+        band_names = [dataset.GetRasterBand(i + 1).GetMetadataItem(str('name'))
+                      for i in range(dataset.RasterCount)]
 
         # check if name already exist and add '_NNNN'
         dst_band_name = band_name
@@ -849,12 +1200,13 @@ class VRT(object):
         return add_gcps
 
     def copy(self):
-        """Create and return a full copy of a VRT instance with new filenames
+        """Create and return a copy of the top level of a VRT instance with new filename
 
         If self.dataset has no bands, the copy is created also without bands.
         If self.dataset has bands, the copy is created from the dataset with all bands.
-        If self has attribute 'vrt' (a sub-VRT object, result of get_super_vrt) it's contents is
-        also copied into sub-VRT of the copy.
+        The sub-VRT object (self.vrt, result of get_super_vrt) is not copied but shared between
+        self and the copy: levels of the VRT history are never modified after a new level is
+        created on top of them. Therefore the cost of copy does not depend on the history depth.
         Other attributes of self, such as tps flag and band_vrts are also copied.
 
         """
@@ -864,20 +1216,20 @@ class VRT(object):
         else:
             new_vrt = VRT.copy_dataset(self.dataset, geolocation=self.geolocation,
                                                      metadata=self.dataset.GetMetadata())
-            replace_filenames = [(self.filename, new_vrt.filename)]
-            if self.vrt is not None:
-                # recursive copy of sub-VRT object
-                new_vrt.vrt = self.vrt.copy()
-                replace_filenames.append((self.vrt.filename, new_vrt.vrt.filename))
-
-            # change reference from original filenames to the new ones
-            for replace_filename in replace_filenames:
-                new_vrt_xml = new_vrt.xml.replace(os.path.basename(replace_filename[0]),
-                                          os.path.basename(replace_filename[1]))
-                new_vrt.write_xml(new_vrt_xml)
-
-            # copy VRTs of bands
+            # change reference from original filename to the new one (e.g. in pixel functions)
+            new_vrt_xml = new_vrt.xml
+            if os.path.basename(self.filename) in new_vrt_xml:
+                new_vrt.write_xml(new_vrt_xml.replace(os.path.basename(self.filename),
+                                                      os.path.basename(new_vrt.filename)))
+
+            # share sub-VRT and VRTs of bands
+            new_vrt.vrt = self.vrt
             new_vrt.band_vrts = dict(self.band_vrts)
+            # pixel functions of lazy bands are referred to from XML of the copy
+            new_vrt.lazy_functions = list(self.lazy_functions)
+            for band_vrt in self.band_vrts.values():
+                band_vrt._add_user(self)
+                band_vrt._add_user(new_vrt)
         # copy the thin spline transformation option
         new_vrt.tps = bool(self.tps)
 
@@ -890,9 +1242,20 @@ class VRT(object):
         Returns
         --------
         string : XMl Content which is read from the VSI file
+
+        Notes
+        -----
+        Inside begin_xml_edit() / commit_xml_edit() the pending (not yet written) XML is returned.
+        XML written by write_xml() is cached and returned without flushing and reading the file
+        until the dataset is accessed again.
+
         """
-        self.dataset.FlushCache()
-        return VRT.read_vsi(self.filename)
+        if self._xml_pending is not None:
+            return self._xml_pending
+        if self._xml_cache is None:
+            self._dataset.FlushCache()
+            return VRT.read_vsi(self.filename)
+        return self._xml_cache
 
     def create_bands(self, metadata_dict):
         """ Generic function called from the mappers to create bands
@@ -1021,9 +1384,54 @@ class VRT(object):
         dst['SourceBand'] = str(srcs[0]['SourceBand'])
         dst_raster_band = VRT._put_metadata(dst_raster_band, dst)
 
+        # metadata of other bands could have been changed directly (e.g. in mappers)
+        self.invalidate_band_index()
+
         # return name of the created band
         return dst['name']
 
+    @property
+    def band_index(self):
+        """Index of band metadata for fast search of bands
+
+        The index is built once and rebuilt if self.dataset is replaced
+        (e.g. by write_xml), if number of bands changes or after create_band.
+        Call invalidate_band_index() after modifying band metadata directly in
+        self.dataset.
+
+        Returns
+        --------
+        band_index : dict
+            'metadata' : band number -> dict with (unescaped) band metadata
+            'name', 'standard_name', 'wkv' : metadata value -> band number
+
+        """
+        dataset = self._dataset_readonly
+        if (self._band_index is None or
+                self._band_index['dataset'] is not dataset or
+                len(self._band_index['metadata']) != dataset.RasterCount):
+            band_index = {'dataset': dataset, 'metadata': {},
+                          'name': {}, 'standard_name': {}, 'wkv': {}}
+            for band_number in range(1, dataset.RasterCount + 1):
+                VRT._add_band_to_index(band_index, band_number, dataset.GetRasterBand(band_number))
+            self._band_index = band_index
+        return self._band_index
+
+    def invalidate_band_index(self):
+        """Force rebuilding of the band index (e.g. after changing band metadata)"""
+        self._band_index = None
+
+    @staticmethod
+    def _add_band_to_index(band_index, band_number, raster_band):
+        """Add metadata of the <raster_band> with number <band_number> to <band_index>"""
+        metadata = raster_band.GetMetadata()
+        for key in metadata:
+            metadata[key] = saxutils.unescape(metadata[key], {'&quot;': '"'})
+        band_index['metadata'][band_number] = metadata
+        for key in ['name', 'standard_name', 'wkv']:
+            if key in metadata:
+                band_index[key][metadata[key]] = band_number
+
     def write_xml(self, vsi_file_content=None):
         """Write XML content into a VRT dataset
 
@@ -1035,14 +1443,55 @@ class VRT(object):
         Notes
         ---------
         self.dataset
-            If XML content was written, self.dataset is re-opened
+            If XML content was written, self.dataset is re-opened. Inside begin_xml_edit() /
+            commit_xml_edit() the content is only kept in memory and written on commit.
 
         """
+        if self._xml_edit_depth > 0:
+            self._xml_pending = str(vsi_file_content)
+            return
         vsi_file = gdal.VSIFOpenL(self.filename, str('w'))
         gdal.VSIFWriteL(str(vsi_file_content), len(vsi_file_content), 1, vsi_file)
         gdal.VSIFCloseL(vsi_file)
         # re-open self.dataset with new content
         self.dataset = gdal.Open(self.filename)
+        self._xml_cache = str(vsi_file_content)
+        vsimem.set_size(self.filename, len(vsi_file_content))
+
+    def begin_xml_edit(self):
+        """Start batch of XML modifications
+
+        Until commit_xml_edit() is called, write_xml() keeps the new XML content in memory
+        and VRT.xml returns it. The VRT file is written and the dataset is re-opened only once,
+        on commit or when the dataset is accessed. Calls can be nested.
+
+        Examples
+        --------
+            >>> vrt.begin_xml_edit()
+            >>> vrt.write_xml(vrt.xml.replace('GCPTransformer', 'TPSTransformer'))
+            >>> vrt.write_xml(vrt.xml.replace('<BlockXSize>512', '<BlockXSize>1024'))
+            >>> vrt.commit_xml_edit()
+
+        """
+        self._xml_edit_depth += 1
+
+    def commit_xml_edit(self):
+        """Finish batch of XML modifications and write the VRT file (once)"""
+        if self._xml_edit_depth == 0:
+            raise ValueError('commit_xml_edit() is called without begin_xml_edit()')
+        self._xml_edit_depth -= 1
+        if self._xml_edit_depth == 0 and self._xml_pending is not None:
+            self._write_pending_xml()
+
+    def _write_pending_xml(self):
+        """Write XML content kept by write_xml() inside a batch of modifications"""
+        vsi_file_content = self._xml_pending
+        self._xml_pending = None
+        edit_depth, self._xml_edit_depth = self._xml_edit_depth, 0
+        try:
+            self.write_xml(vsi_file_content)
+        finally:
+            self._xml_edit_depth = edit_depth
 
     def export(self, filename):
         """Export VRT file as XML into given <filename>"""
@@ -1070,7 +1519,10 @@ class VRT(object):
                        skip_gcps=1,
                        block_size=None,
                        working_data_type=None,
-                       resize_only=False):
+                       resize_only=False,
+                       num_threads=None,
+                       warp_memory_mb=None,
+                       gcp_tolerance=None):
 
         """Create warped (reprojected) VRT object
 
@@ -1114,6 +1566,16 @@ class VRT(object):
             'Float32', 'Int16', etc.
         resize_only : bool
             Create warped_vrt which will be used for resizing only?
+        num_threads : int or str
+            Number of threads for warping (NUM_THREADS warp option), e.g. 4 or 'ALL_CPUS'.
+            If None, setting 'threads' of nansat.config.performance is used, or 'ALL_CPUS'.
+        warp_memory_mb : int
+            Memory limit for warping in MB (WarpMemoryLimit). If None, setting
+            'warp_memory_mb' of nansat.config.performance is used, or the GDAL default.
+        gcp_tolerance : float
+            If given, instead of all GCPs (or every [skip_gcps] GCP) only the smallest subset
+            of GCPs reproducing all GCPs within <gcp_tolerance> pixels is used
+            (see VRT.get_gcp_subset).
 
         Returns
         --------
@@ -1124,8 +1586,13 @@ class VRT(object):
         # VRT to be warped
         src_vrt = self.copy()
 
+        # use only GCPs needed to reach the tolerance
+        if gcp_tolerance is not None and len(dst_gcps) == 0 and not resize_only:
+            src_vrt.dataset.SetGCPs(self.get_gcp_subset(gcp_tolerance),
+                                    self.dataset.GetGCPProjection())
+
         # if destination GCPs are given: create and add fake GCPs to src
-        dst_wkt = src_vrt._set_fake_gcps(dst_srs, dst_gcps, skip_gcps)
+        dst_wkt = src_vrt._set_fake_gcps(dst_srs, dst_gcps, skip_gcps, gcp_tolerance)
 
         if resize_only:
             src_vrt._set_geotransform_for_resize()
@@ -1142,21 +1609,25 @@ class VRT(object):
         # create VRT object from Warped VRT GDAL Dataset
         warped_vrt = VRT.copy_dataset(warped_dataset)
 
+        # modify XML of the warped VRT and re-open the dataset only once
+        warped_vrt.begin_xml_edit()
+
         # set x/y size, geo_transform, block_size
         warped_vrt._update_warped_vrt_xml(x_size, y_size, geo_transform, block_size, working_data_type)
 
+        # set number of threads and memory limit for warping
+        if num_threads is None:
+            num_threads = config.get_setting('threads', 'ALL_CPUS')
+        if warp_memory_mb is None:
+            warp_memory_mb = config.get_setting('warp_memory_mb')
+        warped_vrt._set_warp_options(num_threads, warp_memory_mb)
+
         # apply thin-spline-transformation option
         if self.tps:
             warped_vrt.write_xml(warped_vrt.xml.replace('GCPTransformer', 'TPSTransformer'))
 
-        # if given, add dst GCPs
-        if len(dst_gcps) > 0:
-            warped_vrt.dataset.SetGCPs(dst_gcps, dst_srs)
-            warped_vrt._remove_geotransform()
-            warped_vrt.dataset.SetProjection(str(''))
-
-        # Copy self to warpedVRT
-        warped_vrt.vrt = self.copy()
+        # Keep reference to self in warpedVRT
+        warped_vrt.vrt = self
 
         # replace the reference from src_vrt to warped_vrt.vrt
         node0 = Node.create(str(warped_vrt.xml))
@@ -1164,6 +1635,14 @@ class VRT(object):
         node1.node('SourceDataset').value = '/vsimem/' + str(os.path.basename(warped_vrt.vrt.filename))
         warped_vrt.write_xml(node0.rawxml())
 
+        warped_vrt.commit_xml_edit()
+
+        # if given, add dst GCPs
+        if len(dst_gcps) > 0:
+            warped_vrt.dataset.SetGCPs(dst_gcps, dst_srs)
+            warped_vrt._remove_geotransform()
+            warped_vrt.dataset.SetProjection(str(''))
+
         return warped_vrt
 
     def copyproj(self, filename):
@@ -1211,8 +1690,10 @@ class VRT(object):
 
         """
         band_nums.sort(reverse=True)
+        self.begin_xml_edit()
         for i in band_nums:
             self.delete_band(i)
+        self.commit_xml_edit()
 
     def get_shifted_vrt(self, shift_degree):
         """ Roll data in bands westwards or eastwards
@@ -1323,22 +1804,22 @@ class VRT(object):
         """Create a new VRT object with a reference to the current object (self)
 
         Create a new VRT (super_vrt) with exactly the same structure (number of bands, raster size,
-        metadata) as the current object (self). Create a copy of the current object and add it as
-        an attribute of the new object (super_vrt.vrt). Bands in the new object will refer to the
-        same bands in the current object. Recursively copy all vrt attributes of the current
-        object (self.vrt.vrt.vrt...) into the new object (super_vrt.vrt.vrt.vrt.vrt...).
+        metadata) as the current object (self). Add the current object as an attribute of the new
+        object (super_vrt.vrt). Bands in the new object will refer to the same bands in the current
+        object. The history (self.vrt.vrt...) is shared and not copied, so the cost does not
+        depend on the history depth. The current object should not be modified afterwards.
 
 
         Returns
         -------
         super_vrt : VRT
-            a new VRT object with copy of self in super_vrt.vrt
+            a new VRT object with self in super_vrt.vrt
 
         """
-        # create new vrt that refers to a copy of self
+        # create new vrt that refers to self
         super_vrt = VRT.from_gdal_dataset(self.dataset, geolocation=self.geolocation,
                                                         metadata=self.dataset.GetMetadata())
-        super_vrt.vrt = self.copy()
+        super_vrt.vrt = self
         super_vrt.tps = self.tps
 
         # add bands to the new vrt
@@ -1353,6 +1834,274 @@ class VRT(object):
 
         return super_vrt
 
+    def get_compacted_vrt(self):
+        """Create VRT with the same bands but with sources folded through intermediate VRTs
+
+        Sources of the bands in self usually refer to bands of the sub-VRT (self.vrt) which refer
+        to bands of the next sub-VRT and so on. Each level adds resampling and a block cache to
+        every pixel read. If a source refers to a band of an in-memory VRT which has only one plain
+        source (no pixel function, scaling, LUT or nodata), the source is replaced by the source of
+        that band with combined SrcRect and DstRect. Consecutive crops, subsamplings and pass-through
+        levels created by get_super_vrt are folded this way into one source. If self is a warped
+        VRT, the source VRT of the warped VRT is compacted.
+
+        The history (self.vrt) is kept in the compacted VRT, so undo works as before.
+
+        Returns
+        -------
+        compact_vrt : VRT
+            a new VRT object with the same bands and shorter path to the data
+
+        """
+        compact_vrt = self.copy()
+        node0 = Node.create(str(compact_vrt.xml))
+        if node0.tag == 'VRTWarpedDataset':
+            if self.vrt is not None:
+                # compact the source VRT and refer to it from the warped VRT
+                compact_vrt.vrt = self.vrt.get_compacted_vrt()
+                node0.node('GDALWarpOptions').node('SourceDataset').value = compact_vrt.vrt.filename
+                compact_vrt.write_xml(node0.rawxml())
+        else:
+            nodes = {}
+            n_folded = 0
+            for band_node in node0.nodeList('VRTRasterBand'):
+                data_type = band_node.getAttribute('dataType')
+                if (band_node.attributes.get('subClass') == 'VRTDerivedRasterBand' and
+                        band_node.node('SourceTransferType')):
+                    data_type = band_node['SourceTransferType']
+                for source_node in band_node.children:
+                    if source_node.tag not in VRT.COMPACT_SOURCE_TYPES:
+                        continue
+                    while VRT._fold_source(source_node, data_type, nodes):
+                        n_folded += 1
+            if n_folded > 0:
+                compact_vrt.write_xml(node0.rawxml())
+            self.logger.debug('Compaction of %s: %d sources folded' % (self.filename, n_folded))
+        compact_vrt._compacted = True
+        return compact_vrt
+
+    @staticmethod
+    def _get_vrt_node(filename, nodes, warped=False):
+        """Return parsed XML of a VRT in memory or None if the file cannot be compacted
+
+        Parameters
+        ----------
+        filename : str
+            name of the VRT file
+        nodes : dict
+            cache of parsed files: {filename: Node or None}
+        warped : bool
+            also return node of VRTWarpedDataset?
+
+        """
+        if filename not in nodes:
+            node0 = None
+            if (filename.startswith('/vsimem/') and filename.endswith('.vrt') and
+                    gdal.VSIStatL(str(filename)) is not None):
+                node0 = Node.create(str(VRT.read_vsi(filename)))
+            nodes[filename] = node0
+        node0 = nodes[filename]
+        if node0 is not None and (node0.tag == 'VRTDataset' or warped):
+            return node0
+        return None
+
+    @staticmethod
+    def _is_plain_source(source_node):
+        """Check if source only copies pixels (no scaling, LUT, nodata, etc)"""
+        if [tag for tag in source_node.tagList() if tag not in VRT.COMPACT_SOURCE_TAGS]:
+            return False
+        for tag, identity_value in [('ScaleOffset', 0), ('ScaleRatio', 1), ('NODATA', 0)]:
+            value_node = source_node.node(tag)
+            if value_node and value_node.value and float(value_node.value) != identity_value:
+                return False
+        return not (source_node.node('LUT') and source_node['LUT'])
+
+    @staticmethod
+    def _get_plain_source(band_node):
+        """Return the only source of a band if the band only copies pixels from it, else None"""
+        if ('subClass' in band_node.attributes or
+                [tag for tag in band_node.tagList() if tag not in VRT.COMPACT_BAND_TAGS]):
+            return None
+        sources = band_node.nodeList('SimpleSource') + band_node.nodeList('ComplexSource')
+        if (len(sources) != 1 or not VRT._is_plain_source(sources[0]) or
+                sources[0].node('SourceFilename').attributes.get('relativeToVRT', '0') != '0'):
+            return None
+        return sources[0]
+
+    @staticmethod
+    def _get_rect(source_node, tag):
+        """Return SrcRect or DstRect of a source as list of floats [xOff, yOff, xSize, ySize]"""
+        rect_node = source_node.node(tag)
+        if not rect_node:
+            return None
+        return [float(rect_node.getAttribute(key)) for key in ['xOff', 'yOff', 'xSize', 'ySize']]
+
+    @staticmethod
+    def _is_translation(src_rect, dst_rect):
+        """Check if SrcRect and DstRect define shift by integer number of pixels"""
+        return (src_rect[2:] == dst_rect[2:] and
+                all([value == int(value) for value in src_rect + dst_rect]))
+
+    @staticmethod
+    def _fold_source(source_node, data_type, nodes):
+        """Replace source with the source of the referred band, if possible
+
+        Parameters
+        ----------
+        source_node : Node
+            SimpleSource, ComplexSource or AveragedSource of a band (modified in place)
+        data_type : str
+            data type in which the source is read
+        nodes : dict
+            cache of parsed files: {filename: Node or None}
+
+        Returns
+        -------
+        folded : bool
+            True if the source was replaced
+
+        """
+        filename_node = source_node.node('SourceFilename')
+        if not filename_node or filename_node.attributes.get('relativeToVRT', '0') != '0':
+            return False
+        sub_node = VRT._get_vrt_node(filename_node.value, nodes)
+        if sub_node is None:
+            return False
+        try:
+            band_number = int(source_node['SourceBand'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        band_nodes = [band_node for band_node in sub_node.nodeList('VRTRasterBand')
+                      if int(band_node.getAttribute('band')) == band_number]
+        if len(band_nodes) != 1 or band_nodes[0].getAttribute('dataType') != data_type:
+            return False
+        sub_source_node = VRT._get_plain_source(band_nodes[0])
+        if sub_source_node is None:
+            return False
+
+        src_rect = VRT._get_rect(source_node, 'SrcRect')
+        dst_rect = VRT._get_rect(source_node, 'DstRect')
+        sub_src_rect = VRT._get_rect(sub_source_node, 'SrcRect')
+        sub_dst_rect = VRT._get_rect(sub_source_node, 'DstRect')
+        if None in [src_rect, dst_rect, sub_src_rect, sub_dst_rect]:
+            return False
+        # resampling of only one level can be folded exactly
+        sub_is_translation = VRT._is_translation(sub_src_rect, sub_dst_rect)
+        if not sub_is_translation and not VRT._is_translation(src_rect, dst_rect):
+            return False
+
+        new_src_rect, new_dst_rect = [], []
+        for i in range(2):
+            # clip SrcRect of the source by DstRect of the sub-source (both in sub-VRT pixels)
+            start = max(src_rect[i], sub_dst_rect[i])
+            stop = min(src_rect[i] + src_rect[i + 2], sub_dst_rect[i] + sub_dst_rect[i + 2])
+            if stop <= start:
+                return False
+            dst_scale = dst_rect[i + 2] / src_rect[i + 2]
+            src_scale = sub_src_rect[i + 2] / sub_dst_rect[i + 2]
+            new_dst_rect.append((dst_rect[i] + (start - src_rect[i]) * dst_scale,
+                                 (stop - start) * dst_scale))
+            new_src_rect.append((sub_src_rect[i] + (start - sub_dst_rect[i]) * src_scale,
+                                 (stop - start) * src_scale))
+        clipped = [value for pair in new_dst_rect for value in pair] != [
+            dst_rect[0], dst_rect[2], dst_rect[1], dst_rect[3]]
+        if clipped and not VRT._is_plain_source(source_node):
+            # pixels outside the clipped rectangle would not be scaled or masked as before
+            return False
+
+        # replace reference to the sub-VRT with the sub-source
+        filename_node.value = sub_source_node['SourceFilename']
+        source_node.node('SourceBand').value = sub_source_node['SourceBand']
+        sub_properties_node = sub_source_node.node('SourceProperties')
+        if sub_properties_node:
+            if not source_node.replaceNode('SourceProperties', 0, sub_properties_node):
+                source_node += sub_properties_node
+        else:
+            source_node.delNode('SourceProperties')
+        if not sub_is_translation and 'resampling' in sub_source_node.attributes:
+            source_node.setAttribute('resampling', sub_source_node.getAttribute('resampling'))
+        for tag, rect in [('SrcRect', new_src_rect), ('DstRect', new_dst_rect)]:
+            rect_node = source_node.node(tag)
+            for key, value in zip(['xOff', 'xSize', 'yOff', 'ySize'],
+                                  [rect[0][0], rect[0][1], rect[1][0], rect[1][1]]):
+                rect_node.replaceAttribute(key, VRT._format_rect_value(value))
+        return True
+
+    @staticmethod
+    def _format_rect_value(value):
+        """Format offset or size for SrcRect or DstRect (integer if possible)"""
+        if value == int(value):
+            return str(int(value))
+        return repr(float(value))
+
+    def get_chain(self):
+        """Return list of VRT objects in the history: [self, self.vrt, self.vrt.vrt, ...]"""
+        chain = [self]
+        while chain[-1].vrt is not None:
+            chain.append(chain[-1].vrt)
+        return chain
+
+    def get_chain_info(self):
+        """Report depth of the VRT history and estimated cost of reading each level
+
+        Returns
+        -------
+        info : dict
+            'depth' : number of VRT objects in the history (self, self.vrt, ...),
+            'read_depth' : max number of VRT files read to get a pixel of any band of self,
+            'levels' : list with dict for each level (from self to the deepest VRT):
+                'filename', 'class', 'warped', 'bands',
+                'sources' : number of sources (RasterIO requests per block of all bands),
+                'resampled_sources' : number of sources with resampling (SrcRect != DstRect size)
+
+        """
+        nodes = {}
+        levels = []
+        for vrt in self.get_chain():
+            node0 = VRT._get_vrt_node(vrt.filename, nodes, warped=True)
+            level = {'filename': vrt.filename,
+                     'class': vrt.__class__.__name__,
+                     'warped': node0 is not None and node0.tag == 'VRTWarpedDataset',
+                     'bands': vrt.dataset.RasterCount,
+                     'sources': vrt.dataset.RasterCount,
+                     'resampled_sources': 0}
+            if node0 is not None and not level['warped']:
+                sources = [source_node for band_node in node0.nodeList('VRTRasterBand')
+                           for source_node in band_node.children
+                           if source_node.tag in VRT.COMPACT_SOURCE_TYPES]
+                level['sources'] = len(sources)
+                rects = [(VRT._get_rect(source_node, 'SrcRect'),
+                          VRT._get_rect(source_node, 'DstRect')) for source_node in sources]
+                level['resampled_sources'] = len([1 for src_rect, dst_rect in rects
+                                                  if src_rect and dst_rect and
+                                                  src_rect[2:] != dst_rect[2:]])
+            levels.append(level)
+
+        return {'depth': len(levels),
+                'read_depth': VRT._get_read_depth(self.filename, nodes, {}),
+                'levels': levels}
+
+    @staticmethod
+    def _get_read_depth(filename, nodes, depths):
+        """Return max number of VRT files in memory read to get a pixel from <filename>"""
+        if filename not in depths:
+            node0 = VRT._get_vrt_node(filename, nodes, warped=True)
+            if node0 is None:
+                depths[filename] = 0
+            else:
+                depths[filename] = 1
+                if node0.tag == 'VRTWarpedDataset':
+                    sub_filenames = [node0.node('GDALWarpOptions')['SourceDataset']]
+                else:
+                    sub_filenames = [source_node['SourceFilename']
+                                     for band_node in node0.nodeList('VRTRasterBand')
+                                     for source_node in band_node.children
+                                     if source_node.node('SourceFilename')]
+                for sub_filename in set(sub_filenames):
+                    depths[filename] = max(depths[filename],
+                                           1 + VRT._get_read_depth(sub_filename, nodes, depths))
+        return depths[filename]
+
     def get_subsampled_vrt(self, new_raster_x_size, new_raster_y_size, resample_alg):
         """Create VRT and replace step in the source"""
 
@@ -1389,12 +2138,18 @@ class VRT(object):
         return subsamp_vrt
 
     def transform_points(self, col_vector, row_vector, dst2src=0,
-                         dst_srs=NSR(), dst_ds=None, options=None):
+                         dst_srs=NSR(), dst_ds=None, options=None, workers=1):
         """Transform input pixel/line coordinates into lon/lat (or opposite)
 
+        If the dataset has only geotransform (no GCPs, geolocation arrays or RPCs), the affine
+        transformation is computed with NumPy and only the change of spatial reference (if
+        any) is done by OSR. Otherwise GDAL Transformer is used. Transformers are cached per
+        georeference of self and destination SRS. Large inputs are transformed in chunks of
+        TRANSFORM_CHUNK_SIZE points, optionally in several threads.
+
         Parameters
         -----------
-        col_vector, row_vector : lists
+        col_vector, row_vector : lists or numpy arrays
             X and Y coordinates with any coordinate system
         dst2src : 0 or 1
             1 for inverse transformation, 0 for forward transformation.
@@ -1405,16 +2160,28 @@ class VRT(object):
             It means transform ownPixLin <--> ownXY.
         option : string
             if 'METHOD=GEOLOC_ARRAY', specify here.
+        workers : int
+            number of threads transforming chunks of points
 
         Returns
         --------
         lon_vector, lat_vector : numpy arrays
-            X and Y coordinates in degree of lat/lon
+            X and Y coordinates in degree of lat/lon (same shape as inputs)
 
         """
+        col_vector = np.asarray(col_vector, dtype=np.float64)
+        row_vector = np.asarray(row_vector, dtype=np.float64)
+        shape = col_vector.shape
+        col_vector, row_vector = col_vector.ravel(), row_vector.ravel()
+
         # get source SRS (either Projection or GCPProjection or Metadata(GEOLOCATION)[SRS])
         src_wkt = self.get_projection()[0]
 
+        if dst_ds is None and options is None and self._has_affine_georeference():
+            x, y = self._transform_points_affine(col_vector, row_vector, dst2src, src_wkt,
+                                                 dst_srs, workers)
+            return x.reshape(shape), y.reshape(shape)
+
         # prepare options
         if options is None:
             options = ['SRC_SRS=' + src_wkt, 'DST_SRS=' + dst_srs.wkt]
@@ -1422,23 +2189,136 @@ class VRT(object):
             if self.tps and len(self.dataset.GetGCPs()) > 0:
                 options.append('METHOD=GCP_TPS')
 
-        # create transformer
-        transformer = gdal.Transformer(self.dataset, dst_ds, options)
+        def transform(transformer, x, y):
+            # transfrom coordinates (TransformPoints returns list of (X, Y, Z) tuples)
+            lonlat = np.array(transformer.TransformPoints(dst2src, np.column_stack([x, y]))[0])
+            # convert to Nx3 numpy array (keep second dimention to allow empty inputs)
+            lonlat.shape = int(lonlat.size/3), 3
+            return lonlat[:, 0], lonlat[:, 1]
+
+        if dst_ds is None:
+            get_transformers = self._get_cached_transformers(
+                ('gdal', tuple(options)), lambda: gdal.Transformer(self.dataset, None, options))
+        else:
+            get_transformers = lambda n: [gdal.Transformer(self.dataset, dst_ds, options)
+                                          for _ in range(n)]
+        x, y = VRT._transform_in_chunks(get_transformers, transform, col_vector, row_vector,
+                                        workers)
+        return x.reshape(shape), y.reshape(shape)
+
+    def _has_affine_georeference(self):
+        """Is georeference of the dataset defined by geotransform only?"""
+        return (self.dataset.GetGeoTransform() != (0., 1., 0., 0., 0., 1.) and
+                self.dataset.GetProjection() != '' and
+                len(self.dataset.GetGCPs()) == 0 and
+                (self.geolocation is None or len(self.geolocation.data) == 0) and
+                not self.dataset.GetMetadata(str('GEOLOCATION')) and
+                not self.dataset.GetMetadata(str('RPC')))
+
+    def _transform_points_affine(self, col_vector, row_vector, dst2src, src_wkt, dst_srs,
+                                 workers=1):
+        """Transform pixel/line into coordinates of dst_srs (or opposite) with geotransform"""
+        geo_transform = self.dataset.GetGeoTransform()
+        src_srs = NSR(src_wkt)
+        same_srs = bool(src_srs.IsSame(dst_srs))
+        if not same_srs:
+            def transform(transformer, x, y):
+                xyz = np.array(transformer.TransformPoints(np.column_stack([x, y])))
+                xyz.shape = int(xyz.size/3), 3
+                return xyz[:, 0], xyz[:, 1]
+
+            key = ('osr', dst2src, src_wkt, dst_srs.wkt)
+            if dst2src:
+                factory = lambda: VRT._get_coordinate_transformation(dst_srs, src_srs)
+            else:
+                factory = lambda: VRT._get_coordinate_transformation(src_srs, dst_srs)
+            get_transformers = self._get_cached_transformers(key, factory)
+
+        if dst2src:
+            if not same_srs:
+                col_vector, row_vector = VRT._transform_in_chunks(
+                    get_transformers, transform, col_vector, row_vector, workers)
+            inv_geo_transform = VRT._invert_geo_transform(geo_transform)
+            return VRT._apply_geo_transform(inv_geo_transform, col_vector, row_vector)
+
+        x, y = VRT._apply_geo_transform(geo_transform, col_vector, row_vector)
+        if same_srs:
+            return x, y
+        return VRT._transform_in_chunks(get_transformers, transform, x, y, workers)
 
-        # convert lists with X,Y coordinates to 2D numpy array
-        xy = np.array([col_vector, row_vector]).transpose()
+    @staticmethod
+    def _apply_geo_transform(geo_transform, x, y):
+        """Apply affine transformation with GDAL geotransform to X, Y coordinates"""
+        return (geo_transform[0] + x * geo_transform[1] + y * geo_transform[2],
+                geo_transform[3] + x * geo_transform[4] + y * geo_transform[5])
 
-        # transfrom coordinates (TransformPoints returns list of (X, Y, Z) tuples)
-        lonlat = transformer.TransformPoints(dst2src, xy)[0]
+    @staticmethod
+    def _invert_geo_transform(geo_transform):
+        """Return geotransform of the inverse affine transformation"""
+        x0, dx, rx, y0, ry, dy = geo_transform
+        det = dx * dy - rx * ry
+        if det == 0:
+            raise NansatProjectionError('Geotransform %s cannot be inverted' % str(geo_transform))
+        return ((rx * y0 - dy * x0) / det, dy / det, -rx / det,
+                (ry * x0 - dx * y0) / det, -ry / det, dx / det)
 
-        # convert to Nx3 numpy array (keep second dimention to allow empty inputs)
-        lonlat = np.array(lonlat)
-        lonlat.shape = int(lonlat.size/3), 3
+    @staticmethod
+    def _get_coordinate_transformation(src_srs, dst_srs):
+        """Create OSR CoordinateTransformation with traditional (lon/lat) axis order"""
+        src_srs, dst_srs = NSR(src_srs), NSR(dst_srs)
+        if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+            src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            dst_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        return osr.CoordinateTransformation(src_srs, dst_srs)
 
-        # convert to vectors with lon,lat values
-        lon_vector, lat_vector, _ = lonlat.T
+    def _get_cached_transformers(self, key, factory):
+        """Return function which returns list of <n> transformers cached on self
 
-        return lon_vector, lat_vector
+        Transformers are not thread-safe and each thread uses its own transformer. The cache
+        is reset if georeference of the dataset changes.
+
+        """
+        signature = self._get_georeference_signature()
+        if self._transformers is None or self._transformers[0] != signature:
+            self._transformers = (signature, {})
+        transformers = self._transformers[1].setdefault(key, [])
+
+        def get_transformers(n):
+            while len(transformers) < n:
+                transformers.append(factory())
+            return transformers[:n]
+        return get_transformers
+
+    @staticmethod
+    def _transform_in_chunks(get_transformers, transform, x, y, workers=1):
+        """Transform X, Y with <transform>(transformer, x, y) in chunks and threads"""
+        chunk_size = VRT.TRANSFORM_CHUNK_SIZE
+        n_chunks = max(1, int(np.ceil(x.size / float(chunk_size))))
+        workers = max(1, min(workers, n_chunks))
+        if n_chunks == 1:
+            return transform(get_transformers(1)[0], x, y)
+
+        x_out = np.empty(x.size, np.float64)
+        y_out = np.empty(y.size, np.float64)
+
+        def transform_chunks(args):
+            # each worker transforms every <workers>-th chunk with its own transformer
+            transformer, first_chunk = args
+            for i in range(first_chunk, n_chunks, workers):
+                chunk = slice(i * chunk_size, (i + 1) * chunk_size)
+                x_out[chunk], y_out[chunk] = transform(transformer, x[chunk], y[chunk])
+
+        tasks = list(zip(get_transformers(workers), range(workers)))
+        if workers == 1:
+            transform_chunks(tasks[0])
+        else:
+            pool = ThreadPool(workers)
+            try:
+                pool.map(transform_chunks, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        return x_out, y_out
 
     def get_projection(self):
         """Get projection (spatial reference system) of the dataset
@@ -1476,8 +2356,8 @@ class VRT(object):
         """ Resize VRT
 
         Create Warped VRT with modified RasterXSize, RasterYSize, GeoTransform.
-        The returned VRT object has a copy of its original source VRT in its
-        own vrt object (e.g. warpedVRT.vrt = originalVRT.copy()).
+        The returned VRT object has a reference to its original source VRT in its
+        own vrt object (e.g. warpedVRT.vrt = originalVRT).
 
         Parameters
         -----------
@@ -1726,6 +2606,8 @@ class VRT(object):
                        'PixelFunctionType=%s' % dst['PixelFunctionType']]
             if 'SourceTransferType' in dst:
                 options.append('SourceTransferType=%s' % dst['SourceTransferType'])
+            if 'PixelFunctionLanguage' in dst:
+                options.append('PixelFunctionLanguage=%s' % dst['PixelFunctionLanguage'])
         elif len(srcs) == 1 and srcs[0]['SourceBand'] == 0:
             # in case of VRTRawRasterBand
             options = ['subclass=VRTRawRasterBand',
@@ -1779,6 +2661,19 @@ class VRT(object):
 
         return gcps
 
+    @staticmethod
+    def _tie_points2gcps(lon, lat, pixel_offset, pixel_step, line_offset, line_step,
+                         n_gcps=100, **kwargs):
+        """Create list of about <n_gcps> GCPs from tie-point grids of longitude and latitude"""
+        gcp_size = np.sqrt(n_gcps)
+        step0 = max(1, int(np.ceil(lat.shape[0] / gcp_size)))
+        step1 = max(1, int(np.ceil(lat.shape[1] / gcp_size)))
+        rows = sorted(set(list(range(0, lat.shape[0], step0)) + [lat.shape[0] - 1]))
+        cols = sorted(set(list(range(0, lat.shape[1], step1)) + [lat.shape[1] - 1]))
+        return [gdal.GCP(float(lon[i0, i1]), float(lat[i0, i1]), 0,
+                         pixel_offset + i1 * pixel_step, line_offset + i0 * line_step)
+                for i0 in rows for i1 in cols]
+
     @staticmethod
     def _put_metadata(raster_band, metadata_dict):
         """ Put all metadata into a raster band
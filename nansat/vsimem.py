@@ -0,0 +1,291 @@
+# Name:         vsimem.py
+# Purpose:      Accounting of files created by Nansat in GDAL virtual memory
+# Authors:      Anton Korosov
+# Created:      16.10.2026
+# Copyright:    (c) NERSC 2011 - 2026
+# Licence:
+# This file is part of NANSAT.
+# NANSAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+# http://www.gnu.org/licenses/gpl-3.0.html
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+"""Process-wide registry of files created by Nansat in GDAL virtual memory (/vsimem)
+
+Each VRT object registers its VRT file and the RAW files with band data. The registry keeps
+size, owner, creation site and time of last use of each file and a memory budget (in bytes).
+Files of a VRT object are marked as used (see touch_owner) when Nansat reads data from it.
+The budget is set by the environment variable NANSAT_VSIMEM_BUDGET or by set_budget().
+If the budget is exceeded, new RAW files are written to temporary files on disk and the least
+recently used RAW files in memory are moved to disk.
+
+Examples
+--------
+    >>> from nansat import vsimem
+    >>> vsimem.set_budget(2 * 1024**3)   # 2 GB
+    >>> print(vsimem.report())
+    >>> vsimem.get_total_size()
+
+"""
+from __future__ import absolute_import, division
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from nansat.tools import add_logger, gdal
+
+BUDGET_ENV_VARIABLE = 'NANSAT_VSIMEM_BUDGET'
+VSIMEM_PREFIX = '/vsimem/'
+COPY_CHUNK_SIZE = 2**24
+
+_lock = threading.RLock()
+# registered files in the order of use (least recently used first)
+_files = OrderedDict()
+# names of registered files of each owner
+_owner_files = {}
+# total size in bytes of registered files in /vsimem
+_total_size = 0
+_budget = int(os.environ.get(BUDGET_ENV_VARIABLE, 0)) or None
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+_code_dirs = {}
+
+
+class _FileRecord(object):
+    """Information about a file created by Nansat"""
+    def __init__(self, filename, owner, kind, size=None):
+        self.filename = filename
+        self.owner_filename = owner.filename
+        self.owner = weakref.ref(owner)
+        self.kind = kind
+        self.size = size
+        # size counted in the total size of /vsimem
+        self.counted_size = (size or 0) if self.in_memory else 0
+        self.site = _get_creation_site()
+        self.created = time.time()
+        self.last_used = self.created
+
+    @property
+    def in_memory(self):
+        return self.filename.startswith(VSIMEM_PREFIX)
+
+    def get_size(self):
+        """Return size of the file (from the file system if not known)"""
+        if self.size is not None:
+            return self.size
+        stat = gdal.VSIStatL(str(self.filename))
+        if stat is None:
+            return 0
+        return stat.size
+
+
+def _get_creation_site():
+    """Return 'file:line in function' of the innermost call from outside of the Nansat core"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename not in _code_dirs:
+            _code_dirs[code.co_filename] = os.path.dirname(os.path.abspath(code.co_filename))
+        if _code_dirs[code.co_filename] != _package_dir:
+            return '%s:%d in %s' % (code.co_filename, frame.f_lineno, code.co_name)
+        frame = frame.f_back
+    return ''
+
+
+def set_budget(budget):
+    """Set memory budget in bytes for files in /vsimem (None - no limit)"""
+    global _budget
+    _budget = budget
+    enforce_budget()
+
+
+def get_budget():
+    """Return memory budget in bytes for files in /vsimem (None - no limit)"""
+    return _budget
+
+
+def register(filename, owner, kind='vrt', size=None):
+    """Register a file created by a VRT object
+
+    Parameters
+    ----------
+    filename : str
+        name of the file (in /vsimem or on disk)
+    owner : VRT
+        VRT object which deletes the file
+    kind : str
+        'vrt' for VRT file, 'raw' for file with band data
+    size : int
+        size of the file in bytes (if None, size is read from the file system when needed
+        and the file is not counted in the total size until set_size is called)
+
+    """
+    with _lock:
+        if filename in _files:
+            _remove_record(_files[filename])
+        _add_record(_FileRecord(filename, owner, kind, size))
+
+
+def _add_record(record):
+    """Add record to the registry and update the total size"""
+    global _total_size
+    _files[record.filename] = record
+    _owner_files.setdefault(record.owner_filename, set()).add(record.filename)
+    _total_size += record.counted_size
+
+
+def _remove_record(record):
+    """Remove record from the registry and update the total size"""
+    global _total_size
+    del _files[record.filename]
+    owner_files = _owner_files.get(record.owner_filename, set())
+    owner_files.discard(record.filename)
+    if not owner_files:
+        _owner_files.pop(record.owner_filename, None)
+    _total_size -= record.counted_size
+
+
+def set_size(filename, size):
+    """Set size in bytes of a registered file (e.g. after it was rewritten)"""
+    global _total_size
+    with _lock:
+        record = _files.get(filename)
+        if record is None:
+            return
+        record.size = size
+        if record.in_memory:
+            _total_size += size - record.counted_size
+            record.counted_size = size
+
+
+def unregister_owner(owner_filename):
+    """Remove all files of the VRT with <owner_filename> from the registry
+
+    Files in /vsimem are deleted by the owner. RAW files moved to disk are deleted here.
+
+    """
+    with _lock:
+        for filename in list(_owner_files.get(owner_filename, [])):
+            record = _files[filename]
+            _remove_record(record)
+            if not record.in_memory and record.kind == 'raw' and os.path.exists(record.filename):
+                os.remove(record.filename)
+
+
+def touch(filename):
+    """Mark file as recently used"""
+    with _lock:
+        if filename in _files:
+            record = _files.pop(filename)
+            record.last_used = time.time()
+            _files[filename] = record
+
+
+def touch_owner(owner_filename):
+    """Mark all files of the VRT with <owner_filename> as recently used"""
+    with _lock:
+        for filename in list(_owner_files.get(owner_filename, [])):
+            touch(filename)
+
+
+def get_files():
+    """Return list of dicts with information about registered files (least recently used first)
+
+    Returns
+    -------
+    files : list of dict
+        'filename', 'kind', 'size', 'in_memory', 'owner' (repr of the VRT object or None if
+        it does not exist), 'site' (where the file was created), 'created', 'last_used'
+
+    """
+    with _lock:
+        records = list(_files.values())
+    files = []
+    for record in records:
+        owner = record.owner()
+        files.append({'filename': record.filename,
+                      'kind': record.kind,
+                      'size': record.get_size(),
+                      'in_memory': record.in_memory,
+                      'owner': None if owner is None else '%s(%s)' % (owner.__class__.__name__,
+                                                                      record.owner_filename),
+                      'site': record.site,
+                      'created': record.created,
+                      'last_used': record.last_used})
+    return files
+
+
+def get_total_size():
+    """Return total size in bytes of registered files in /vsimem
+
+    The total is updated on registration, so checking the budget does not stat the files.
+    Files registered without size are counted after set_size is called.
+
+    """
+    return _total_size
+
+
+def is_over_budget(extra_size=0):
+    """Check if adding <extra_size> bytes to /vsimem would exceed the budget"""
+    budget = get_budget()
+    return budget is not None and get_total_size() + extra_size > budget
+
+
+def enforce_budget():
+    """Move least recently used RAW files from /vsimem to disk until the budget is met"""
+    with _lock:
+        if not is_over_budget():
+            return
+        for record in [record for record in _files.values()
+                       if record.kind == 'raw' and record.in_memory]:
+            _spill(record)
+            if not is_over_budget():
+                break
+
+
+def _spill(record):
+    """Move RAW file to disk and update the VRT file of the owner"""
+    owner = record.owner()
+    if owner is None or owner.dataset is None:
+        return
+    fd, disk_filename = tempfile.mkstemp(suffix='.raw')
+    os.close(fd)
+    vsimem_file = gdal.VSIFOpenL(str(record.filename), str('rb'))
+    disk_file = open(disk_filename, 'wb')
+    try:
+        while True:
+            chunk = gdal.VSIFReadL(1, COPY_CHUNK_SIZE, vsimem_file)
+            if not chunk:
+                break
+            disk_file.write(chunk)
+    finally:
+        disk_file.close()
+        gdal.VSIFCloseL(vsimem_file)
+    owner.write_xml(owner.xml.replace(record.filename, disk_filename))
+    gdal.Unlink(str(record.filename))
+    add_logger('Nansat').debug('%s moved to %s' % (record.filename, disk_filename))
+
+    _remove_record(record)
+    new_record = _FileRecord(disk_filename, owner, 'raw', record.size)
+    new_record.site = record.site
+    new_record.created = record.created
+    new_record.last_used = record.last_used
+    _add_record(new_record)
+
+
+def report():
+    """Return text table with registered files and their total size in /vsimem"""
+    lines = ['%-40s %-4s %12s %-6s %-50s %s' % ('filename', 'kind', 'size', 'memory',
+                                                'owner', 'created at')]
+    for info in get_files():
+        lines.append('%-40s %-4s %12d %-6s %-50s %s' % (info['filename'], info['kind'],
+                                                        info['size'], info['in_memory'],
+                                                        info['owner'], info['site']))
+    lines.append('Total size in /vsimem: %d bytes, budget: %s' % (get_total_size(), get_budget()))
+    return '\n'.join(lines)
@@ -0,0 +1,91 @@
+# ------------------------------------------------------------------------------
+# Name:         benchmark_node.py
+# Purpose:      Compare speed of XML parsing/writing by Node and by minidom
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+""" Micro-benchmark of the XML layer used for VRT manipulation
+
+Compares the round trip XML text -> Node -> XML text done by Node.create/rawxml
+with the round trip through xml.dom.minidom (the previous implementation of Node)
+for VRTs with different number of bands.
+
+Usage:
+    python -m nansat_integration_tests.benchmark_node [n_bands ...]
+
+"""
+from __future__ import absolute_import, print_function
+import re
+import sys
+import timeit
+import xml.dom.minidom as xdm
+
+from nansat.node import Node
+
+BAND_XML = '''
+  <VRTRasterBand dataType="Float32" band="%(band)d">
+    <Metadata>
+      <MDI key="name">band_%(band)d</MDI>
+      <MDI key="wkv">surface_backwards_scattering_coefficient_of_radar_wave</MDI>
+      <MDI key="SourceBand">%(band)d</MDI>
+      <MDI key="SourceFilename">/vsimem/source.vrt</MDI>
+    </Metadata>
+    <ComplexSource>
+      <SourceFilename relativeToVRT="0">/vsimem/source.vrt</SourceFilename>
+      <SourceBand>%(band)d</SourceBand>
+      <SourceProperties RasterXSize="5000" RasterYSize="5000" DataType="Float32"
+                        BlockXSize="128" BlockYSize="128" />
+      <SrcRect xOff="0" yOff="0" xSize="5000" ySize="5000" />
+      <DstRect xOff="0" yOff="0" xSize="5000" ySize="5000" />
+      <ScaleOffset>0</ScaleOffset>
+      <ScaleRatio>1</ScaleRatio>
+    </ComplexSource>
+  </VRTRasterBand>'''
+
+
+def make_vrt_xml(n_bands):
+    """ Create XML of a VRT with <n_bands> bands """
+    return ('<VRTDataset rasterXSize="5000" rasterYSize="5000">\n'
+            '  <SRS>GEOGCS["WGS 84",DATUM["WGS_1984"]]</SRS>\n'
+            '  <GeoTransform>0, 1, 0, 0, 0, -1</GeoTransform>' +
+            ''.join([BAND_XML % {'band': band} for band in range(1, n_bands + 1)]) +
+            '\n</VRTDataset>\n')
+
+
+def minidom_round_trip(xml):
+    """ Parse XML and write it back with minidom (previous implementation of Node) """
+    xml = re.sub(r'\s+', ' ', xml).replace('> ', '>').replace(' <', '<')
+    node0 = Node.create(xdm.parseString(str(xml)))
+    node0.node('SrcRect').replaceAttribute('xOff', '10')
+    return str(node0.dom().toxml())
+
+
+def node_round_trip(xml):
+    """ Parse XML and write it back with Node """
+    node0 = Node.create(xml)
+    node0.node('SrcRect').replaceAttribute('xOff', '10')
+    return node0.rawxml()
+
+
+def main(band_numbers):
+    print('%8s %14s %14s %8s' % ('n_bands', 'minidom, ms', 'Node, ms', 'speedup'))
+    for n_bands in band_numbers:
+        xml = make_vrt_xml(n_bands)
+        assert Node.create(minidom_round_trip(xml)).rawxml() == node_round_trip(xml)
+        number = max(1, 1000 // n_bands)
+        t_minidom = min(timeit.repeat(lambda: minidom_round_trip(xml),
+                                      number=number, repeat=3)) / number
+        t_node = min(timeit.repeat(lambda: node_round_trip(xml),
+                                   number=number, repeat=3)) / number
+        print('%8d %14.2f %14.2f %8.1f' % (n_bands, t_minidom * 1000, t_node * 1000,
+                                          t_minidom / t_node))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1, 10, 100, 500])
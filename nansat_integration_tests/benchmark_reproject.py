@@ -0,0 +1,87 @@
+# ------------------------------------------------------------------------------
+# Name:         benchmark_reproject.py
+# Purpose:      Measure scaling of Nansat.reproject with the number of threads
+#
+# Author:       Anton Korosov
+#
+# Created:      16.10.2026
+# Copyright:    (c) NERSC
+# Licence:      This file is part of NANSAT. You can redistribute it or modify
+#               under the terms of GNU General Public License, v.3
+#               http://www.gnu.org/licenses/gpl-3.0.html
+# ------------------------------------------------------------------------------
+""" Benchmark of multithreaded warping
+
+A synthetic swath with GCPs (or an input file) is reprojected onto a polar
+stereographic grid with 1, 2, 4, ... threads and the time of reading all
+reprojected bands is printed together with the speedup relative to one thread.
+
+Usage:
+    python -m nansat_integration_tests.benchmark_reproject [filename [resolution_m]]
+
+"""
+from __future__ import absolute_import, print_function, division
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from nansat import Nansat, Domain
+from nansat.tools import gdal
+
+DST_SRS = '+proj=stere +lat_0=90 +lon_0=0 +lat_ts=70 +datum=WGS84 +units=m'
+
+
+def make_swath(shape=(3000, 3000), n_bands=2):
+    """ Create Nansat with <n_bands> random bands and with geolocation and GCPs """
+    lon, lat = np.meshgrid(np.linspace(0, 10, shape[1]), np.linspace(75, 70, shape[0]))
+    n = Nansat.from_domain(Domain.from_lonlat(lon, lat))
+    for i in range(n_bands):
+        n.add_band(np.random.randn(*shape).astype(np.float32), {'name': 'band%d' % i})
+    return n
+
+
+def get_destination_domain(n, resolution):
+    """ Create polar stereographic Domain covering <n> with <resolution> in meters """
+    lon, lat = n.get_border()
+    return Domain(DST_SRS, '-lle %f %f %f %f -tr %f %f' % (lon.min(), lat.min(), lon.max(),
+                                                            lat.max(), resolution, resolution))
+
+
+def reproject(n, dst_domain, num_threads):
+    """ Reproject <n> and read all bands, return time in seconds """
+    t0 = time.time()
+    n.reproject(dst_domain, resample_alg=1, num_threads=num_threads, warp_memory_mb=512)
+    for i in range(n.vrt.dataset.RasterCount):
+        n.vrt.dataset.GetRasterBand(i + 1).ReadAsArray()
+    t1 = time.time()
+    n.undo()
+    return t1 - t0
+
+
+def main(filename=None, resolution=500.):
+    if filename is None:
+        n = make_swath()
+        resolution = 100.
+    else:
+        n = Nansat(filename)
+    dst_domain = get_destination_domain(n, resolution)
+    gdal.SetCacheMax(64 * 1024**2)
+
+    thread_numbers = [1]
+    while thread_numbers[-1] * 2 <= multiprocessing.cpu_count():
+        thread_numbers.append(thread_numbers[-1] * 2)
+
+    print('Reproject %s onto %s' % (n.shape(), dst_domain.shape()))
+    print('%8s %10s %8s' % ('threads', 'time, s', 'speedup'))
+    t_one = None
+    for num_threads in thread_numbers:
+        t = min([reproject(n, dst_domain, num_threads) for _ in range(3)])
+        t_one = t_one or t
+        print('%8d %10.2f %8.1f' % (num_threads, t, t_one / t))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(args[0] if args else None, float(args[1]) if len(args) > 1 else 500.)